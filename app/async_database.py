@@ -0,0 +1,78 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+import dotenv
+from database import DB_POOL_MAX_SIZE, DB_STREAM_MAX_CONNECTIONS
+dotenv.load_dotenv()
+
+T = TypeVar("T")
+
+# One worker per pooled connection, so offloaded work never queues inside the pool.
+# Setting this to 0 runs database work inline on the event loop (the old behaviour).
+DB_EXECUTOR_THREADS = int(os.getenv("DB_EXECUTOR_THREADS", DB_POOL_MAX_SIZE))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_stream_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the bounded thread pool used for blocking database calls"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_THREADS,
+                    thread_name_prefix="db"
+                )
+    return _executor
+
+def get_stream_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool for streamed query work, one thread per stream connection.
+
+    Streams hold their connection between fetches, so their calls must not wait
+    behind `run_db` work blocked in the pool on the connections they hold.
+    """
+    global _stream_executor
+    if _stream_executor is None:
+        with _executor_lock:
+            if _stream_executor is None:
+                _stream_executor = ThreadPoolExecutor(
+                    max_workers=DB_STREAM_MAX_CONNECTIONS,
+                    thread_name_prefix="db-stream"
+                )
+    return _stream_executor
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking database function without stalling the event loop.
+
+    `func` is called in the database thread pool and should open its own connection
+    with `get_db_connection()`; exceptions (including HTTPException) propagate to the caller.
+    """
+    if DB_EXECUTOR_THREADS <= 0:
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+async def run_stream(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Like `run_db`, for opening, reading and closing streamed queries"""
+    if DB_EXECUTOR_THREADS <= 0:
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_stream_executor(), functools.partial(func, *args, **kwargs))
+
+def shutdown_executor() -> None:
+    """Wait for in-flight database work and stop the thread pools"""
+    global _executor, _stream_executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+        if _stream_executor is not None:
+            _stream_executor.shutdown(wait=True)
+            _stream_executor = None
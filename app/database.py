@@ -1,9 +1,14 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
-from typing import Generator
+from typing import Generator, Callable, Dict, Any, Optional
 import os
 import dotenv
+from utils.rollups import create_rollups, enable_rollups
 dotenv.load_dotenv()
 
 DB_HOST = os.getenv("DB_HOST")
@@ -11,20 +16,287 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
-@contextmanager
-def get_db_connection() -> Generator[psycopg2.extensions.connection, None, None]:
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 3600))
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", 30))
+# Pooled connections that streamed queries may hold at once; the rest stay free for short requests
+DB_STREAM_MAX_CONNECTIONS = int(os.getenv("DB_STREAM_MAX_CONNECTIONS", max(1, DB_POOL_MAX_SIZE // 2)))
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Checkouts block (up to `timeout` seconds) when `max_size` connections are in use.
+    Connections that sat idle longer than `check_interval` are pinged before being
+    handed out, connections idle longer than `max_idle` are closed down to `min_size`,
+    and connections older than `max_lifetime` are replaced when returned.
+    """
+
+    def __init__(self, connect: Callable[[], Any], min_size: int = 1, max_size: int = 10,
+                 timeout: float = 30, max_idle: float = 300, max_lifetime: float = 3600,
+                 check_interval: float = 30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, returned_at), most recently returned on the right
+        self._created_at: Dict[int, float] = {}
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+        self._connections_created = 0
+        self._connections_recycled = 0
+        self._failed_health_checks = 0
+
+    def open(self) -> None:
+        """Pre-create connections up to min_size"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, self._created_at[id(conn)], time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        """Check a healthy connection out of the pool"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.pool.PoolError("connection pool is closed")
+                    self._recycle_idle_locked(time.monotonic())
+                    if self._idle:
+                        entry = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        self._in_use += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"Timed out after {self.timeout}s waiting for a database connection "
+                            f"(pool max_size={self.max_size})"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if entry is None:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    self._release_slot()
+                    raise
+            else:
+                conn, _, returned_at = entry
+                if not self._is_healthy(conn, time.monotonic() - returned_at):
+                    self._discard(conn)
+                    with self._cond:
+                        self._failed_health_checks += 1
+                    self._release_slot()
+                    continue
+
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                self._checkout_time_total += elapsed
+                self._checkout_time_max = max(self._checkout_time_max, elapsed)
+            return conn
+
+    def putconn(self, conn) -> None:
+        """Return a connection to the pool, rolling back any open transaction"""
+        reusable = not conn.closed
+        if reusable and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+
+        now = time.monotonic()
+        created_at = self._created_at.get(id(conn), now)
+        expired = reusable and now - created_at > self.max_lifetime
+        if expired:
+            reusable = False
+
+        with self._cond:
+            if expired:
+                self._connections_recycled += 1
+            self._in_use -= 1
+            if reusable and not self._closed:
+                self._idle.append((conn, created_at, now))
+                self._cond.notify()
+                return
+
+        self._discard(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Close all idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of pool usage and checkout latency"""
+        with self._cond:
+            self._recycle_idle_locked(time.monotonic())
+            avg_ms = (self._checkout_time_total / self._checkouts * 1000) if self._checkouts else 0.0
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "checkout_timeouts": self._timeouts,
+                "avg_checkout_ms": round(avg_ms, 3),
+                "max_checkout_ms": round(self._checkout_time_max * 1000, 3),
+                "connections_created": self._connections_created,
+                "connections_recycled": self._connections_recycled,
+                "failed_health_checks": self._failed_health_checks
+            }
+
+    def _new_connection(self):
+        conn = self._connect()
+        self._created_at[id(conn)] = time.monotonic()
+        with self._cond:
+            self._connections_created += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _recycle_idle_locked(self, now: float) -> None:
+        # Oldest-returned connections sit on the left of the deque
+        while self._idle and self._size > self.min_size:
+            conn, _, returned_at = self._idle[0]
+            if now - returned_at <= self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._connections_recycled += 1
+            self._discard(conn)
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._cond.notify()
+
+    def _discard(self, conn) -> None:
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _connect():
     conn = psycopg2.connect(
         host=DB_HOST,
         database=DB_NAME,
         user=DB_USER,
         password=DB_PASSWORD
     )
-
     conn.cursor_factory = psycopg2.extras.RealDictCursor
+    return conn
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    check_interval=DB_POOL_CHECK_INTERVAL
+                )
+    return _pool
+
+def close_pool() -> None:
+    """Close the process-wide connection pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def get_db_connection() -> Generator[psycopg2.extensions.connection, None, None]:
+    pool = get_pool()
+    conn = pool.getconn()
     try:
         yield conn
     finally:
-        conn.close()
+        pool.putconn(conn)
 
 def init_db():
     with get_db_connection() as conn:
@@ -65,5 +337,17 @@ def init_db():
             ON time_series_data (metric_id, time DESC)
         ''')
         
+        # Ids of spooled ingest batches already written, so replays are skipped
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_batches (
+                batch_id UUID PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        ''')
+        
+        # Continuous aggregates (1 minute / 1 hour / 1 day rollups) for aggregated queries
+        create_rollups(cursor)
+        enable_rollups(cursor)
+        
         conn.commit()
     print("Database initialized successfully!")
\ No newline at end of file
@@ -0,0 +1,205 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import psycopg2
+import psycopg2.pool
+from database import get_db_connection
+from utils.bulk_writer import Point, write_points, time_spans
+from utils.cache import cache_manager
+from utils.registry import metric_registry
+import dotenv
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Buffered (write-behind) ingest: accepted points wait in memory and a background
+# thread writes them with one COPY per flush, so many small requests share a commit.
+INGEST_BUFFER_ENABLED = os.getenv("INGEST_BUFFER_ENABLED", "false").lower() in ("1", "true", "yes")
+INGEST_BUFFER_MAX_POINTS = int(os.getenv("INGEST_BUFFER_MAX_POINTS", 100000))
+INGEST_FLUSH_POINTS = int(os.getenv("INGEST_FLUSH_POINTS", 10000))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 200))
+INGEST_SHUTDOWN_TIMEOUT = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT", 30))
+
+# Failures worth retrying; anything else means the batch itself was rejected
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+RETRY_MAX_DELAY = 5.0
+
+def write_rows(rows: Sequence[Point]) -> int:
+    """Write points in one transaction, then update the registry and drop overlapping cached windows"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            inserted_count, upserted = write_points(cursor, rows)
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    metric_registry.update(upserted)
+    cache_manager.invalidate_time_ranges(time_spans(rows))
+    return inserted_count
+
+class IngestBuffer:
+    """
+    Bounded in-process queue of points with a background group-commit flusher.
+
+    Points are flushed every `flush_interval` seconds or as soon as `flush_points`
+    are waiting. `offer()` refuses points once `max_points` (queued plus in flight)
+    would be exceeded, so callers can push back on clients instead of growing memory.
+    A batch the database rejects is split in halves, written ahead of newer points,
+    until only the rows that fail on their own are dropped.
+    """
+
+    def __init__(self, max_points: int = INGEST_BUFFER_MAX_POINTS, flush_points: int = INGEST_FLUSH_POINTS,
+                 flush_interval: float = INGEST_FLUSH_INTERVAL_MS / 1000,
+                 writer: Callable[[Sequence[Point]], int] = write_rows):
+        self.max_points = max_points
+        self.flush_points = flush_points
+        self.flush_interval = flush_interval
+        self._writer = writer
+        self._cond = threading.Condition()
+        self._points: List[Point] = []
+        # Halves of rejected batches, written one per flush before any newer points
+        self._pieces: List[List[Point]] = []
+        self._piece_points = 0
+        self._in_flight = 0
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._accepted = 0
+        self._rejected = 0
+        self._flushed = 0
+        self._flushes = 0
+        self._dropped = 0
+        self._splits = 0
+        self._retries = 0
+        self._last_flush_ms = 0.0
+        self._last_error: Optional[str] = None
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+            self._thread.start()
+
+    def offer(self, points: Sequence[Point]) -> bool:
+        """Queue points for the flusher; False (nothing queued) when the buffer is full or closing"""
+        with self._cond:
+            if self._closing or self._thread is None or \
+                    self._queued() + self._in_flight + len(points) > self.max_points:
+                self._rejected += len(points)
+                return False
+            self._points.extend(points)
+            self._accepted += len(points)
+            if len(self._points) >= self.flush_points:
+                self._cond.notify()
+            return True
+
+    def close(self, timeout: float = INGEST_SHUTDOWN_TIMEOUT) -> None:
+        """Stop accepting points and wait up to `timeout` seconds for the rest to be written"""
+        with self._cond:
+            thread = self._thread
+            self._closing = True
+            self._cond.notify()
+        if thread is None:
+            return
+        thread.join(timeout)
+        with self._cond:
+            if thread.is_alive():
+                logger.error(f"Ingest buffer not drained on shutdown: {self._queued() + self._in_flight} points lost")
+            self._thread = None
+
+    def _queued(self) -> int:
+        return len(self._points) + self._piece_points
+
+    def _next_batch(self) -> Optional[List[Point]]:
+        """Wait for a flush to be due and take its points; None once closed and empty"""
+        with self._cond:
+            if self._pieces:
+                batch = self._pieces.pop(0)
+                self._piece_points -= len(batch)
+                self._in_flight = len(batch)
+                return batch
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closing and len(self._points) < self.flush_points:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self._points:
+                return None if self._closing else []
+            batch, self._points = self._points[:self.flush_points], self._points[self.flush_points:]
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self) -> None:
+        delay = self.flush_interval
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                self._writer(batch)
+            except TRANSIENT_ERRORS as e:
+                # Put the batch back in front and retry with backoff; offer() keeps counting it
+                logger.warning(f"Ingest flush failed, retrying in {delay:.1f}s: {e}")
+                with self._cond:
+                    self._pieces.insert(0, batch)
+                    self._piece_points += len(batch)
+                    self._in_flight = 0
+                    self._retries += 1
+                    self._last_error = str(e)
+                    self._cond.wait(delay)
+                delay = min(RETRY_MAX_DELAY, delay * 2)
+                continue
+            except Exception as e:
+                with self._cond:
+                    self._in_flight = 0
+                    self._last_error = str(e)
+                    if len(batch) > 1:
+                        # Other clients' points share the batch; retry each half on its own
+                        middle = len(batch) // 2
+                        self._pieces[:0] = [batch[:middle], batch[middle:]]
+                        self._piece_points += len(batch)
+                        self._splits += 1
+                        continue
+                    self._dropped += 1
+                logger.error(f"Ingest flush rejected, dropping point {batch[0]}: {e}")
+                continue
+            delay = self.flush_interval
+            with self._cond:
+                self._in_flight = 0
+                self._flushed += len(batch)
+                self._flushes += 1
+                self._last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of buffer occupancy and flush activity"""
+        with self._cond:
+            return {
+                "enabled": self._thread is not None,
+                "max_points": self.max_points,
+                "flush_points": self.flush_points,
+                "flush_interval_ms": round(self.flush_interval * 1000),
+                "queued": self._queued(),
+                "in_flight": self._in_flight,
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "flushed": self._flushed,
+                "flushes": self._flushes,
+                "dropped": self._dropped,
+                "splits": self._splits,
+                "retries": self._retries,
+                "last_flush_ms": round(self._last_flush_ms, 3),
+                "last_error": self._last_error
+            }
+
+ingest_buffer = IngestBuffer()
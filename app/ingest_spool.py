@@ -0,0 +1,462 @@
+import os
+import json
+import mmap
+import fcntl
+import time
+import uuid
+import zlib
+import struct
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import psycopg2
+from database import get_db_connection
+from ingest_buffer import TRANSIENT_ERRORS, RETRY_MAX_DELAY, INGEST_FLUSH_POINTS
+from utils.bulk_writer import Point, write_points, time_spans
+from utils.cache import cache_manager
+from utils.codec import to_utc
+from utils.registry import metric_registry
+import dotenv
+dotenv.load_dotenv()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Write-ahead spool: accepted batches are appended to memory-mapped segment files on
+# local disk and acknowledged once synced, then a background drainer replays them into
+# the hypertable. A checkpoint file records how far the drainer got; every batch carries
+# an id recorded in ingest_batches in the same transaction, so batches replayed after a
+# crash between commit and checkpoint are skipped instead of written twice.
+INGEST_SPOOL_ENABLED = os.getenv("INGEST_SPOOL_ENABLED", "false").lower() in ("1", "true", "yes")
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "spool")
+INGEST_SPOOL_SEGMENT_BYTES = int(os.getenv("INGEST_SPOOL_SEGMENT_BYTES", 64 * 1024 * 1024))
+INGEST_SPOOL_MAX_BYTES = int(os.getenv("INGEST_SPOOL_MAX_BYTES", 1024 * 1024 * 1024))
+INGEST_SPOOL_DRAIN_INTERVAL_MS = int(os.getenv("INGEST_SPOOL_DRAIN_INTERVAL_MS", 200))
+# How long applied batch ids are kept for deduplication
+INGEST_SPOOL_BATCH_RETENTION = int(os.getenv("INGEST_SPOOL_BATCH_RETENTION", 86400))
+
+# Frame header: magic, payload length, payload CRC-32, accept time, point count, batch id.
+# The payload is written first and the header last, so a torn write never validates.
+HEADER = struct.Struct("<4sIIdI16s")
+MAGIC = b"TSP1"
+SEGMENT_SUFFIX = ".spool"
+CHECKPOINT_FILE = "checkpoint.json"
+# Held with an exclusive flock while a spool is open: one process per spool directory
+LOCK_FILE = "spool.lock"
+PRUNE_INTERVAL = 3600.0
+
+Batch = Tuple[uuid.UUID, List[Point]]
+
+def encode_points(points: Sequence[Point]) -> bytes:
+    rows = [[time.isoformat(), metric, value] for time, metric, value in points]
+    return orjson.dumps(rows) if orjson is not None else json.dumps(rows).encode()
+
+def decode_points(payload: bytes) -> List[Point]:
+    rows = orjson.loads(payload) if orjson is not None else json.loads(payload)
+    # Frames spooled before times were normalized may hold naive or offset times
+    return [(to_utc(datetime.fromisoformat(time)), metric, value) for time, metric, value in rows]
+
+def write_batches(batches: Sequence[Batch]) -> Tuple[int, int]:
+    """
+    Write spooled batches in one transaction, skipping ids that were already applied.
+
+    Returns (points written, batches skipped as duplicates).
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO ingest_batches (batch_id)
+                SELECT unnest(%s::uuid[])
+                ON CONFLICT (batch_id) DO NOTHING
+                RETURNING batch_id
+            ''', ([str(batch_id) for batch_id, _ in batches],))
+            fresh = {str(row['batch_id']) for row in cursor.fetchall()}
+            rows = [point for batch_id, points in batches if str(batch_id) in fresh for point in points]
+            inserted_count, upserted = write_points(cursor, rows)
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    metric_registry.update(upserted)
+    cache_manager.invalidate_time_ranges(time_spans(rows))
+    return inserted_count, len(batches) - len(fresh)
+
+def prune_batches(retention_seconds: int = INGEST_SPOOL_BATCH_RETENTION) -> None:
+    """Forget applied batch ids older than the retention period"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM ingest_batches WHERE applied_at < NOW() - %s * INTERVAL '1 second'",
+            (retention_seconds,)
+        )
+        conn.commit()
+
+def _fsync_directory(directory: str) -> None:
+    """Make created or removed segment files survive a crash (no-op where unsupported)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class Frame(NamedTuple):
+    batch_id: uuid.UUID
+    accepted_at: float
+    count: int
+    payload: bytes
+    end: int
+
+class SpoolLockedError(RuntimeError):
+    """Raised when another process already has the spool directory open"""
+
+class SpoolSegment:
+    """One preallocated, memory-mapped spool file; `end` is where the next frame goes"""
+
+    def __init__(self, path: str, seq: int, size: Optional[int] = None):
+        self.path = path
+        self.seq = seq
+        self._file = open(path, "w+b" if size is not None else "r+b")
+        if size is not None:
+            os.ftruncate(self._file.fileno(), size)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.map = mmap.mmap(self._file.fileno(), self.size)
+        self.end = 0
+        if size is None:
+            while True:
+                frame = self.read(self.end)
+                if frame is None:
+                    break
+                self.end = frame.end
+
+    def read(self, offset: int) -> Optional[Frame]:
+        """The valid frame at `offset`, or None at the end of the written data"""
+        if offset + HEADER.size > self.size:
+            return None
+        magic, length, crc, accepted_at, count, batch_id = HEADER.unpack_from(self.map, offset)
+        end = offset + HEADER.size + length
+        if magic != MAGIC or end > self.size:
+            return None
+        payload = self.map[offset + HEADER.size:end]
+        if zlib.crc32(payload) != crc:
+            return None
+        return Frame(uuid.UUID(bytes=batch_id), accepted_at, count, payload, end)
+
+    def fits(self, length: int) -> bool:
+        return self.end + HEADER.size + length <= self.size
+
+    def append(self, batch_id: uuid.UUID, accepted_at: float, count: int, payload: bytes) -> None:
+        """Write a frame at the end and sync it to disk"""
+        start = self.end
+        self.map[start + HEADER.size:start + HEADER.size + len(payload)] = payload
+        HEADER.pack_into(self.map, start, MAGIC, len(payload), zlib.crc32(payload),
+                         accepted_at, count, batch_id.bytes)
+        self.end = start + HEADER.size + len(payload)
+        # msync needs a page-aligned offset
+        aligned = start - start % mmap.ALLOCATIONGRANULARITY
+        self.map.flush(aligned, self.end - aligned)
+
+    def close(self) -> None:
+        self.map.close()
+        self._file.close()
+
+class IngestSpool:
+    """
+    Append-only on-disk queue of ingest batches with a background drainer.
+
+    `append()` returns once a batch is synced to disk, and refuses batches that
+    would grow the spool past `max_bytes`. The drainer writes up to `drain_points`
+    points per transaction and retries connection failures with backoff, so
+    batches accepted during a database outage are written once it is back.
+
+    A spool directory has a single writer: `start()` locks it and raises
+    SpoolLockedError while another process (or spool) holds it.
+    """
+
+    def __init__(self, directory: str = INGEST_SPOOL_DIR, segment_bytes: int = INGEST_SPOOL_SEGMENT_BYTES,
+                 max_bytes: int = INGEST_SPOOL_MAX_BYTES, drain_points: int = INGEST_FLUSH_POINTS,
+                 drain_interval: float = INGEST_SPOOL_DRAIN_INTERVAL_MS / 1000,
+                 writer: Callable[[Sequence[Batch]], Tuple[int, int]] = write_batches,
+                 pruner: Callable[[], None] = prune_batches):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.drain_points = drain_points
+        self.drain_interval = drain_interval
+        self._writer = writer
+        self._pruner = pruner
+        self._cond = threading.Condition()
+        self._segments: Dict[int, SpoolSegment] = {}
+        self._position: Tuple[int, int] = (0, 0)
+        # (accept time, points) of every batch not yet drained, oldest first
+        self._pending: Deque[Tuple[float, int]] = deque()
+        self._pending_points = 0
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+
+        self._appended = 0
+        self._appended_points = 0
+        self._rejected = 0
+        self._drained = 0
+        self._drained_points = 0
+        self._duplicates = 0
+        self._dropped = 0
+        self._retries = 0
+        self._last_drain_ms = 0.0
+        self._last_error: Optional[str] = None
+
+    def start(self) -> None:
+        """Lock the spool directory, recover the spool from disk and start the drainer"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._lock()
+            try:
+                self._recover()
+            except Exception:
+                self._unlock()
+                raise
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="ingest-spool-drainer", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 30) -> None:
+        """Stop the drainer after its current transaction; undrained batches stay on disk"""
+        with self._cond:
+            thread = self._thread
+            self._closing = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            if thread is not None and thread.is_alive():
+                logger.warning("Ingest spool drainer still running at shutdown")
+                return
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
+            self._thread = None
+            self._unlock()
+
+    def _lock(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise SpoolLockedError(
+                f"Ingest spool {self.directory} is in use by another process; "
+                "run a single worker or give each its own INGEST_SPOOL_DIR"
+            )
+        self._lock_file = lock_file
+
+    def _unlock(self) -> None:
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def append(self, points: Sequence[Point]) -> Optional[uuid.UUID]:
+        """Durably spool a batch; returns its id, or None when the spool is full or closed"""
+        payload = encode_points(points)
+        batch_id = uuid.uuid4()
+        accepted_at = time.time()
+        with self._cond:
+            if self._closing or self._thread is None:
+                self._rejected += 1
+                return None
+            active = self._segments[max(self._segments)]
+            if not active.fits(len(payload)):
+                size = max(self.segment_bytes, HEADER.size + len(payload))
+                if self._disk_bytes() + size > self.max_bytes:
+                    self._rejected += 1
+                    return None
+                active = self._new_segment(active.seq + 1, size)
+            active.append(batch_id, accepted_at, len(points), payload)
+            self._pending.append((accepted_at, len(points)))
+            self._pending_points += len(points)
+            self._appended += 1
+            self._appended_points += len(points)
+            if self._pending_points >= self.drain_points:
+                self._cond.notify()
+        return batch_id
+
+    def _disk_bytes(self) -> int:
+        return sum(segment.size for segment in self._segments.values())
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:016d}{SEGMENT_SUFFIX}")
+
+    def _new_segment(self, seq: int, size: int) -> SpoolSegment:
+        segment = SpoolSegment(self._segment_path(seq), seq, size)
+        self._segments[seq] = segment
+        _fsync_directory(self.directory)
+        return segment
+
+    def _recover(self) -> None:
+        """Open existing segments, drop drained ones and count what is still pending"""
+        checkpoint = os.path.join(self.directory, CHECKPOINT_FILE)
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                saved = json.load(f)
+            self._position = (saved["segment"], saved["offset"])
+
+        seqs = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX))
+        for seq in seqs:
+            if seq < self._position[0]:
+                os.remove(self._segment_path(seq))
+            else:
+                self._segments[seq] = SpoolSegment(self._segment_path(seq), seq)
+        if not self._segments:
+            self._new_segment(max(seqs + [self._position[0]]), self.segment_bytes)
+        if self._position[0] not in self._segments:
+            self._position = (min(self._segments), 0)
+
+        self._pending.clear()
+        self._pending_points = 0
+        seq, offset = self._position
+        for segment in self._segments.values():
+            offset = offset if segment.seq == seq else 0
+            while True:
+                frame = segment.read(offset)
+                if frame is None:
+                    break
+                self._pending.append((frame.accepted_at, frame.count))
+                self._pending_points += frame.count
+                offset = frame.end
+        if self._pending:
+            logger.info(f"Ingest spool recovered {len(self._pending)} undrained batches")
+
+    def _next_frames(self, max_points: int) -> Tuple[List[Frame], Tuple[int, int]]:
+        """Frames from the checkpoint on, until at least `max_points` points, and the position after them"""
+        frames: List[Frame] = []
+        points = 0
+        seq, offset = self._position
+        while points < max_points:
+            segment = self._segments[seq]
+            frame = segment.read(offset) if offset < segment.end else None
+            if frame is None:
+                later = [other for other in self._segments if other > seq]
+                if not later:
+                    break
+                seq, offset = min(later), 0
+                continue
+            frames.append(frame)
+            points += frame.count
+            offset = frame.end
+        return frames, (seq, offset)
+
+    def _save_checkpoint(self, position: Tuple[int, int]) -> None:
+        """Atomically record the drain position and delete fully drained segments"""
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": position[0], "offset": position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        with self._cond:
+            self._position = position
+            for seq in [seq for seq in self._segments if seq < position[0]]:
+                self._segments.pop(seq).close()
+                os.remove(self._segment_path(seq))
+        _fsync_directory(self.directory)
+
+    def _wait(self, seconds: float) -> None:
+        with self._cond:
+            if not self._closing:
+                self._cond.wait(seconds)
+
+    def _run(self) -> None:
+        delay = self.drain_interval
+        # Batches still to be drained one per transaction after a group was rejected
+        singles = 0
+        next_prune = time.monotonic()
+        while not self._closing:
+            with self._cond:
+                frames, position = self._next_frames(1 if singles else self.drain_points)
+            if not frames:
+                self._wait(self.drain_interval)
+                continue
+            # Decode outside the lock so appends are not held up
+            batches = [(frame.batch_id, decode_points(frame.payload)) for frame in frames]
+            started = time.perf_counter()
+            try:
+                _, duplicates = self._writer(batches)
+            except TRANSIENT_ERRORS as e:
+                logger.warning(f"Ingest spool drain failed, retrying in {delay:.1f}s: {e}")
+                with self._cond:
+                    self._retries += 1
+                    self._last_error = str(e)
+                self._wait(delay)
+                delay = min(RETRY_MAX_DELAY, delay * 2)
+                continue
+            except Exception as e:
+                if len(frames) > 1:
+                    singles = len(frames)
+                    continue
+                logger.error(f"Ingest spool batch {frames[0].batch_id} rejected, dropping {frames[0].count} points: {e}")
+                with self._cond:
+                    self._dropped += 1
+                    self._last_error = str(e)
+                duplicates = 0
+            singles = max(0, singles - 1)
+            delay = self.drain_interval
+
+            self._save_checkpoint(position)
+            with self._cond:
+                for _ in frames:
+                    _, count = self._pending.popleft()
+                    self._pending_points -= count
+                self._drained += len(frames)
+                self._drained_points += sum(frame.count for frame in frames)
+                self._duplicates += duplicates
+                self._last_drain_ms = (time.perf_counter() - started) * 1000
+
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+                try:
+                    self._pruner()
+                except Exception as e:
+                    logger.warning(f"Pruning applied ingest batch ids failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of spool size, drain lag and activity"""
+        with self._cond:
+            lag = time.time() - self._pending[0][0] if self._pending else 0.0
+            return {
+                "enabled": self._thread is not None,
+                "directory": self.directory,
+                "segments": len(self._segments),
+                "disk_bytes": self._disk_bytes(),
+                "max_bytes": self.max_bytes,
+                "pending_batches": len(self._pending),
+                "pending_points": self._pending_points,
+                "lag_seconds": round(max(0.0, lag), 3),
+                "appended_batches": self._appended,
+                "appended_points": self._appended_points,
+                "rejected_batches": self._rejected,
+                "drained_batches": self._drained,
+                "drained_points": self._drained_points,
+                "duplicate_batches": self._duplicates,
+                "dropped_batches": self._dropped,
+                "retries": self._retries,
+                "last_drain_ms": round(self._last_drain_ms, 3),
+                "last_error": self._last_error
+            }
+
+ingest_spool = IngestSpool()
@@ -16,18 +16,39 @@ limiter = Limiter(
     storage_uri=f"redis://{os.getenv('REDIS_HOST')}:6379"
 )
 
-from database import init_db
+from database import init_db, get_pool, close_pool, get_db_connection
+from async_database import shutdown_executor
+from ingest_buffer import ingest_buffer, INGEST_BUFFER_ENABLED
+from ingest_spool import ingest_spool, INGEST_SPOOL_ENABLED
 from utils.cache import cache_manager
+from utils.registry import metric_registry
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database on startup"""
+    """
+    Initialize database and metric registry on startup, release pooled connections on shutdown.
+
+    Buffered ingest is flushed before the pool closes; spooled ingest stays on disk
+    and is replayed on the next start.
+    """
+    get_pool().open()
     init_db()
+    with get_db_connection() as conn:
+        warmed = metric_registry.warm(conn.cursor())
+    print(f"Metric registry warmed with {warmed} metrics")
     if cache_manager.is_connected():
         print("Redis cache connected successfully!")
     else:
         print("Redis cache NOT connected - running without caching")
+    if INGEST_BUFFER_ENABLED:
+        ingest_buffer.start()
+    if INGEST_SPOOL_ENABLED:
+        ingest_spool.start()
     yield
+    ingest_spool.close()
+    ingest_buffer.close()
+    shutdown_executor()
+    close_pool()
 
 app = FastAPI(
     title="Super-Simple Timeseries API",
@@ -45,12 +66,14 @@ from routes.ingest import router as ingest_router
 from routes.query import router as query_router
 from routes.metrics import router as metrics_router
 from routes.cache import router as cache_router
+from routes.pool import router as pool_router
 
 
 app.include_router(ingest_router)
 app.include_router(query_router)
 app.include_router(metrics_router)
 app.include_router(cache_router)
+app.include_router(pool_router)
 
 @app.get("/")
 async def root() -> Dict[str, str]:
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Union, List, Optional
+from typing import Union, List, Optional, Dict
 from enum import Enum
 
 class AggregationFunction(str, Enum):
@@ -9,14 +9,44 @@ class AggregationFunction(str, Enum):
     MIN = "min"
     MAX = "max"
     COUNT = "count"
+    P50 = "p50"
+    P90 = "p90"
+    P95 = "p95"
+    P99 = "p99"
+    STDDEV = "stddev"
+    VARIANCE = "variance"
+    FIRST = "first"
+    LAST = "last"
+    DELTA = "delta"
+    RATE = "rate"
+
+class DownsampleMethod(str, Enum):
+    LTTB = "lttb"
+    MINMAX = "minmax"
+
+class FillMode(str, Enum):
+    NULL = "null"
+    PREVIOUS = "previous"
+    LINEAR = "linear"
+    CONSTANT = "constant"
+
+class BatchFormat(str, Enum):
+    GROUPED = "grouped"
+    WIDE = "wide"
 
 class DataPoint(BaseModel):
     time: datetime
     metric: str
     value: Union[float, str]
 
+class WideRow(BaseModel):
+    time: datetime
+    tags: Optional[Dict[str, str]] = None
+    fields: Dict[str, Union[float, str]]
+
 class IngestRequest(BaseModel):
-    data: List[DataPoint]
+    data: List[DataPoint] = []
+    rows: List[WideRow] = []
 
 class QueryRequest(BaseModel):
     metric: str
@@ -24,6 +54,20 @@ class QueryRequest(BaseModel):
     end_time: datetime
     aggregation: Optional[AggregationFunction] = None
     interval: Optional[str] = None
+    stream: bool = False
+    max_points: Optional[int] = None
+    downsample: Optional[DownsampleMethod] = None
+    fill: Optional[FillMode] = None
+    fill_value: Optional[float] = None
+
+class BatchQueryRequest(BaseModel):
+    metrics: Optional[List[str]] = None
+    pattern: Optional[str] = None
+    start_time: datetime
+    end_time: datetime
+    aggregation: Optional[AggregationFunction] = None
+    interval: Optional[str] = None
+    format: BatchFormat = BatchFormat.GROUPED
 
 class MetricInfo(BaseModel):
     name: str
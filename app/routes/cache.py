@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Query
 from typing import Dict, Any
 from utils.cache import cache_manager
 from main import limiter 
@@ -24,10 +24,31 @@ async def get_cache_info(request: Request) -> Dict[str, Any]:
 async def clear_cache(request: Request) -> Dict[str, str]:
     """
     Clear all cache
-    This will remove all cached query results.
+    
+    Starts a background job that removes all cached query results with
+    incremental SCAN and batched UNLINK. Poll `status_url` for progress.
+    If a clear is already running, that job is returned instead.
     """
-    cache_manager.clear_cache()
-    return {"message": "Cache cleared successfully"}
+    job = cache_manager.start_clear_job()
+    return {
+        "message": "Cache clear started; cached keys are being cleared in the background",
+        "job_id": job["job_id"],
+        "status_url": f"/cache/clear/{job['job_id']}"
+    }
+
+@router.get("/clear/{job_id}")
+@limiter.limit("60/minute")
+async def get_clear_job(request: Request, job_id: str) -> Dict[str, Any]:
+    """
+    Get the progress of a cache clear job
+    
+    Returns the job status (running, completed or failed) and the number
+    of keys scanned and deleted so far.
+    """
+    job = cache_manager.get_clear_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Clear job '{job_id}' not found")
+    return job
 
 @router.post("/metrics/{metric}/clear")
 async def clear_metric_cache(request: Request,metric: str) -> Dict[str, str]:
@@ -41,22 +62,28 @@ async def clear_metric_cache(request: Request,metric: str) -> Dict[str, str]:
 
 @router.get("/keys")
 @limiter.limit("30/minute") 
-async def list_cache_keys(request: Request) -> Dict[str, Any]:
+async def list_cache_keys(
+    request: Request,
+    cursor: int = Query(0, ge=0, description="Cursor returned by the previous page; 0 starts a new scan"),
+    count: int = Query(100, ge=1, le=1000, description="Approximate number of keys to examine per page")
+) -> Dict[str, Any]:
     """
-    List all cache keys matching the timeseries pattern
+    List cache keys one page at a time
     
-    Returns all keys matching the timeseries pattern.
+    Uses incremental SCAN over keys with the timeseries prefix. Pass the
+    returned `cursor` to fetch the next page; `complete` is true once the
+    returned cursor is 0.
     """
     if not cache_manager.is_connected():
         raise HTTPException(status_code=503, detail="Redis not connected")
     
     try:
-        pattern = "ts:*"
-        keys = cache_manager.redis_client.keys(pattern)
+        next_cursor, keys = cache_manager.scan_keys(cursor, count)
         return {
+            "cursor": next_cursor,
+            "complete": next_cursor == 0,
             "count": len(keys),
             "keys": keys
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing keys: {str(e)}")
-    
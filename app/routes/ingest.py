@@ -1,15 +1,33 @@
-from fastapi import APIRouter, HTTPException, Request 
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Request, Response
+from typing import Dict, Any, List, Callable, Optional
+from datetime import datetime, timezone
+import asyncio
 import psycopg2
 from models import IngestRequest
-from database import get_db_connection
+from utils.bulk_writer import Point
+from utils.codec import to_utc
+from utils.validators import validate_batch
+from utils.ingest_formats import (
+    ParseError, LineChunker, CsvParser, chunk_lines, parse_line_protocol, parse_ndjson,
+    expand_rows, PRECISIONS, INGEST_STREAM_CHUNK_BYTES, INGEST_STREAM_MAX_LINE_BYTES
+)
+from ingest_buffer import ingest_buffer, write_rows, INGEST_BUFFER_ENABLED
+from ingest_spool import ingest_spool, INGEST_SPOOL_ENABLED
+from async_database import run_db
 from main import limiter  
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
+# Per-point errors listed in a response; the count always covers all of them
+MAX_REPORTED_ERRORS = 100
+
+def _error_list(errors: Dict[int, str]) -> List[Dict[str, Any]]:
+    return [{"index": index, "error": error} for index, error in list(errors.items())[:MAX_REPORTED_ERRORS]]
+
 @router.post("")
 @limiter.limit("50/minute")  
-async def ingest_data(request: Request, ingest_request: IngestRequest) -> Dict[str, Any]:
+async def ingest_data(request: Request, response: Response, ingest_request: IngestRequest,
+                      sync: bool = False, partial: bool = False) -> Dict[str, Any]:
     """
     Ingest time-series data points
     
@@ -30,48 +48,247 @@ async def ingest_data(request: Request, ingest_request: IngestRequest) -> Dict[s
         }
       ]
     }
+    
+    Samples sharing a timestamp can be sent as wide rows instead, expanded to one
+    point per field; tags are folded into the metric name (`temperature{device=a1}`):
+    {
+      "rows": [
+        {
+          "time": "2024-01-15T10:30:00Z",
+          "tags": {"device": "a1"},
+          "fields": {"temperature": 23.5, "humidity": 61.0, "status": "ok"}
+        }
+      ]
+    }
+    
+    With INGEST_SPOOL_ENABLED, points are written to the local disk spool and
+    replayed into the database in the background, surviving database outages and
+    restarts. With INGEST_BUFFER_ENABLED, they are queued in memory for a background
+    flusher. Either way the response is 202 once they are accepted, and 503 (retry
+    later) while the spool or buffer is full. Send `?sync=true` to write before
+    responding, for callers that read their own writes.
+    
+    The batch is validated as a whole (timestamp bounds, metric names, finite
+    numbers, one value type per metric) and rejected with 400 listing the failing
+    point indices: `data` first, then every field of `rows` in order. With
+    `?partial=true` the valid points are ingested and the failures are reported
+    in `rejected_count` and `errors`.
     """
-    inserted_count = 0
+    # Points leave here in UTC: the writer, metric registry and cache all compare aware times
+    rows = [(to_utc(point.time), point.metric, point.value) for point in ingest_request.data]
+    rows.extend(expand_rows(ingest_request.rows))
     
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        for point in ingest_request.data:
-            value_type = 'string' if isinstance(point.value, str) else 'number'
-            
-            try:
-                cursor.execute('''
-                    INSERT INTO metrics (name, value_type, last_seen) 
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (name) DO UPDATE SET
-                        value_type = EXCLUDED.value_type,
-                        last_seen = GREATEST(metrics.last_seen, EXCLUDED.last_seen)
-                    RETURNING id;
-                ''', (point.metric, value_type, point.time))
-                
-                metric_id = cursor.fetchone()['id']
-                
-                if value_type == 'number':
-                    cursor.execute('''
-                        INSERT INTO time_series_data (time, metric_id, value)
-                        VALUES (%s, %s, %s)
-                    ''', (point.time, metric_id, point.value))
-                else:
-                    cursor.execute('''
-                        INSERT INTO time_series_data (time, metric_id, text_value)
-                        VALUES (%s, %s, %s)
-                    ''', (point.time, metric_id, point.value))
-                
-                inserted_count += 1
-                
-            except psycopg2.Error as e:
-                print(f"Database error: {e}")
-                conn.rollback()
-                raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-        
-        conn.commit()
+    try:
+        errors = await run_db(validate_batch, rows)
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    rejected: Dict[str, Any] = {}
+    if errors:
+        if not partial or len(errors) == len(rows):
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "message": f"{len(errors)} of {len(rows)} data points are invalid",
+                    "errors": _error_list(errors)
+                }
+            )
+        rows = [row for index, row in enumerate(rows) if index not in errors]
+        rejected = {"rejected_count": len(errors), "errors": _error_list(errors)}
+    
+    if INGEST_SPOOL_ENABLED and not sync:
+        batch_id = await run_db(ingest_spool.append, rows)
+        if batch_id is None:
+            raise HTTPException(
+                status_code=503,
+                detail="Ingest spool is full, retry later",
+                headers={"Retry-After": str(max(1, round(ingest_spool.drain_interval)))}
+            )
+        response.status_code = 202
+        return {
+            "message": f"Accepted {len(rows)} data points for writing",
+            "accepted_count": len(rows),
+            "batch_id": str(batch_id),
+            **rejected
+        }
+    
+    if INGEST_BUFFER_ENABLED and not sync:
+        if not ingest_buffer.offer(rows):
+            raise HTTPException(
+                status_code=503,
+                detail="Ingest buffer is full, retry later",
+                headers={"Retry-After": str(max(1, round(ingest_buffer.flush_interval)))}
+            )
+        response.status_code = 202
+        return {
+            "message": f"Accepted {len(rows)} data points for writing",
+            "accepted_count": len(rows),
+            **rejected
+        }
+    
+    inserted_count = await run_db(_insert_points, rows)
     
     return {
         "message": f"Successfully ingested {inserted_count} data points",
-        "ingested_count": inserted_count
-    }
\ No newline at end of file
+        "ingested_count": inserted_count,
+        **rejected
+    }
+
+@router.get("/buffer")
+@limiter.limit("60/minute")
+async def get_buffer_stats(request: Request) -> Dict[str, Any]:
+    """
+    Get buffered ingest statistics
+
+    Returns queue occupancy and bounds, points accepted, rejected (buffer full),
+    flushed and dropped (rejected by the database), and the last flush time.
+    """
+    return ingest_buffer.get_stats()
+
+@router.post("/line")
+@limiter.limit("50/minute")
+async def ingest_line_protocol(request: Request, precision: str = "ns") -> Dict[str, Any]:
+    """
+    Ingest Influx line protocol, streamed
+
+    Rate Limited: 50 requests per minute per IP address
+
+    Each line is `measurement[,tag=value...] field=value[,...] [timestamp]`; every field
+    is stored as the metric `measurement.field` (`measurement` for a field named
+    `value`) with the tags appended, e.g. `weather.temp{city=nairobi}`. Timestamps
+    are integers in `precision` units (ns, us, ms or s); lines without one use the
+    request time.
+
+    Example body:
+    weather,city=nairobi temp=23.5,humidity=61i 1705314600000000000
+    """
+    if precision not in PRECISIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid precision. Must be one of: {', '.join(PRECISIONS)}")
+    received = datetime.now(timezone.utc)
+
+    def parse(lines: List[str], first_line: int) -> List[Point]:
+        return parse_line_protocol(lines, first_line, precision, received)
+
+    return await _ingest_stream(request, parse)
+
+@router.post("/ndjson")
+@limiter.limit("50/minute")
+async def ingest_ndjson(request: Request) -> Dict[str, Any]:
+    """
+    Ingest newline-delimited JSON, streamed
+
+    Rate Limited: 50 requests per minute per IP address
+
+    One data point per line, in the shape of POST /ingest items:
+    {"time": "2024-01-15T10:30:00Z", "metric": "temperature", "value": 23.5}
+    """
+    return await _ingest_stream(request, parse_ndjson)
+
+@router.post("/csv")
+@limiter.limit("50/minute")
+async def ingest_csv(request: Request) -> Dict[str, Any]:
+    """
+    Ingest CSV, streamed
+
+    Rate Limited: 50 requests per minute per IP address
+
+    The header row names a `time` or `ts` column (ISO 8601 or epoch seconds). With
+    `metric` and `value` columns each row is one point; otherwise every other column
+    is a metric, as in the IoT telemetry file (ts,device,co,humidity,...). Empty
+    cells are skipped, true/false become 1/0.
+    """
+    return await _ingest_stream(request, CsvParser())
+
+async def _ingest_stream(request: Request, parse: Callable[[List[str], int], List[Point]]) -> Dict[str, Any]:
+    """
+    Parse and write a request body chunk by chunk.
+
+    Each chunk of about INGEST_STREAM_CHUNK_BYTES is parsed and written in its own
+    transaction in the database thread pool while the next one is read, so memory
+    stays constant whatever the upload size. Chunks written before a parse error
+    stay written; the error reports how many points they held.
+    """
+    chunker = LineChunker(INGEST_STREAM_CHUNK_BYTES, INGEST_STREAM_MAX_LINE_BYTES)
+    ingested_count = 0
+    pending: Optional[asyncio.Future] = None
+    try:
+        async for data in request.stream():
+            for chunk in chunker.feed(data):
+                if pending is not None:
+                    # Clear it first so a failed write is never awaited again below
+                    written, pending = pending, None
+                    ingested_count += await written
+                pending = asyncio.ensure_future(run_db(_write_chunk, parse, *chunk))
+        chunk = chunker.finish()
+        if pending is not None:
+            written, pending = pending, None
+            ingested_count += await written
+        if chunk is not None:
+            ingested_count += await run_db(_write_chunk, parse, *chunk)
+    except ParseError as e:
+        if pending is not None:
+            # The chunk in flight precedes the one that failed to split; an error in it comes first
+            try:
+                ingested_count += await pending
+            except ParseError as earlier:
+                e = earlier
+        raise HTTPException(
+            status_code=400,
+            detail=f"{e} ({ingested_count} data points before it were ingested)"
+        )
+
+    return {
+        "message": f"Successfully ingested {ingested_count} data points",
+        "ingested_count": ingested_count
+    }
+
+def _write_chunk(parse: Callable[[List[str], int], List[Point]], first_line: int, chunk: bytes) -> int:
+    """
+    Parse one chunk of body lines, validate it as a batch and write its points.
+
+    Runs in the database thread pool. An invalid point fails the chunk with a
+    ParseError naming its line, so nothing of the chunk is written.
+    """
+    lines = chunk_lines(chunk, first_line)
+    points = parse(lines, first_line)
+    try:
+        errors = validate_batch(points)
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    if errors:
+        index, message = next(iter(errors.items()))
+        raise ParseError(_line_of_point(parse, lines, first_line, index), message)
+    return _insert_points(points) if points else 0
+
+def _line_of_point(parse: Callable[[List[str], int], List[Point]], lines: List[str], first_line: int,
+                   index: int) -> int:
+    """The line of a chunk that produced its point `index`, found by parsing line by line"""
+    produced = 0
+    for number, line in enumerate(lines, start=first_line):
+        try:
+            produced += len(parse([line], number))
+        except ParseError:
+            # The chunk parsed as a whole, so only a CSV header line gets here
+            continue
+        if produced > index:
+            return number
+    return first_line
+
+@router.get("/spool")
+@limiter.limit("60/minute")
+async def get_spool_stats(request: Request) -> Dict[str, Any]:
+    """
+    Get ingest spool statistics
+
+    Returns disk usage against the bound, batches and points waiting to be written,
+    the age of the oldest one (lag), and drain activity including batches skipped
+    as already written.
+    """
+    return ingest_spool.get_stats()
+
+def _insert_points(rows: List[Point]) -> int:
+    """Bulk-insert data points in a single transaction; runs in the database thread pool"""
+    try:
+        return write_rows(rows)
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Request, HTTPException
 from typing import List
 from models import MetricInfo
 from database import get_db_connection
+from async_database import run_db
 from main import limiter
 import psycopg2
 
@@ -25,6 +26,10 @@ async def list_metrics(request: Request) -> List[MetricInfo]:
       }
     ]
     """
+    return await run_db(_fetch_metrics)
+
+def _fetch_metrics() -> List[MetricInfo]:
+    """Load metric metadata; runs in the database thread pool"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
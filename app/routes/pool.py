@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Request
+from typing import Dict, Any
+from database import get_pool
+from main import limiter
+
+router = APIRouter(prefix="/database", tags=["database"])
+
+@router.get("/pool")
+@limiter.limit("60/minute")
+async def get_pool_stats(request: Request) -> Dict[str, Any]:
+    """
+    Get database connection pool statistics
+
+    Returns:
+    - Configured min/max pool size
+    - Connections idle, in use and waiting for a checkout
+    - Checkout latency (average and max, in milliseconds)
+    - Connections created, recycled and dropped by health checks
+    """
+    return get_pool().get_stats()
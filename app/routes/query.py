@@ -1,8 +1,28 @@
 from fastapi import APIRouter, HTTPException, Request 
-from typing import List
+from fastapi.responses import Response, StreamingResponse
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
 import psycopg2
-from models import QueryRequest, QueryResponse, AggregationFunction
+import psycopg2.extensions
+from models import (
+    QueryRequest, BatchQueryRequest, QueryResponse, AggregationFunction, DownsampleMethod, FillMode, BatchFormat
+)
 from database import get_db_connection
+from async_database import run_db, run_stream
+from utils.registry import MetricEntry, lookup_metric, lookup_metrics, entry_from_row
+from utils.cache import cache_manager, query_ttl, CACHE_SETTLE_SECONDS
+from utils.codec import Series, Table
+from utils.partials import PARTIAL_AGGREGATIONS, finer_intervals, rebucket, finalize, partials_from_rows
+from utils.downsample import downsample
+from utils.segments import SegmentPlan, plan_segments, missing_runs, slice_table, concat_tables
+from utils.rollups import plan_query, rollup_query, rollup_params
+from utils.serialization import (
+    PointsResponse, GroupedPointsResponse, WideRowsResponse, ColumnsResponse, columns_media_type,
+    points_from_series, series_from_rows, dumps_point_lines, wide_rows
+)
+from utils.streaming import RowStream, StreamLimitError, stream_points, wants_ndjson, NDJSON_MEDIA_TYPE
 from main import limiter 
 
 router = APIRouter(prefix="/query", tags=["query"])
@@ -14,6 +34,13 @@ ALLOWED_INTERVALS = {
     '1 day', '7 days', '1 month'
 }
 
+BATCH_MAX_METRICS = 100
+
+# Smallest max_points for downsampling: LTTB always keeps the first and last points
+MIN_POINTS = 3
+
+QUERY_SOURCE_HEADER = "X-Query-Source"
+
 @router.post("", response_model=List[QueryResponse])
 @limiter.limit("200/minute") 
 async def query_data(request: Request, query_request: QueryRequest) -> List[QueryResponse]: 
@@ -30,93 +57,503 @@ async def query_data(request: Request, query_request: QueryRequest) -> List[Quer
       "aggregation": "avg",
       "interval": "1 hour"
     }
+    
+    Large ranges can be streamed instead of built in memory: send
+    `Accept: application/x-ndjson` for one JSON object per line, or set
+    `"stream": true` for a JSON array written in chunks as rows arrive.
+    
+    For columnar output send `Accept: application/vnd.timeseries.columns+json`
+    ({"times": [epoch microseconds], "values": [...]}) or
+    `Accept: application/vnd.timeseries.columns` (binary; see utils/codec.py).
+    
+    Chart clients can cap the response with `"max_points": 1000`: numeric results
+    with more points are reduced server-side with `"downsample": "lttb"` (default,
+    largest-triangle-three-buckets) or `"minmax"` (each time bucket's extremes).
+    Nulls are dropped, and downsampled results are never streamed.
+    
+    Aggregated queries can return every bucket of the window with `"fill"`:
+    `null` (empty buckets are null), `previous` (last value carried forward),
+    `linear` (interpolated) or `constant` (with `"fill_value": 0`).
+    
+    The `X-Query-Source` response header names what answered the query: `cache`,
+    `raw`, or a continuous aggregate such as `time_series_1h` (`+raw` when raw
+    rows filled in the window edges or the not yet materialized tail).
+    """
+    if query_request.downsample and not query_request.max_points:
+        raise HTTPException(status_code=400, detail="'downsample' requires 'max_points'")
+    if query_request.max_points is not None and query_request.max_points < MIN_POINTS:
+        raise HTTPException(status_code=400, detail=f"'max_points' must be at least {MIN_POINTS}")
+    
+    if query_request.fill and not (query_request.aggregation and query_request.interval):
+        raise HTTPException(status_code=400, detail="'fill' requires 'aggregation' and 'interval'")
+    if query_request.fill == FillMode.CONSTANT and query_request.fill_value is None:
+        raise HTTPException(status_code=400, detail="'fill': 'constant' requires 'fill_value'")
+    
+    accept = request.headers.get("accept")
+    ndjson = wants_ndjson(accept)
+    if (ndjson or query_request.stream) and not query_request.max_points:
+        stream, source = await run_stream(_open_stream, query_request)
+        return StreamingResponse(
+            stream_points(stream, ndjson),
+            media_type=NDJSON_MEDIA_TYPE if ndjson else "application/json",
+            headers={QUERY_SOURCE_HEADER: source}
+        )
+    
+    series, source = await run_db(_run_query, query_request)
+    headers = {QUERY_SOURCE_HEADER: source}
+    if query_request.max_points:
+        method = (query_request.downsample or DownsampleMethod.LTTB).value
+        try:
+            series = await run_db(downsample, series, query_request.max_points, method)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if ndjson:
+            return Response(dumps_point_lines(points_from_series(series)), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    
+    columns_type = columns_media_type(accept)
+    if columns_type:
+        return ColumnsResponse(series, media_type=columns_type, headers=headers)
+    # Returning a Response skips FastAPI's second validation pass over every point
+    return PointsResponse(points_from_series(series), headers=headers)
+
+def _build_query(cursor, query_request: QueryRequest, partials: bool = False) -> Tuple[str, Any, str]:
+    """
+    Validate a query request and return the SQL, its parameters and the data source it reads.
+
+    With `partials`, aggregated queries select per-bucket partials (see utils/partials.py)
+    rather than the aggregated value.
+    """
+    metric = lookup_metric(cursor, query_request.metric)
+    
+    if not metric:
+        raise HTTPException(status_code=404, detail=f"Metric '{query_request.metric}' not found")
+    
+    metric_id = metric.id
+    value_type = metric.value_type
+    params = (metric_id, query_request.start_time, query_request.end_time)
+    
+    if query_request.aggregation and query_request.interval:
+        if query_request.interval not in ALLOWED_INTERVALS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid interval. Allowed intervals: {sorted(list(ALLOWED_INTERVALS))}"
+            )
+
+        if value_type == 'string':
+            raise HTTPException(
+                status_code=400, 
+                detail="Aggregation is only supported for numeric metrics"
+            )
+        
+        if query_request.fill:
+            fill_params = (query_request.start_time, query_request.end_time + timedelta(microseconds=1))
+            if query_request.fill == FillMode.CONSTANT:
+                fill_params += (query_request.fill_value,)
+            return (
+                get_gapfill_query(query_request.aggregation, query_request.interval, query_request.fill),
+                fill_params + params,
+                "raw"
+            )
+        
+        plan = None
+        if query_request.aggregation.value in PARTIAL_AGGREGATIONS:
+            plan = plan_query(cursor, query_request.interval, query_request.start_time, query_request.end_time)
+        if plan is not None:
+            return (
+                rollup_query(plan, None if partials else query_request.aggregation.value, query_request.interval),
+                rollup_params(plan, metric_id, query_request.start_time, query_request.end_time),
+                plan.source
+            )
+        if partials:
+            return get_partials_query(query_request.interval), params, "raw"
+        return get_aggregation_query(query_request.aggregation, query_request.interval), params, "raw"
+    
+    return '''
+        SELECT time, value, text_value
+        FROM time_series_data
+        WHERE metric_id = %s AND time BETWEEN %s AND %s
+        ORDER BY time
+    ''', params, "raw"
+
+def _run_query(query_request: QueryRequest) -> Tuple[Series, str]:
     """
+    Serve a query from the Redis cache or TimescaleDB as (times, values) columns.
+
+    Aggregations that partials can finish (utils/partials.py) missing from the cache
+    are rebuilt from the cached partials of a finer interval over the same window
+    when there are any, then assembled from cached segments (see utils/segments.py)
+    where the window covers settled ones, and otherwise read as partials so later
+    coarser queries can do the same. Other aggregations run in the database.
+    Returns the columns and their source. Runs in the database thread pool.
+    """
+    cache_args = (
+        query_request.metric, query_request.start_time, query_request.end_time,
+        query_request.aggregation, query_request.interval
+    )
+    cached = cache_manager.get_cached_query(*cache_args, fill=_fill_key(query_request), route="/query")
+    if cached is not None:
+        return cached, "cache"
+    
+    from_partials = bool(
+        query_request.aggregation and query_request.interval and not query_request.fill
+        and query_request.aggregation.value in PARTIAL_AGGREGATIONS
+    )
+    if from_partials:
+        found = cache_manager.find_cached_partials(
+            query_request.metric, query_request.start_time, query_request.end_time,
+            finer_intervals(query_request.interval), route="/query:partials"
+        )
+        if found is not None:
+            partials = rebucket(found[1], query_request.interval)
+            return _cache_partials(query_request, partials), "cache"
+        
+        settled_before = datetime.now(timezone.utc) - timedelta(seconds=CACHE_SETTLE_SECONDS)
+        plan = plan_segments(query_request.interval, query_request.start_time, query_request.end_time, settled_before)
+        if plan is not None:
+            partials, source = _run_segmented(query_request, plan)
+            return _cache_partials(query_request, partials), source
+    
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('SELECT id, value_type FROM metrics WHERE name = %s', (query_request.metric,))
-            metric_result = cursor.fetchone()
+            query, params, source = _build_query(cursor, query_request, partials=from_partials)
             
-            if not metric_result:
-                raise HTTPException(status_code=404, detail=f"Metric '{query_request.metric}' not found")
+            # Tuple rows straight into columns; no per-row models or dicts
+            data_cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            data_cursor.execute(query, params)
+            rows = data_cursor.fetchall()
+            if from_partials:
+                return _cache_partials(query_request, partials_from_rows(rows)), source
             
-            metric_id = metric_result['id']
-            value_type = metric_result['value_type']
-            
-            if query_request.aggregation and query_request.interval:
-                if query_request.interval not in ALLOWED_INTERVALS:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Invalid interval. Allowed intervals: {sorted(list(ALLOWED_INTERVALS))}"
-                    )
+            response_data = series_from_rows(rows)
+            cache_manager.set_cached_query(
+                query_request.metric, query_request.start_time, query_request.end_time,
+                response_data,
+                aggregation=query_request.aggregation, interval=query_request.interval,
+                ttl_seconds=query_ttl(query_request.end_time), fill=_fill_key(query_request)
+            )
+            return response_data, source
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+def _fill_key(query_request: QueryRequest) -> Optional[str]:
+    """The fill settings as they appear in cache keys"""
+    if not query_request.fill:
+        return None
+    if query_request.fill == FillMode.CONSTANT:
+        return f"constant:{query_request.fill_value!r}"
+    return query_request.fill.value
+
+def _run_segmented(query_request: QueryRequest, plan: SegmentPlan) -> Tuple[Table, str]:
+    """
+    Assemble an aggregated window's partials from cached segments and database edges.
 
-                if value_type == 'string':
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Aggregation is only supported for numeric metrics"
+    Settled segments missing from the cache are read whole, one query per consecutive
+    run, and cached with the historical TTL; the partial first bucket and the live
+    tail are always read. The source lists every part used, e.g. "cache+raw".
+    """
+    cached = cache_manager.get_cached_segments(
+        query_request.metric, query_request.interval,
+        [(segment.start, segment.last) for segment in plan.segments], route="/query:segments"
+    )
+    runs = missing_runs(plan.segments, cached)
+    spans = [(run[0].start, run[-1].end) for run in runs]
+    if plan.head:
+        spans.insert(0, plan.head)
+    if plan.live:
+        spans.append(plan.live)
+    
+    sources = ["cache"] if any(table is not None for table in cached) else []
+    fetched: List[Table] = []
+    if spans:
+        try:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                data_cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+                for start, end in spans:
+                    span_request = query_request.model_copy(
+                        update={"start_time": start, "end_time": end - timedelta(microseconds=1)}
                     )
-                
-                aggregation_query = get_aggregation_query(query_request.aggregation, query_request.interval)
-                cursor.execute(aggregation_query, (metric_id, query_request.start_time, query_request.end_time))
-                
-            else:
-                cursor.execute('''
-                    SELECT time, value, text_value
-                    FROM time_series_data
-                    WHERE metric_id = %s AND time BETWEEN %s AND %s
-                    ORDER BY time
-                ''', (metric_id, query_request.start_time, query_request.end_time))
+                    query, params, source = _build_query(cursor, span_request, partials=True)
+                    data_cursor.execute(query, params)
+                    fetched.append(partials_from_rows(data_cursor.fetchall()))
+                    sources.extend(part for part in source.split("+") if part not in sources)
+        except psycopg2.Error as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    head = fetched.pop(0) if plan.head else None
+    live = fetched.pop() if plan.live else None
+    segments_by_start = {segment.start: index for index, segment in enumerate(plan.segments)}
+    new_segments = []
+    for run, run_table in zip(runs, fetched):
+        for segment in run:
+            table = slice_table(run_table, segment.start, segment.end)
+            cached[segments_by_start[segment.start]] = table
+            new_segments.append((segment.start, segment.last, table, query_ttl(segment.last)))
+    cache_manager.set_cached_segments(query_request.metric, query_request.interval, new_segments)
+    
+    parts = [slice_table(table, plan.inner_start, plan.covered_end) for table in cached]
+    if head:
+        parts.insert(0, head)
+    if live:
+        parts.append(live)
+    return concat_tables(parts), "+".join(sources)
+
+def _cache_partials(query_request: QueryRequest, partials: Table) -> Series:
+    """Cache an aggregated query's partials and its finished result; returns the result"""
+    series = finalize(partials, query_request.aggregation.value)
+    window = (query_request.metric, query_request.start_time, query_request.end_time)
+    ttl_seconds = query_ttl(query_request.end_time)
+    cache_manager.set_cached_partials(*window, query_request.interval, partials, ttl_seconds=ttl_seconds)
+    cache_manager.set_cached_query(
+        *window, series,
+        aggregation=query_request.aggregation, interval=query_request.interval,
+        ttl_seconds=ttl_seconds
+    )
+    return series
+
+def _open_stream(query_request: QueryRequest) -> Tuple[RowStream, str]:
+    """Validate the request and start it on a server-side cursor; streams bypass the cache"""
+    try:
+        with get_db_connection() as conn:
+            query, params, source = _build_query(conn.cursor(), query_request)
+        return RowStream(query, params), source
+    except StreamLimitError as e:
+        raise HTTPException(status_code=503, detail=f"{e}, retry later", headers={"Retry-After": "1"})
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@router.post("/batch", response_model=Dict[str, List[QueryResponse]])
+@limiter.limit("100/minute")
+async def query_batch(request: Request, batch_request: BatchQueryRequest) -> Dict[str, List[QueryResponse]]:
+    """
+    Query several metrics over one window with shared aggregation settings
+    
+    Rate Limited: 100 requests per minute per IP address
+    
+    Name the metrics, or give a pattern (`*` matches any run of characters, `?` one):
+    {
+      "metrics": ["temperature", "humidity"],
+      "start_time": "2024-01-15T00:00:00Z",
+      "end_time": "2024-01-15T23:59:59Z",
+      "aggregation": "avg",
+      "interval": "1 hour"
+    }
+    
+    Returns {"temperature": [{"time": ..., "value": ...}, ...], "humidity": [...]}.
+    With `"format": "wide"` the result is instead a time-ordered list of wide rows,
+    the shape wide-row ingest accepts: [{"time": ..., "tags": {}, "fields":
+    {"temperature": ..., "humidity": ...}}, ...], with tagged metric names such as
+    `temperature{device=a1}` split back into fields and tags.
+    Cached metrics are served from the cache; the rest share one database query.
+    """
+    if (batch_request.metrics is None) == (batch_request.pattern is None):
+        raise HTTPException(status_code=400, detail="Provide either 'metrics' or 'pattern'")
+    if batch_request.metrics is not None and not batch_request.metrics:
+        raise HTTPException(status_code=400, detail="No metrics provided")
+    
+    results, source = await run_db(_run_batch_query, batch_request)
+    if batch_request.format == BatchFormat.WIDE:
+        return WideRowsResponse(wide_rows(results), headers={QUERY_SOURCE_HEADER: source})
+    return GroupedPointsResponse(
+        {name: points_from_series(series) for name, series in results.items()},
+        headers={QUERY_SOURCE_HEADER: source}
+    )
+
+def _like_pattern(pattern: str) -> str:
+    """Translate a `*`/`?` name pattern into an escaped LIKE pattern"""
+    escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped.replace('*', '%').replace('?', '_')
+
+def _resolve_batch_metrics(cursor, batch_request: BatchQueryRequest) -> Dict[str, MetricEntry]:
+    """Find the batch's metrics in request order (or name order for a pattern)"""
+    if batch_request.pattern is not None:
+        cursor.execute(
+            'SELECT id, name, value_type, first_seen, last_seen FROM metrics WHERE name LIKE %s ORDER BY name',
+            (_like_pattern(batch_request.pattern),)
+        )
+        metrics = {row['name']: entry_from_row(row) for row in cursor.fetchall()}
+    else:
+        names = list(dict.fromkeys(batch_request.metrics))
+        found = lookup_metrics(cursor, names)
+        missing = [name for name in names if name not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Metrics not found: {', '.join(missing)}")
+        metrics = {name: found[name] for name in names}
+    
+    if len(metrics) > BATCH_MAX_METRICS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many metrics in batch ({len(metrics)}, max {BATCH_MAX_METRICS})"
+        )
+    
+    if batch_request.aggregation and batch_request.interval:
+        if batch_request.interval not in ALLOWED_INTERVALS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid interval. Allowed intervals: {sorted(list(ALLOWED_INTERVALS))}"
+            )
+        
+        text_metrics = [name for name, entry in metrics.items() if entry.value_type == 'string']
+        if text_metrics:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Aggregation is only supported for numeric metrics: {', '.join(text_metrics)}"
+            )
+    return metrics
+
+def _run_batch_query(batch_request: BatchQueryRequest) -> Tuple[Dict[str, Series], str]:
+    """
+    Answer a batch from the cache where possible and one `metric_id = ANY(%s)` query otherwise.
+
+    Returns the results and the source of the database part ("cache" if there was none).
+    Runs in the database thread pool.
+    """
+    aggregated = bool(batch_request.aggregation and batch_request.interval)
+    try:
+        with get_db_connection() as conn:
+            metrics = _resolve_batch_metrics(conn.cursor(), batch_request)
             
-            results = cursor.fetchall()
+            results: Dict[str, Series] = {}
+            misses: Dict[int, str] = {}
+            source = "cache"
+            for name, entry in metrics.items():
+                cached = cache_manager.get_cached_query(
+                    name, batch_request.start_time, batch_request.end_time,
+                    batch_request.aggregation, batch_request.interval, route="/query/batch"
+                )
+                if cached is not None:
+                    results[name] = cached
+                else:
+                    misses[entry.id] = name
             
-            response_data = []
-            for row in results:
-                row_dict = dict(row)
-                if 'bucket' in row_dict: 
-                    response_data.append(QueryResponse(
-                        time=row_dict['bucket'],
-                        value=row_dict['value']
-                    ))
+            if misses:
+                params = (list(misses), batch_request.start_time, batch_request.end_time)
+                source = "raw"
+                plan = None
+                if aggregated and batch_request.aggregation.value in PARTIAL_AGGREGATIONS:
+                    plan = plan_query(conn.cursor(), batch_request.interval,
+                                      batch_request.start_time, batch_request.end_time)
+                if plan is not None:
+                    query = rollup_query(plan, batch_request.aggregation.value, batch_request.interval, batch=True)
+                    params = rollup_params(plan, list(misses), batch_request.start_time, batch_request.end_time)
+                    source = plan.source
+                elif aggregated:
+                    query = get_batch_aggregation_query(batch_request.aggregation, batch_request.interval)
                 else:
-                    value = row_dict['text_value'] if row_dict['text_value'] is not None else row_dict['value']
-                    response_data.append(QueryResponse(
-                        time=row_dict['time'],
-                        value=value
-                    ))
+                    query = '''
+                        SELECT metric_id, time, value, text_value
+                        FROM time_series_data
+                        WHERE metric_id = ANY(%s) AND time BETWEEN %s AND %s
+                        ORDER BY metric_id, time
+                    '''
+                data_cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+                data_cursor.execute(query, params)
+                
+                grouped = {metric_id: [] for metric_id in misses}
+                for metric_id, rows in groupby(data_cursor.fetchall(), key=itemgetter(0)):
+                    grouped[metric_id] = [row[1:] for row in rows]
+                
+                ttl_seconds = query_ttl(batch_request.end_time)
+                for metric_id, name in misses.items():
+                    series = series_from_rows(grouped[metric_id])
+                    cache_manager.set_cached_query(
+                        name, batch_request.start_time, batch_request.end_time, series,
+                        aggregation=batch_request.aggregation, interval=batch_request.interval,
+                        ttl_seconds=ttl_seconds
+                    )
+                    results[name] = series
             
-            return response_data
+            return {name: results[name] for name in metrics}, source
     except psycopg2.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+# Per-bucket SQL for each aggregation; first/last/delta/rate skip null values
+NON_NULL = "FILTER (WHERE value IS NOT NULL)"
+AGGREGATE_EXPRESSIONS = {
+    AggregationFunction.AVG: 'AVG(value)',
+    AggregationFunction.SUM: 'SUM(value)',
+    AggregationFunction.MIN: 'MIN(value)',
+    AggregationFunction.MAX: 'MAX(value)',
+    AggregationFunction.COUNT: 'COUNT(*)',
+    AggregationFunction.P50: 'percentile_cont(0.5) WITHIN GROUP (ORDER BY value)',
+    AggregationFunction.P90: 'percentile_cont(0.9) WITHIN GROUP (ORDER BY value)',
+    AggregationFunction.P95: 'percentile_cont(0.95) WITHIN GROUP (ORDER BY value)',
+    AggregationFunction.P99: 'percentile_cont(0.99) WITHIN GROUP (ORDER BY value)',
+    AggregationFunction.STDDEV: 'stddev_samp(value)',
+    AggregationFunction.VARIANCE: 'var_samp(value)',
+    AggregationFunction.FIRST: f'first(value, time) {NON_NULL}',
+    AggregationFunction.LAST: f'last(value, time) {NON_NULL}',
+    AggregationFunction.DELTA: f'last(value, time) {NON_NULL} - first(value, time) {NON_NULL}',
+    # Change per second between the bucket's first and last readings
+    AggregationFunction.RATE: (
+        f'(last(value, time) {NON_NULL} - first(value, time) {NON_NULL}) / '
+        f'NULLIF(EXTRACT(EPOCH FROM last(time, time) {NON_NULL} - first(time, time) {NON_NULL}), 0)::double precision'
+    )
+}
+
 def get_aggregation_query(aggregation: AggregationFunction, interval: str) -> str:
     """Generate SQL query for different aggregation types using TimescaleDB's time_bucket function"""
-    
-    base_query = f'''
+    return f'''
+        SELECT 
+            time_bucket('{interval}', time) as bucket,
+            {AGGREGATE_EXPRESSIONS[aggregation]} as value
+        FROM time_series_data
+        WHERE metric_id = %s AND time BETWEEN %s AND %s
+        GROUP BY bucket
+        ORDER BY bucket
+    '''
+
+def get_gapfill_query(aggregation: AggregationFunction, interval: str, fill: FillMode) -> str:
+    """
+    Like get_aggregation_query, with a row for every bucket of the window (time_bucket_gapfill).
+
+    Parameters: gapfill start and finish, the fill value for `constant`, then the
+    metric id and time range.
+    """
+    expression = AGGREGATE_EXPRESSIONS[aggregation]
+    if fill == FillMode.PREVIOUS:
+        expression = f'locf({expression})'
+    elif fill == FillMode.LINEAR:
+        expression = f'interpolate({expression})'
+    elif fill == FillMode.CONSTANT:
+        expression = f'COALESCE({expression}, %s)'
+    return f'''
+        SELECT 
+            time_bucket_gapfill('{interval}', time, %s, %s) as bucket,
+            {expression} as value
+        FROM time_series_data
+        WHERE metric_id = %s AND time BETWEEN %s AND %s
+        GROUP BY bucket
+        ORDER BY bucket
+    '''
+
+def get_partials_query(interval: str) -> str:
+    """Per-bucket partials (see utils/partials.py) from which every aggregation can be finished"""
+    return f'''
         SELECT 
             time_bucket('{interval}', time) as bucket,
-            {{agg_function}}(value) as value
+            SUM(value) as sum,
+            COUNT(*) as count,
+            COUNT(value) as value_count,
+            MIN(value) as min,
+            MAX(value) as max
         FROM time_series_data
         WHERE metric_id = %s AND time BETWEEN %s AND %s
         GROUP BY bucket
         ORDER BY bucket
     '''
 
-    if aggregation == AggregationFunction.AVG:
-        return base_query.format(agg_function='AVG')
-    elif aggregation == AggregationFunction.SUM:
-        return base_query.format(agg_function='SUM')
-    elif aggregation == AggregationFunction.MIN:
-        return base_query.format(agg_function='MIN')
-    elif aggregation == AggregationFunction.MAX:
-        return base_query.format(agg_function='MAX')
-    elif aggregation == AggregationFunction.COUNT:
-        return f'''
-            SELECT 
-                time_bucket('{interval}', time) as bucket,
-                COUNT(*) as value
-            FROM time_series_data
-            WHERE metric_id = %s AND time BETWEEN %s AND %s
-            GROUP BY bucket
-            ORDER BY bucket
-        '''
\ No newline at end of file
+def get_batch_aggregation_query(aggregation: AggregationFunction, interval: str) -> str:
+    """Like get_aggregation_query, for `metric_id = ANY(%s)` and grouped per metric"""
+    return f'''
+        SELECT 
+            metric_id,
+            time_bucket('{interval}', time) as bucket,
+            {AGGREGATE_EXPRESSIONS[aggregation]} as value
+        FROM time_series_data
+        WHERE metric_id = ANY(%s) AND time BETWEEN %s AND %s
+        GROUP BY metric_id, bucket
+        ORDER BY metric_id, bucket
+    '''
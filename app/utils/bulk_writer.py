@@ -0,0 +1,119 @@
+import io
+from datetime import datetime
+from typing import Dict, Iterable, Sequence, Tuple, Union
+from utils.registry import MetricEntry, MetricRegistry, metric_registry, entry_from_row
+
+# (time, metric name, value) - the shape every ingest path is reduced to before writing
+Point = Tuple[datetime, str, Union[float, str]]
+
+def value_type_of(value: Union[float, str]) -> str:
+    """Metric value type as stored in metrics.value_type"""
+    return 'string' if isinstance(value, str) else 'number'
+
+def summarize_metrics(points: Iterable[Point]) -> Dict[str, Tuple[str, datetime]]:
+    """
+    Collapse a batch to one entry per metric: (value_type, latest timestamp).
+
+    The value type of the last point wins, matching the per-point upsert it replaces.
+    """
+    summary: Dict[str, Tuple[str, datetime]] = {}
+    for time, metric, value in points:
+        current = summary.get(metric)
+        latest = time if current is None or time > current[1] else current[1]
+        summary[metric] = (value_type_of(value), latest)
+    return summary
+
+def time_spans(points: Iterable[Point]) -> Dict[str, Tuple[datetime, datetime]]:
+    """Earliest and latest timestamp written for each metric of a batch"""
+    spans: Dict[str, Tuple[datetime, datetime]] = {}
+    for time, metric, _ in points:
+        span = spans.get(metric)
+        if span is None:
+            spans[metric] = (time, time)
+        elif time < span[0]:
+            spans[metric] = (time, span[1])
+        elif time > span[1]:
+            spans[metric] = (span[0], time)
+    return spans
+
+def upsert_metrics(cursor, metrics: Dict[str, Tuple[str, datetime]]) -> Dict[str, MetricEntry]:
+    """Create or update all metrics of a batch in one statement and return their rows"""
+    if not metrics:
+        return {}
+
+    names = list(metrics)
+    value_types = [metrics[name][0] for name in names]
+    last_seen = [metrics[name][1] for name in names]
+
+    cursor.execute('''
+        INSERT INTO metrics (name, value_type, last_seen)
+        SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::timestamptz[])
+        ON CONFLICT (name) DO UPDATE SET
+            value_type = EXCLUDED.value_type,
+            last_seen = GREATEST(metrics.last_seen, EXCLUDED.last_seen)
+        RETURNING id, name, value_type, first_seen, last_seen;
+    ''', (names, value_types, last_seen))
+
+    return {row['name']: entry_from_row(row) for row in cursor.fetchall()}
+
+def resolve_metrics(cursor, metrics: Dict[str, Tuple[str, datetime]],
+                    registry: MetricRegistry = metric_registry) -> Tuple[Dict[str, int], Dict[str, MetricEntry]]:
+    """
+    Map a batch's metrics to ids, upserting only those the registry cannot vouch for.
+
+    A metric is skipped when its cached type matches and its cached last_seen already
+    covers the batch. Returns (metric ids, upserted entries); apply the entries to the
+    registry only after the transaction commits.
+    """
+    metric_ids: Dict[str, int] = {}
+    pending: Dict[str, Tuple[str, datetime]] = {}
+    for name, (value_type, latest) in metrics.items():
+        entry = registry.get(name)
+        if entry is not None and entry.value_type == value_type and entry.last_seen >= latest:
+            metric_ids[name] = entry.id
+        else:
+            pending[name] = (value_type, latest)
+
+    upserted = upsert_metrics(cursor, pending)
+    metric_ids.update({name: entry.id for name, entry in upserted.items()})
+    return metric_ids, upserted
+
+def _escape_copy_text(value: str) -> str:
+    """Escape a string for COPY's text format"""
+    return (value.replace('\\', '\\\\')
+                 .replace('\t', '\\t')
+                 .replace('\n', '\\n')
+                 .replace('\r', '\\r'))
+
+def build_copy_buffer(points: Iterable[Point], metric_ids: Dict[str, int]) -> io.StringIO:
+    """Render points as COPY text rows: time, metric_id, value, text_value"""
+    buffer = io.StringIO()
+    write = buffer.write
+    for time, metric, value in points:
+        if isinstance(value, str):
+            write(f"{time.isoformat()}\t{metric_ids[metric]}\t\\N\t{_escape_copy_text(value)}\n")
+        else:
+            write(f"{time.isoformat()}\t{metric_ids[metric]}\t{float(value)!r}\t\\N\n")
+    buffer.seek(0)
+    return buffer
+
+def copy_points(cursor, points: Iterable[Point], metric_ids: Dict[str, int]) -> None:
+    """Stream points into the hypertable with COPY FROM STDIN"""
+    cursor.copy_expert(
+        "COPY time_series_data (time, metric_id, value, text_value) FROM STDIN",
+        build_copy_buffer(points, metric_ids)
+    )
+
+def write_points(cursor, points: Sequence[Point],
+                 registry: MetricRegistry = metric_registry) -> Tuple[int, Dict[str, MetricEntry]]:
+    """
+    Write a batch with at most two round trips: one metrics upsert and one COPY.
+
+    The caller owns the transaction: commit, then pass the returned entries to
+    `registry.update()`; on rollback, discard them.
+    """
+    if not points:
+        return 0, {}
+    metric_ids, upserted = resolve_metrics(cursor, summarize_metrics(points), registry)
+    copy_points(cursor, points, metric_ids)
+    return len(points), upserted
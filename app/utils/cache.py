@@ -1,18 +1,239 @@
 import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
 import json
 import os
-from typing import Optional, Any, List, Dict
-from datetime import datetime, timedelta
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Any, Callable, Generator, List, Dict, Tuple, Union
+from datetime import datetime, timedelta, timezone
 import logging
 import dotenv
+from utils.codec import Series, Table, encode_series, decode_series, encode_table, decode_table, to_utc
 dotenv.load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+CACHE_KEY_PREFIX = "timeseries:"
+# Stands in for the aggregation in the keys of cached per-bucket partials
+PARTIALS_KEY = "partials"
+CACHE_SCAN_BATCH_SIZE = int(os.getenv("CACHE_SCAN_BATCH_SIZE", 1000))
+CACHE_MAX_TRACKED_JOBS = 20
+# Expired index members removed per cache write
+CACHE_INDEX_PRUNE_BATCH = 1000
+
+# Windows ending more than CACHE_SETTLE_SECONDS ago are treated as immutable
+CACHE_HISTORICAL_TTL = int(os.getenv("CACHE_HISTORICAL_TTL", 86400))
+CACHE_RECENT_TTL = int(os.getenv("CACHE_RECENT_TTL", 10))
+CACHE_SETTLE_SECONDS = int(os.getenv("CACHE_SETTLE_SECONDS", 300))
+
+def normalize_timestamp(timestamp: Union[datetime, str]) -> str:
+    """Render a timestamp the same way regardless of the offset it was sent with"""
+    if isinstance(timestamp, str):
+        return timestamp
+    return to_utc(timestamp).isoformat()
+
+def to_epoch(timestamp: Union[datetime, str]) -> float:
+    """Seconds since the epoch, for sorted-set scores"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return to_utc(timestamp).timestamp()
+
+def query_ttl(end_time: datetime) -> int:
+    """Long TTL for windows fully in the past, short TTL for windows touching now"""
+    if to_utc(end_time) < datetime.now(timezone.utc) - timedelta(seconds=CACHE_SETTLE_SECONDS):
+        return CACHE_HISTORICAL_TTL
+    return CACHE_RECENT_TTL
+
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_L1_MAX_TTL = float(os.getenv("CACHE_L1_MAX_TTL", 300))
+CACHE_INVALIDATION_CHANNEL = f"{CACHE_KEY_PREFIX}l1:invalidate"
+
+CACHE_BREAKER_BASE_DELAY = float(os.getenv("CACHE_BREAKER_BASE_DELAY", 1))
+CACHE_BREAKER_MAX_DELAY = float(os.getenv("CACHE_BREAKER_MAX_DELAY", 60))
+
+class CircuitBreaker:
+    """
+    Tracks Redis health from the outcome of real commands.
+
+    closed: commands run normally. A connection error or timeout opens the breaker.
+    open: commands are skipped until the backoff delay (doubling per consecutive
+    failure, capped at max_delay) has elapsed.
+    half_open: a single probe command is let through; success closes the breaker,
+    failure reopens it with a longer delay.
+    """
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._trips = 0
+        self._retry_at = 0.0
+        self._probe_deadline = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() >= self._retry_at:
+                return "half_open"
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a command may be sent now; in half_open this claims the single probe"""
+        with self._lock:
+            if self._state == "closed":
+                return True
+            now = time.monotonic()
+            if now < self._retry_at or now < self._probe_deadline:
+                return False
+            # The probe slot is released by record_success/record_failure, or after
+            # the backoff delay if the caller never reports back.
+            self._state = "half_open"
+            self._probe_deadline = now + self._delay()
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = "closed"
+            self._consecutive_failures = 0
+            self._probe_deadline = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == "closed":
+                self._trips += 1
+            self._consecutive_failures += 1
+            self._state = "open"
+            self._retry_at = time.monotonic() + self._delay()
+            self._probe_deadline = 0.0
+
+    def _delay(self) -> float:
+        exponent = max(0, self._consecutive_failures - 1)
+        return min(self.max_delay, self.base_delay * (2 ** min(exponent, 32)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "trips": self._trips,
+                "consecutive_failures": self._consecutive_failures,
+                "retry_in_seconds": round(max(0.0, self._retry_at - time.monotonic()), 3) if state == "open" else 0.0
+            }
+
+def decoded_size(data: Union[Series, Table]) -> int:
+    """
+    Approximate memory held by decoded (times, values) or (times, {column: values}) data.
+
+    Each list is charged its pointer array plus one object the size of its first
+    non-null item per entry; shared objects such as None are overcounted.
+    """
+    times, values = data
+    columns = list(values.values()) if isinstance(values, dict) else [values]
+    size = 0
+    for column in [times, *columns]:
+        sample = next((item for item in column if item is not None), None)
+        size += sys.getsizeof(column) + len(column) * (0 if sample is None else sys.getsizeof(sample))
+    return size
+
+class LocalCache:
+    """
+    In-process LRU of decoded query results, bounded by their estimated memory in bytes.
+
+    Values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any, size: int, ttl_seconds: float) -> None:
+        if size > self.max_bytes or ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + ttl_seconds)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions
+            }
+
+def _tier_stats(hits: int, misses: int) -> Dict[str, Any]:
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else 0.0
+    }
+
 class CacheManager:
     def __init__(self):
         self.redis_client = None
+        self.breaker = CircuitBreaker(CACHE_BREAKER_BASE_DELAY, CACHE_BREAKER_MAX_DELAY)
+        self._stats_lock = threading.Lock()
+        self._route_stats: Dict[str, Dict[str, int]] = {}
+        self._jobs_lock = threading.Lock()
+        self._clear_jobs: Dict[str, Dict[str, Any]] = {}
+        self.l1 = LocalCache(CACHE_L1_MAX_BYTES)
+        self._l2_hits = 0
+        self._l2_misses = 0
+        # L1 is only trusted while this worker is subscribed to invalidations
+        self._l1_subscribed = threading.Event()
+        self._worker_id = uuid.uuid4().hex
         self._connect_redis()
+        if self.redis_client is not None and CACHE_L1_MAX_BYTES > 0:
+            threading.Thread(target=self._listen_for_invalidations, name="cache-l1-invalidation", daemon=True).start()
     
     def _connect_redis(self):
         """Connect to Redis with proper configuration for development"""
@@ -25,121 +246,518 @@ class CacheManager:
                 socket_connect_timeout=5, 
                 socket_timeout=5,        
                 # retry_on_timeout=True,
-                decode_responses=True    
+                # Reconnect backoff is owned by the circuit breaker, not redis-py
+                retry=Retry(NoBackoff(), 0),
+                # Cached results are binary (see utils/codec.py)
+                decode_responses=False
             )
-            
-            self.redis_client.ping()
-            logger.info("Redis cache connected successfully")
-            
-        except redis.ConnectionError as e:
-            logger.warning(f"Redis connection failed: {e}")
-            logger.warning("Running without cache - install Redis for better performance")
-            self.redis_client = None
         except Exception as e:
             logger.error(f"Redis error: {e}")
             self.redis_client = None
+            return
+        
+        # One startup ping seeds the breaker; afterwards the outcome of real
+        # commands drives it and redis-py reconnects on the next allowed command.
+        try:
+            with self._command() as client:
+                client.ping()
+            logger.info("Redis cache connected successfully")
+        except redis.RedisError as e:
+            logger.warning(f"Redis connection failed: {e}")
+            logger.warning("Running without cache until Redis becomes reachable")
     
     def is_connected(self) -> bool:
-        """Check if Redis is connected"""
-        if not self.redis_client:
-            return False
+        """Whether Redis is believed reachable, judged by recent commands; sends nothing"""
+        return self.redis_client is not None and self.breaker.state != "open"
+    
+    def _available(self) -> bool:
+        """Gate for sending a command; skips Redis entirely while the breaker is open"""
+        return self.redis_client is not None and self.breaker.allow()
+    
+    @contextmanager
+    def _command(self) -> Generator[redis.Redis, None, None]:
+        """Run Redis commands, reporting connection failures and successes to the breaker"""
         try:
-            self.redis_client.ping()
-            return True
-        except:
-            return False
+            yield self.redis_client
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.breaker.record_failure()
+            raise
+        except redis.RedisError:
+            # Redis answered, just not with what we wanted
+            self.breaker.record_success()
+            raise
+        else:
+            self.breaker.record_success()
     
-    def _make_cache_key(self, metric: str, start_time: str, end_time: str, 
-                       aggregation: Optional[str] = None, interval: Optional[str] = None) -> str:
+    def _make_cache_key(self, metric: str, start_time: Union[datetime, str], end_time: Union[datetime, str], 
+                       aggregation: Optional[str] = None, interval: Optional[str] = None,
+                       fill: Optional[str] = None) -> str:
         """Create a unique cache key for query parameters"""
-        base_key = f"timeseries:query:{metric}:{start_time}:{end_time}"
+        base_key = f"{CACHE_KEY_PREFIX}query:{metric}:{normalize_timestamp(start_time)}:{normalize_timestamp(end_time)}"
         if aggregation and interval:
-            base_key += f":{aggregation}:{interval}"
+            aggregation = getattr(aggregation, "value", aggregation)
+            base_key += f":{aggregation}:{' '.join(interval.split())}"
+            if fill:
+                base_key += f":fill={fill}"
         return base_key
     
-    def get_cached_query(self, metric: str, start_time: str, end_time: str,
-                        aggregation: Optional[str] = None, interval: Optional[str] = None) -> Optional[List[Dict]]:
-        """Get cached query results"""
-        if not self.is_connected():
+    def _record(self, route: Optional[str], hit: bool) -> None:
+        if route is None:
+            return
+        with self._stats_lock:
+            stats = self._route_stats.setdefault(route, {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+    
+    def _record_l2(self, hit: bool) -> None:
+        # Lookups run on the database thread pool, so += needs the lock
+        with self._stats_lock:
+            if hit:
+                self._l2_hits += 1
+            else:
+                self._l2_misses += 1
+    
+    def get_route_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-route cache hit/miss counters for this process"""
+        with self._stats_lock:
+            report = {}
+            for route, stats in self._route_stats.items():
+                total = stats["hits"] + stats["misses"]
+                report[route] = {
+                    **stats,
+                    "hit_ratio": round(stats["hits"] / total, 4) if total else 0.0
+                }
+            return report
+    
+    def get_cached_query(self, metric: str, start_time: Union[datetime, str], end_time: Union[datetime, str],
+                        aggregation: Optional[str] = None, interval: Optional[str] = None,
+                        fill: Optional[str] = None, route: Optional[str] = None) -> Optional[Series]:
+        """
+        Get cached query results, as (times, values) columns, from L1 (in-process) or L2 (Redis).
+
+        The hit or miss is counted against `route`. Returned lists may be shared
+        with other requests and must not be mutated.
+        """
+        cache_key = self._make_cache_key(metric, start_time, end_time, aggregation, interval, fill)
+        
+        if self._l1_subscribed.is_set():
+            local = self.l1.get(cache_key)
+            if local is not None:
+                self._record(route, True)
+                return local
+        
+        if not self._available():
+            self._record(route, False)
             return None
-            
-        cache_key = self._make_cache_key(metric, start_time, end_time, aggregation, interval)
         
         try:
-            cached_data = self.redis_client.get(cache_key)
-            if cached_data:
+            with self._command() as client:
+                pipe = client.pipeline(transaction=False)
+                pipe.get(cache_key)
+                pipe.pttl(cache_key)
+                cached_data, ttl_ms = pipe.execute()
+            # Entries in an older format decode to None and count as misses
+            data = decode_series(cached_data) if cached_data else None
+            if data is not None:
                 logger.debug(f"Cache hit for key: {cache_key}")
-                return json.loads(cached_data)
+                self._record_l2(True)
+                self._record(route, True)
+                self._store_local(cache_key, data, ttl_ms / 1000)
+                return data
             else:
                 logger.debug(f"Cache miss for key: {cache_key}")
+                self._record_l2(False)
+                self._record(route, False)
                 return None
                 
         except Exception as e:
             logger.error(f"Cache get error: {e}")
+            self._record(route, False)
             return None
     
-    def set_cached_query(self, metric: str, start_time: str, end_time: str,
-                        data: List[Dict], aggregation: Optional[str] = None, 
-                        interval: Optional[str] = None, ttl_seconds: int = 300) -> None:
-        """Cache query results"""
-        if not self.is_connected():
+    def find_cached_partials(self, metric: str, start_time: Union[datetime, str], end_time: Union[datetime, str],
+                             intervals: List[str], route: Optional[str] = None) -> Optional[Tuple[str, Table]]:
+        """The first of `intervals` with cached per-bucket partials for this window, and those partials"""
+        keys = [self._make_cache_key(metric, start_time, end_time, PARTIALS_KEY, interval) for interval in intervals]
+        if not keys:
+            return None
+        for interval, partials in zip(intervals, self._get_partials(keys, first_only=True)):
+            if partials is not None:
+                self._record(route, True)
+                return interval, partials
+        self._record(route, False)
+        return None
+    
+    def get_cached_segments(self, metric: str, interval: str, windows: List[Tuple[datetime, datetime]],
+                            route: Optional[str] = None) -> List[Optional[Table]]:
+        """Cached partials for each (start, end) window at one interval; None where missing"""
+        keys = [self._make_cache_key(metric, start, end, PARTIALS_KEY, interval) for start, end in windows]
+        found = self._get_partials(keys)
+        for partials in found:
+            self._record(route, partials is not None)
+        return found
+    
+    def _get_partials(self, cache_keys: List[str], first_only: bool = False) -> List[Optional[Table]]:
+        """
+        Look up several partials entries: L1 first, then the rest from Redis in one round trip.
+
+        With `first_only` Redis is skipped once L1 has any of them.
+        """
+        found: List[Optional[Table]] = [None] * len(cache_keys)
+        if self._l1_subscribed.is_set():
+            for index, cache_key in enumerate(cache_keys):
+                found[index] = self.l1.get(cache_key)
+            if first_only and any(partials is not None for partials in found):
+                return found
+        
+        pending = [index for index, partials in enumerate(found) if partials is None]
+        if not pending or not self._available():
+            return found
+        
+        try:
+            with self._command() as client:
+                pipe = client.pipeline(transaction=False)
+                for index in pending:
+                    pipe.get(cache_keys[index])
+                    pipe.pttl(cache_keys[index])
+                replies = pipe.execute()
+            for position, index in enumerate(pending):
+                cached_data, ttl_ms = replies[2 * position], replies[2 * position + 1]
+                partials = decode_table(cached_data) if cached_data else None
+                if partials is not None:
+                    self._record_l2(True)
+                    self._store_local(cache_keys[index], partials, ttl_ms / 1000)
+                    found[index] = partials
+                else:
+                    self._record_l2(False)
+        except Exception as e:
+            logger.error(f"Cache get error: {e}")
+        return found
+    
+    def _store_local(self, cache_key: str, data: Union[Series, Table], ttl_seconds: float) -> None:
+        """Keep decoded data in L1, charged by its in-memory size rather than its compressed payload"""
+        if self._l1_subscribed.is_set():
+            self.l1.put(cache_key, data, decoded_size(data) + sys.getsizeof(cache_key),
+                        min(ttl_seconds, CACHE_L1_MAX_TTL))
+    
+    def _invalidate_local(self, client: redis.Redis, keys: Optional[List[str]]) -> None:
+        """Drop keys (or everything, for None) from L1 here and, via pub/sub, in every other worker"""
+        if keys is None:
+            self.l1.clear()
+        else:
+            self.l1.invalidate(keys)
+        client.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({"origin": self._worker_id, "keys": keys}))
+    
+    def _listen_for_invalidations(self) -> None:
+        """Apply other workers' invalidations to L1; resubscribes with backoff after errors"""
+        delay = CACHE_BREAKER_BASE_DELAY
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                # Anything published while we were not listening is lost, so start clean
+                self.l1.clear()
+                self._l1_subscribed.set()
+                delay = CACHE_BREAKER_BASE_DELAY
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload["origin"] == self._worker_id:
+                        continue
+                    if payload["keys"] is None:
+                        self.l1.clear()
+                    else:
+                        self.l1.invalidate(payload["keys"])
+            except Exception as e:
+                self._l1_subscribed.clear()
+                self.l1.clear()
+                logger.warning(f"L1 invalidation subscriber error: {e}")
+                time.sleep(delay)
+                delay = min(CACHE_BREAKER_MAX_DELAY, delay * 2)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+    
+    def _index_key(self, metric: str) -> str:
+        """Sorted set of a metric's cached queries, scored by window end"""
+        return f"{CACHE_KEY_PREFIX}index:{metric}"
+    
+    def _expiry_key(self, metric: str) -> str:
+        """The same members as the metric's index, scored by when their cache key expires"""
+        return f"{CACHE_KEY_PREFIX}index-expiry:{metric}"
+    
+    def set_cached_query(self, metric: str, start_time: Union[datetime, str], end_time: Union[datetime, str],
+                        data: Series, aggregation: Optional[str] = None, 
+                        interval: Optional[str] = None, ttl_seconds: int = 300,
+                        fill: Optional[str] = None) -> None:
+        """Cache (times, values) query results and register the entry in the metric's time-range index"""
+        cache_key = self._make_cache_key(metric, start_time, end_time, aggregation, interval, fill)
+        self._set_entries(metric, [(start_time, end_time, cache_key, lambda: encode_series(*data), ttl_seconds)],
+                          decode_series)
+    
+    def set_cached_partials(self, metric: str, start_time: Union[datetime, str], end_time: Union[datetime, str],
+                           interval: str, partials: Table, ttl_seconds: int = 300) -> None:
+        """Cache per-bucket partial aggregates; invalidated together with the metric's query results"""
+        cache_key = self._make_cache_key(metric, start_time, end_time, PARTIALS_KEY, interval)
+        self._set_entries(metric, [(start_time, end_time, cache_key, lambda: encode_table(*partials), ttl_seconds)],
+                          decode_table)
+    
+    def set_cached_segments(self, metric: str, interval: str,
+                            segments: List[Tuple[datetime, datetime, Table, int]]) -> None:
+        """Cache partials for several (start, end, partials, ttl_seconds) windows of one interval in one round trip"""
+        self._set_entries(metric, [
+            (start, end, self._make_cache_key(metric, start, end, PARTIALS_KEY, interval),
+             lambda partials=partials: encode_table(*partials), ttl_seconds)
+            for start, end, partials, ttl_seconds in segments
+        ], decode_table)
+    
+    def _set_entries(self, metric: str,
+                     entries: List[Tuple[Union[datetime, str], Union[datetime, str], str, Callable[[], bytes], int]],
+                     decode: Callable[[bytes], Any]) -> None:
+        """Write (start, end, cache key, encode, ttl_seconds) entries of one metric and index them, in one pipeline"""
+        if not entries or not self._available():
+            return
+        
+        index_key = self._index_key(metric)
+        expiry_key = self._expiry_key(metric)
+        
+        encoded = []
+        for start_time, end_time, cache_key, encode, ttl_seconds in entries:
+            try:
+                encoded.append((start_time, end_time, cache_key, encode(), ttl_seconds))
+            except ValueError as e:
+                logger.debug(f"Not caching {cache_key}: {e}")
+        if not encoded:
             return
-            
-        cache_key = self._make_cache_key(metric, start_time, end_time, aggregation, interval)
         
         try:
-            self.redis_client.setex(
-                cache_key,
-                timedelta(seconds=ttl_seconds),
-                json.dumps(data, default=str)
-            )
-            logger.debug(f"Cached data for key: {cache_key} (TTL: {ttl_seconds}s)")
+            # Members are "<window start>|<cache key>" scored by window end, so one
+            # ZRANGEBYSCORE finds every window ending after a point and the start
+            # prefix filters out the ones beginning after it.
+            now = time.time()
+            members = {
+                f"{to_epoch(start_time)}|{cache_key}": (to_epoch(end_time), now + ttl_seconds)
+                for start_time, end_time, cache_key, _, ttl_seconds in encoded
+            }
+            index_ttl = max(max(entry[4] for entry in encoded), CACHE_HISTORICAL_TTL)
+            with self._command() as client:
+                pipe = client.pipeline(transaction=False)
+                for start_time, end_time, cache_key, payload, ttl_seconds in encoded:
+                    pipe.setex(cache_key, timedelta(seconds=ttl_seconds), payload)
+                pipe.zadd(index_key, {member: end for member, (end, _) in members.items()})
+                pipe.zadd(expiry_key, {member: expires for member, (_, expires) in members.items()})
+                pipe.expire(index_key, index_ttl)
+                pipe.expire(expiry_key, index_ttl)
+                pipe.zrangebyscore(expiry_key, "-inf", now, start=0, num=CACHE_INDEX_PRUNE_BATCH)
+                expired = pipe.execute()[-1]
+                if expired:
+                    self._prune_index(client, metric, expired)
         except Exception as e:
             logger.error(f"Cache set error: {e}")
+            return
+        for _, _, cache_key, payload, ttl_seconds in encoded:
+            # Store the round-tripped form so L1 and L2 hits return identical data
+            self._store_local(cache_key, decode(payload), ttl_seconds)
+            logger.debug(f"Cached data for key: {cache_key} (TTL: {ttl_seconds}s)")
+    
+    def _prune_index(self, client: redis.Redis, metric: str, members: List[bytes]) -> None:
+        """
+        Drop index members whose cache keys have expired.
+
+        Their keys are deleted with the members, atomically, and dropped from L1: a
+        key a concurrent write has just re-cached goes too, so no cached key is ever
+        left unindexed (and so never missed by invalidation).
+        """
+        keys = [member.split(b"|", 1)[1].decode() for member in members]
+        pipe = client.pipeline(transaction=True)
+        pipe.zrem(self._index_key(metric), *members)
+        pipe.zrem(self._expiry_key(metric), *members)
+        pipe.delete(*keys)
+        pipe.execute()
+        self._invalidate_local(client, keys)
+        logger.debug(f"Pruned {len(members)} expired index entries of {metric}")
+    
+    def invalidate_time_ranges(self, spans: Dict[str, Tuple[datetime, datetime]]) -> int:
+        """
+        Delete cached queries whose window overlaps newly ingested data.
+
+        `spans` maps each metric to the (earliest, latest) timestamp written for it.
+        Windows entirely before or after a metric's span stay cached.
+        """
+        if not spans or not self._available():
+            return 0
+        
+        try:
+            metrics = list(spans)
+            with self._command() as client:
+                pipe = client.pipeline(transaction=False)
+                for metric in metrics:
+                    pipe.zrangebyscore(self._index_key(metric), to_epoch(spans[metric][0]), "+inf")
+                candidates = pipe.execute()
+                
+                pipe = client.pipeline(transaction=False)
+                stale_keys = []
+                for metric, members in zip(metrics, candidates):
+                    latest = to_epoch(spans[metric][1])
+                    stale = [member for member in members if float(member.split(b"|", 1)[0]) <= latest]
+                    if stale:
+                        stale_keys.extend(member.split(b"|", 1)[1].decode() for member in stale)
+                        pipe.zrem(self._index_key(metric), *stale)
+                        pipe.zrem(self._expiry_key(metric), *stale)
+                if stale_keys:
+                    pipe.delete(*stale_keys)
+                    pipe.execute()
+                    self._invalidate_local(client, stale_keys)
+            if stale_keys:
+                logger.debug(f"Invalidated {len(stale_keys)} cached queries overlapping ingested data")
+            return len(stale_keys)
+        except Exception as e:
+            logger.error(f"Cache invalidation error: {e}")
+            return 0
     
     def invalidate_metric_cache(self, metric: str) -> None:
         """Invalidate all cache entries for a specific metric"""
-        if not self.is_connected():
+        if not self._available():
             return
             
         try:
-            pattern = f"timeseries:query:{metric}:*"
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
-                logger.debug(f"Invalidated cache for metric: {metric} ({len(keys)} keys)")
+            index_key = self._index_key(metric)
+            with self._command() as client:
+                members = client.zrange(index_key, 0, -1)
+                keys = [member.split(b"|", 1)[1].decode() for member in members]
+                client.delete(index_key, self._expiry_key(metric), *keys)
+                self._invalidate_local(client, keys)
+            logger.debug(f"Invalidated cache for metric: {metric} ({len(keys)} keys)")
         except Exception as e:
             logger.error(f"Cache invalidation error: {e}")
     
-    def clear_cache(self) -> None:
+    def scan_keys(self, cursor: int = 0, count: int = 100,
+                  pattern: str = f"{CACHE_KEY_PREFIX}*") -> Tuple[int, List[str]]:
+        """
+        Return one SCAN page of keys matching `pattern`.
+
+        `count` is a hint: a page may hold fewer or more keys. The returned cursor
+        is 0 once the whole keyspace has been walked.
+        """
+        with self._command() as client:
+            next_cursor, keys = client.scan(cursor=cursor, match=pattern, count=count)
+        return int(next_cursor), [key.decode() for key in keys]
+    
+    def _unlink_matching(self, pattern: str, progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """Delete keys matching `pattern` with SCAN + batched UNLINK; never blocks Redis on KEYS"""
+        scanned = 0
+        deleted = 0
+        batch: List[str] = []
+        with self._command() as client:
+            for key in client.scan_iter(match=pattern, count=CACHE_SCAN_BATCH_SIZE):
+                scanned += 1
+                batch.append(key)
+                if len(batch) >= CACHE_SCAN_BATCH_SIZE:
+                    deleted += client.unlink(*batch)
+                    batch = []
+                    if progress:
+                        progress(scanned, deleted)
+            if batch:
+                deleted += client.unlink(*batch)
+            self._invalidate_local(client, None)
+        if progress:
+            progress(scanned, deleted)
+        return deleted
+    
+    def clear_cache(self, progress: Optional[Callable[[int, int], None]] = None) -> int:
         """Clear all cache (careful with this in production!)"""
-        if not self.is_connected():
-            return
+        if not self._available():
+            return 0
             
         try:
-            pattern = "timeseries:*"
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
-                logger.info(f"Cleared all cache ({len(keys)} keys)")
+            deleted = self._unlink_matching(f"{CACHE_KEY_PREFIX}*", progress)
+            logger.info(f"Cleared all cache ({deleted} keys)")
+            return deleted
         except Exception as e:
             logger.error(f"Cache clear error: {e}")
+            return 0
+    
+    def start_clear_job(self) -> Dict[str, Any]:
+        """Clear the cache in a background thread and return the job record to poll"""
+        with self._jobs_lock:
+            for running in self._clear_jobs.values():
+                if running["status"] == "running":
+                    return dict(running)
+        
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "running",
+            "scanned": 0,
+            "deleted": 0,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+            "error": None
+        }
+        with self._jobs_lock:
+            self._clear_jobs[job["job_id"]] = job
+            while len(self._clear_jobs) > CACHE_MAX_TRACKED_JOBS:
+                self._clear_jobs.pop(next(iter(self._clear_jobs)))
+        
+        def progress(scanned: int, deleted: int) -> None:
+            job["scanned"] = scanned
+            job["deleted"] = deleted
+        
+        def run() -> None:
+            try:
+                if not self._available():
+                    raise redis.ConnectionError("Redis not connected")
+                self._unlink_matching(f"{CACHE_KEY_PREFIX}*", progress)
+                job["status"] = "completed"
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+            job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        
+        threading.Thread(target=run, name=f"cache-clear-{job['job_id'][:8]}", daemon=True).start()
+        return dict(job)
+    
+    def get_clear_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a clear job's progress, or None if unknown"""
+        with self._jobs_lock:
+            job = self._clear_jobs.get(job_id)
+            return dict(job) if job else None
     
     def get_cache_info(self) -> Dict[str, Any]:
         """Get cache statistics and info"""
-        if not self.is_connected():
-            return {"status": "disconnected"}
+        with self._stats_lock:
+            l2_hits, l2_misses = self._l2_hits, self._l2_misses
+        stats = {
+            "routes": self.get_route_stats(),
+            "tiers": {
+                "l1": {
+                    **_tier_stats(self.l1.hits, self.l1.misses),
+                    **self.l1.get_stats(),
+                    "active": self._l1_subscribed.is_set()
+                },
+                "l2": _tier_stats(l2_hits, l2_misses)
+            },
+            "circuit_breaker": self.breaker.snapshot()
+        }
+        if not self._available():
+            return {"status": "disconnected", **stats}
             
         try:
-            info = self.redis_client.info()
+            with self._command() as client:
+                info = client.info()
             return {
                 "status": "connected",
                 "used_memory": info.get('used_memory_human', 'N/A'),
                 "connected_clients": info.get('connected_clients', 'N/A'),
                 "keyspace_hits": info.get('keyspace_hits', 'N/A'),
-                "keyspace_misses": info.get('keyspace_misses', 'N/A')
+                "keyspace_misses": info.get('keyspace_misses', 'N/A'),
+                **stats
             }
         except Exception as e:
-            return {"status": f"error: {str(e)}"}
+            return {"status": f"error: {str(e)}", **stats}
 
 cache_manager = CacheManager()
\ No newline at end of file
@@ -0,0 +1,219 @@
+import struct
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Columnar cache format, all integers little-endian:
+#
+#   header   magic b"TSC" | version u8 | flags u8 (bit 0: body is zlib-compressed)
+#   body     rows u32 | columns u16
+#            times int64[rows]                 epoch microseconds, UTC
+#            per column:
+#              name_len u8 | name utf-8 | kind u8
+#              kind 0 (float64): null bitmap u8[ceil(rows / 8)] | values float64[rows]
+#              kind 1 (string):  strings u32 | (len u32 | utf-8)[strings] | indices int32[rows], -1 = null
+#
+# Payloads with another magic or version (e.g. the JSON entries written before this
+# format existed) decode to None and are treated as cache misses.
+
+MAGIC = b"TSC"
+VERSION = 1
+FLAG_COMPRESSED = 0x01
+KIND_FLOAT = 0
+KIND_STRING = 1
+
+HEADER = struct.Struct("<3sBB")
+BODY_HEADER = struct.Struct("<IH")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_utc(timestamp: datetime) -> datetime:
+    """Normalize a timestamp to UTC, treating naive values as UTC"""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+def _to_micros(timestamp: Any) -> int:
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+def times_to_micros(times: Sequence[Any]) -> np.ndarray:
+    """Epoch microseconds (int64) for datetimes or ISO 8601 strings; naive values are UTC"""
+    return np.fromiter((_to_micros(value) for value in times), dtype="<i8", count=len(times))
+
+def micros_to_datetimes(micros: np.ndarray) -> List[datetime]:
+    """Convert epoch microseconds back to aware UTC datetimes"""
+    if not (micros % 1_000_000).any():
+        # Whole seconds, the common case for sensor data: exact and cheapest to build
+        from_seconds = datetime.fromtimestamp
+        return [from_seconds(seconds, timezone.utc) for seconds in (micros // 1_000_000).tolist()]
+    # Formatting in NumPy and parsing with fromisoformat beats building datetimes one by one
+    text = np.char.add(np.datetime_as_string(micros.astype("datetime64[us]"), unit="us"), "+00:00")
+    parse = datetime.fromisoformat
+    return [parse(value) for value in text.tolist()]
+
+def _column_kind(values: Sequence[Any]) -> int:
+    kinds = {type(value) for value in values if value is not None}
+    if kinds <= {float, int}:
+        return KIND_FLOAT
+    if kinds == {str}:
+        return KIND_STRING
+    raise ValueError(f"Column mixes value types: {sorted(kind.__name__ for kind in kinds)}")
+
+def _encode_column(name: str, values: Sequence[Any]) -> bytes:
+    encoded_name = name.encode()
+    kind = _column_kind(values)
+    parts = [struct.pack("<B", len(encoded_name)), encoded_name, struct.pack("<B", kind)]
+
+    if kind == KIND_FLOAT:
+        nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        floats = np.fromiter((0.0 if value is None else value for value in values), dtype="<f8", count=len(values))
+        parts.append(np.packbits(nulls).tobytes())
+        parts.append(floats.tobytes())
+    else:
+        table: Dict[str, int] = {}
+        indices = np.fromiter(
+            (-1 if value is None else table.setdefault(value, len(table)) for value in values),
+            dtype="<i4", count=len(values)
+        )
+        parts.append(struct.pack("<I", len(table)))
+        for text in table:
+            encoded = text.encode()
+            parts.append(struct.pack("<I", len(encoded)))
+            parts.append(encoded)
+        parts.append(indices.tobytes())
+
+    return b"".join(parts)
+
+def encode_columns(times: Sequence[Any], columns: Dict[str, Sequence[Any]],
+                   compress_min_bytes: int = 1024) -> bytes:
+    """
+    Encode a time column plus named value columns.
+
+    Bodies of at least `compress_min_bytes` are zlib-compressed when that makes them smaller.
+    Raises ValueError when a column mixes numbers and strings.
+    """
+    micros = times_to_micros(times)
+    body = b"".join(
+        [BODY_HEADER.pack(len(times), len(columns)), micros.tobytes()]
+        + [_encode_column(name, values) for name, values in columns.items()]
+    )
+
+    flags = 0
+    if len(body) >= compress_min_bytes:
+        compressed = zlib.compress(body, 1)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_COMPRESSED
+
+    return HEADER.pack(MAGIC, VERSION, flags) + body
+
+def decode_columns(payload: bytes) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Decode to (epoch-microsecond int64 array, {name: column}).
+
+    Float columns come back as (float64 array, null mask); string columns as a list
+    with None for nulls. Returns None for payloads in an unknown format or version.
+    """
+    if len(payload) < HEADER.size:
+        return None
+    magic, version, flags = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    body = payload[HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+
+    rows, column_count = BODY_HEADER.unpack_from(body)
+    offset = BODY_HEADER.size
+    times = np.frombuffer(body, dtype="<i8", count=rows, offset=offset)
+    offset += rows * 8
+
+    columns: Dict[str, Any] = {}
+    for _ in range(column_count):
+        name_len = body[offset]
+        name = body[offset + 1:offset + 1 + name_len].decode()
+        offset += 1 + name_len
+        kind = body[offset]
+        offset += 1
+
+        if kind == KIND_FLOAT:
+            bitmap_len = (rows + 7) // 8
+            nulls = np.unpackbits(np.frombuffer(body, dtype=np.uint8, count=bitmap_len, offset=offset), count=rows).astype(bool)
+            offset += bitmap_len
+            values = np.frombuffer(body, dtype="<f8", count=rows, offset=offset)
+            offset += rows * 8
+            columns[name] = (values, nulls)
+        elif kind == KIND_STRING:
+            (string_count,) = struct.unpack_from("<I", body, offset)
+            offset += 4
+            table = []
+            for _ in range(string_count):
+                (length,) = struct.unpack_from("<I", body, offset)
+                offset += 4
+                table.append(body[offset:offset + length].decode())
+                offset += length
+            indices = np.frombuffer(body, dtype="<i4", count=rows, offset=offset)
+            offset += rows * 4
+            columns[name] = [None if index < 0 else table[index] for index in indices.tolist()]
+        else:
+            return None
+
+    return times, columns
+
+def column_values(column: Any) -> List[Any]:
+    """Python values of a decoded column, with None for nulls"""
+    if isinstance(column, list):
+        return column
+    values, nulls = column
+    result = values.tolist()
+    if nulls.any():
+        for index in np.flatnonzero(nulls).tolist():
+            result[index] = None
+    return result
+
+# A single-value query result as parallel columns: (times, values)
+Series = Tuple[List[datetime], List[Any]]
+
+def encode_series(times: Sequence[Any], values: Sequence[Any], compress_min_bytes: int = 1024) -> bytes:
+    """Encode a query result held as parallel time and value columns"""
+    return encode_columns(times, {"value": values}, compress_min_bytes)
+
+def decode_series(payload: bytes) -> Optional[Series]:
+    """Inverse of encode_series; None for payloads in an unknown format or version"""
+    decoded = decode_columns(payload)
+    if decoded is None:
+        return None
+    times, columns = decoded
+    return micros_to_datetimes(times), column_values(columns["value"])
+
+# Several value columns over one time axis, such as per-bucket partial aggregates
+Table = Tuple[List[datetime], Dict[str, List[Any]]]
+
+def encode_table(times: Sequence[Any], columns: Dict[str, Sequence[Any]], compress_min_bytes: int = 1024) -> bytes:
+    return encode_columns(times, columns, compress_min_bytes)
+
+def decode_table(payload: bytes) -> Optional[Table]:
+    """Inverse of encode_table; None for payloads in an unknown format or version"""
+    decoded = decode_columns(payload)
+    if decoded is None:
+        return None
+    times, columns = decoded
+    return micros_to_datetimes(times), {name: column_values(column) for name, column in columns.items()}
+
+def encode_rows(rows: List[Dict[str, Any]], compress_min_bytes: int = 1024) -> bytes:
+    """Encode query results shaped like [{"time": ..., "value": ...}, ...]"""
+    return encode_series([row["time"] for row in rows], [row["value"] for row in rows], compress_min_bytes)
+
+def decode_rows(payload: bytes) -> Optional[List[Dict[str, Any]]]:
+    """Inverse of encode_rows; None for payloads in an unknown format or version"""
+    series = decode_series(payload)
+    if series is None:
+        return None
+    return [{"time": time, "value": value} for time, value in zip(*series)]
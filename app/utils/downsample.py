@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+import numpy as np
+from utils.codec import Series
+
+# Chart-sized reductions of a query result, applied after the query (or cache) and
+# before serialization so response size follows max_points instead of the data.
+
+LTTB = "lttb"
+MINMAX = "minmax"
+
+def _naive_timestamp(value: datetime) -> float:
+    """Epoch seconds of a naive datetime taken as UTC, as elsewhere in query results"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points keeping the visual shape.
+
+    The first and last points are kept; the rest are split into equal-count buckets
+    and each keeps the point forming the largest triangle with the previous choice
+    and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Averages of every bucket, plus the last point standing in after the final one
+    bucket_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    bucket_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    next_x = np.append(bucket_x[1:], x[-1])
+    next_y = np.append(bucket_y[1:], y[-1])
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        low, high = edges[bucket], edges[bucket + 1]
+        area = np.abs(
+            (x[anchor] - next_x[bucket]) * (y[low:high] - y[anchor])
+            - (x[anchor] - x[low:high]) * (next_y[bucket] - y[anchor])
+        )
+        anchor = low + int(np.argmax(area))
+        indices[bucket + 1] = anchor
+    return indices
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indices of the minimum and maximum in each of max_points // 2 equal-time buckets.
+
+    Every bucket's extremes survive, so spikes stay visible at any zoom level.
+    """
+    n = len(x)
+    buckets = max_points // 2
+    if max_points >= n or buckets < 1:
+        return np.arange(n)
+
+    span = x[-1] - x[0]
+    bucket = np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1) if span else np.zeros(n, np.int64)
+    order = np.lexsort((y, bucket))
+    ordered = bucket[order]
+    boundaries = np.flatnonzero(np.diff(ordered)) + 1
+    firsts = order[np.concatenate(([0], boundaries))]
+    lasts = order[np.concatenate((boundaries - 1, [n - 1]))]
+    return np.unique(np.concatenate((firsts, lasts)))
+
+def downsample(series: Series, max_points: int, method: str = LTTB) -> Series:
+    """
+    Reduce a numeric (times, values) result to at most `max_points` points.
+
+    Null values are dropped first. Raises ValueError for text values.
+    """
+    times, values = series
+    if str in set(map(type, values)):
+        raise ValueError("Downsampling is only supported for numeric metrics")
+    # Nulls become NaN and are dropped; positions index back into the full series
+    y = np.array(values, dtype=np.float64)
+    present = np.flatnonzero(~np.isnan(y))
+    if len(present) <= max_points:
+        return [times[index] for index in present], y[present].tolist()
+
+    # Seconds from the first point keep the triangle areas well inside float precision
+    to_seconds = datetime.timestamp if times[0].tzinfo is not None else _naive_timestamp
+    x = np.fromiter(map(to_seconds, times), dtype=np.float64, count=len(times))[present]
+    x -= x[0]
+    y = y[present]
+
+    if method == MINMAX:
+        chosen = minmax_indices(x, y, max_points)
+    else:
+        chosen = lttb_indices(x, y, max_points)
+    return [times[index] for index in present[chosen]], y[chosen].tolist()
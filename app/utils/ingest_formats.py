@@ -0,0 +1,397 @@
+import os
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from utils.bulk_writer import Point
+from utils.codec import to_utc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import dotenv
+dotenv.load_dotenv()
+
+# Parsers for the streaming ingest formats. Each turns a run of complete text lines
+# straight into (time, metric, value) points for the bulk writer, with no model
+# object per point; the routes hand them bounded chunks of the request body.
+
+# Request body read per bulk write, and the longest line accepted
+INGEST_STREAM_CHUNK_BYTES = int(os.getenv("INGEST_STREAM_CHUNK_BYTES", 1024 * 1024))
+INGEST_STREAM_MAX_LINE_BYTES = int(os.getenv("INGEST_STREAM_MAX_LINE_BYTES", 1024 * 1024))
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Line protocol timestamp units as (multiplier, divisor) to microseconds
+PRECISIONS = {'ns': (1, 1000), 'us': (1, 1), 'ms': (1000, 1), 's': (1000000, 1)}
+
+TRUE_VALUES = frozenset({'t', 'T', 'true', 'True', 'TRUE'})
+FALSE_VALUES = frozenset({'f', 'F', 'false', 'False', 'FALSE'})
+
+class ParseError(ValueError):
+    """A line of a streamed upload that could not be parsed"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+# Characters backslash-escaped in stored metric names so split_metric_name() can undo metric_name()
+NAME_SPECIALS = frozenset('\\{}')
+TAG_SPECIALS = frozenset('\\{},=')
+
+def _escape(text: str, specials: frozenset) -> str:
+    if specials.isdisjoint(text):
+        return text
+    return ''.join('\\' + char if char in specials else char for char in text)
+
+def metric_name(name: str, tags: Optional[Dict[str, str]] = None) -> str:
+    """
+    The stored metric name of a series: the name, plus its tags sorted by key.
+
+    `temperature` with tags {device: a1} is stored as `temperature{device=a1}`. With
+    tags, backslashes and braces in the name, and those plus `,` and `=` in tag keys
+    and values, are escaped with a backslash: {loc: "a,b"} gives `temperature{loc=a\\,b}`.
+    """
+    if not tags:
+        return name
+    return _escape(name, NAME_SPECIALS) + '{' + ','.join(
+        f"{_escape(key, TAG_SPECIALS)}={_escape(tags[key], TAG_SPECIALS)}" for key in sorted(tags)
+    ) + '}'
+
+def split_metric_name(name: str) -> Tuple[str, Dict[str, str]]:
+    """The name and tags of a stored metric name; the inverse of metric_name()"""
+    if not name.endswith('}'):
+        return name, {}
+    base: Optional[str] = None
+    key: Optional[str] = None
+    tags: Dict[str, str] = {}
+    current: List[str] = []
+    index, end = 0, len(name) - 1
+    while index < end:
+        char = name[index]
+        if char == '\\':
+            if index + 1 == end:
+                # The closing brace itself is escaped
+                return name, {}
+            current.append(name[index + 1])
+            index += 2
+            continue
+        if base is None and char == '{':
+            base, current = ''.join(current), []
+        elif base is not None and key is None and char == '=':
+            key, current = ''.join(current), []
+        elif base is not None and key is not None and char == ',':
+            tags[key] = ''.join(current)
+            key, current = None, []
+        elif char in TAG_SPECIALS:
+            # Not something metric_name() produces, so an untagged name
+            return name, {}
+        else:
+            current.append(char)
+        index += 1
+    if key is None:
+        return name, {}
+    tags[key] = ''.join(current)
+    return base, tags
+
+def expand_rows(rows: Sequence[Any]) -> List[Point]:
+    """
+    Points of wide rows ({time, tags, fields}), one per field.
+
+    Each field is stored as the metric named by the field and the row's tags, as
+    in metric_name(); names are built once per distinct field and tag set. Times
+    are normalized to UTC, naive ones taken as UTC.
+    """
+    points: List[Point] = []
+    names: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], str] = {}
+    for row in rows:
+        time = to_utc(row.time)
+        if not row.tags:
+            points.extend((time, field, value) for field, value in row.fields.items())
+            continue
+        tag_key = tuple(sorted(row.tags.items()))
+        for field, value in row.fields.items():
+            name = names.get((field, tag_key))
+            if name is None:
+                name = names[(field, tag_key)] = metric_name(field, row.tags)
+            points.append((time, name, value))
+    return points
+
+def parse_time(value: Any) -> datetime:
+    """An ISO 8601 string or epoch seconds as a UTC datetime; naive times are taken as UTC"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return EPOCH + timedelta(seconds=value)
+    if not isinstance(value, str):
+        raise ValueError("time must be an ISO 8601 string or epoch seconds")
+    try:
+        return EPOCH + timedelta(seconds=float(value))
+    except ValueError:
+        pass
+    return to_utc(datetime.fromisoformat(value))
+
+def parse_cell(text: str) -> Any:
+    """A text value as a number, booleans as 1/0, anything else as a string; None when empty"""
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    lowered = text.lower()
+    if lowered == 'true':
+        return 1.0
+    if lowered == 'false':
+        return 0.0
+    return text
+
+def _split(text: str, separator: str) -> List[str]:
+    """Split on separators that are not backslash-escaped or inside double quotes"""
+    if '\\' not in text and '"' not in text:
+        return text.split(separator)
+    parts, current, quoted, index = [], [], False, 0
+    while index < len(text):
+        char = text[index]
+        if char == '\\' and index + 1 < len(text):
+            current.append(text[index:index + 2])
+            index += 2
+            continue
+        if char == '"':
+            quoted = not quoted
+        if char == separator and not quoted:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+        index += 1
+    parts.append(''.join(current))
+    return parts
+
+def _unescape(text: str) -> str:
+    if '\\' not in text:
+        return text
+    return text.replace('\\,', ',').replace('\\=', '=').replace('\\ ', ' ').replace('\\"', '"').replace('\\\\', '\\')
+
+def _pair(text: str) -> Tuple[str, str]:
+    """Split `key=value` on the first unescaped '='"""
+    if '\\' in text:
+        key, *rest = _split(text, '=')
+        value = '='.join(rest)
+    else:
+        key, _, value = text.partition('=')
+    if not key or not value:
+        raise ValueError(f"invalid key=value pair {text}")
+    return key, value
+
+def _field_value(text: str) -> Any:
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text.startswith('"'):
+        if len(text) < 2 or not text.endswith('"'):
+            raise ValueError(f"unterminated string field value {text}")
+        return text[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    if text in TRUE_VALUES:
+        return 1.0
+    if text in FALSE_VALUES:
+        return 0.0
+    if text.endswith(('i', 'u')):
+        return float(int(text[:-1]))
+    raise ValueError(f"invalid field value {text}")
+
+def _series(key: str) -> Tuple[str, Dict[str, str]]:
+    """The measurement and tags of a line protocol series key"""
+    measurement, *tags = _split(key, ',')
+    if not measurement:
+        raise ValueError("missing measurement")
+    return _unescape(measurement), {_unescape(name): _unescape(value) for name, value in map(_pair, tags)}
+
+def parse_line_protocol(lines: Sequence[str], first_line: int = 1, precision: str = 'ns',
+                        default_time: Optional[datetime] = None) -> List[Point]:
+    """
+    Points of Influx line protocol: `measurement[,tag=value...] field=value[,...] [timestamp]`.
+
+    Each field becomes the metric `measurement.field` (just `measurement` for a field
+    named `value`), with the line's tags appended as in metric_name(). Timestamps are
+    integers in `precision` units; lines without one get `default_time`.
+    """
+    multiplier, divisor = PRECISIONS[precision]
+    points: List[Point] = []
+    # Series repeat line after line, so metric names are built once per (series, field)
+    names: Dict[Tuple[str, str], str] = {}
+    for number, line in enumerate(lines, start=first_line):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            parts = [part for part in _split(line, ' ') if part]
+            if len(parts) not in (2, 3):
+                raise ValueError("expected a series, fields and an optional timestamp")
+            if len(parts) == 3:
+                time = EPOCH + timedelta(microseconds=int(parts[2]) * multiplier // divisor)
+            elif default_time is not None:
+                time = default_time
+            else:
+                raise ValueError("missing timestamp")
+
+            series_key = parts[0]
+            for field in _split(parts[1], ','):
+                key, value = _pair(field)
+                name = names.get((series_key, key))
+                if name is None:
+                    measurement, tags = _series(series_key)
+                    field_name = _unescape(key)
+                    name = measurement if field_name == 'value' else f"{measurement}.{field_name}"
+                    name = names[(series_key, key)] = metric_name(name, tags)
+                points.append((time, name, _field_value(value)))
+        except (ValueError, OverflowError) as e:
+            raise ParseError(number, str(e))
+    return points
+
+def _point_from_object(item: Any) -> Point:
+    if not isinstance(item, dict):
+        raise ValueError("expected a JSON object")
+    metric, value = item.get('metric'), item.get('value')
+    if not isinstance(metric, str) or not metric:
+        raise ValueError("metric must be a non-empty string")
+    if isinstance(value, (bool, int, float)):
+        value = float(value)
+    elif not isinstance(value, str):
+        raise ValueError("value must be a number or a string")
+    if 'time' not in item:
+        raise ValueError("missing time")
+    return parse_time(item['time']), metric, value
+
+def parse_ndjson(lines: Sequence[str], first_line: int = 1) -> List[Point]:
+    """Points of newline-delimited JSON, one {"time", "metric", "value"} object per line"""
+    loads = orjson.loads if orjson is not None else json.loads
+    points: List[Point] = []
+    for number, line in enumerate(lines, start=first_line):
+        if not line.strip():
+            continue
+        try:
+            points.append(_point_from_object(loads(line)))
+        except (ValueError, TypeError, OverflowError) as e:
+            raise ParseError(number, str(e))
+    return points
+
+class CsvParser:
+    """
+    Parse CSV chunks, the first of which starts with the header row.
+
+    The time column is `time` or `ts` (ISO 8601 or epoch seconds). With `metric` and
+    `value` columns each row is one point; otherwise every other column is a metric
+    and each row holds one sample of each, with empty cells skipped. Records must
+    not span lines.
+    """
+
+    def __init__(self):
+        self.columns: Optional[List[str]] = None
+
+    def _read_header(self, header: str) -> None:
+        self.columns = [column.strip() for column in next(csv.reader([header]), [])]
+        time_columns = [column for column in ('time', 'ts') if column in self.columns]
+        if not time_columns:
+            raise ParseError(1, "CSV header needs a time or ts column")
+        self.time_index = self.columns.index(time_columns[0])
+        self.long = 'metric' in self.columns and 'value' in self.columns
+        if self.long:
+            self.metric_index = self.columns.index('metric')
+            self.value_index = self.columns.index('value')
+        else:
+            self.metrics = [(index, column) for index, column in enumerate(self.columns)
+                            if index != self.time_index and column]
+            if not self.metrics:
+                raise ParseError(1, "CSV header has no metric columns")
+
+    def __call__(self, lines: Sequence[str], first_line: int = 1) -> List[Point]:
+        if self.columns is None:
+            if not lines:
+                return []
+            self._read_header(lines[0])
+            lines, first_line = lines[1:], first_line + 1
+
+        points: List[Point] = []
+        width = len(self.columns)
+        for number, row in enumerate(csv.reader(lines), start=first_line):
+            if not row:
+                continue
+            try:
+                if len(row) != width:
+                    raise ValueError(f"expected {width} columns, got {len(row)}")
+                time = parse_time(row[self.time_index])
+                if self.long:
+                    value = parse_cell(row[self.value_index])
+                    if not row[self.metric_index] or value is None:
+                        raise ValueError("metric and value are required")
+                    points.append((time, row[self.metric_index], value))
+                    continue
+                for index, metric in self.metrics:
+                    value = parse_cell(row[index])
+                    if value is not None:
+                        points.append((time, metric, value))
+            except (ValueError, OverflowError) as e:
+                raise ParseError(number, str(e))
+        return points
+
+class LineChunker:
+    """
+    Cut a streamed body into chunks of whole lines of at least `chunk_bytes` each.
+
+    Only the unfinished last line is carried between `feed()` calls, and one longer
+    than `max_line_bytes` is rejected, so memory stays bounded by the chunk size.
+    Chunks come with the line number of their first line.
+    """
+
+    def __init__(self, chunk_bytes: int, max_line_bytes: int):
+        self.chunk_bytes = chunk_bytes
+        self.max_line_bytes = max_line_bytes
+        self._parts: List[bytes] = []
+        self._size = 0
+        self._tail = b''
+        self._next_line = 1
+
+    def feed(self, data: bytes) -> Iterator[Tuple[int, bytes]]:
+        """Add body bytes; yields every chunk of enough complete lines now waiting"""
+        data = self._tail + data
+        start = 0
+        while True:
+            # Cut at the first line end once the chunk would reach chunk_bytes
+            cut = data.find(b'\n', start + max(0, self.chunk_bytes - self._size - 1)) + 1
+            if not cut:
+                break
+            self._parts.append(data[start:cut])
+            self._size += cut - start
+            start = cut
+            yield self._take()
+        cut = data.rfind(b'\n', start) + 1
+        if cut:
+            self._parts.append(data[start:cut])
+            self._size += cut - start
+            start = cut
+        self._tail = data[start:]
+        if len(self._tail) > self.max_line_bytes:
+            line = self._next_line + sum(part.count(b'\n') for part in self._parts)
+            raise ParseError(line, f"line longer than {self.max_line_bytes} bytes")
+
+    def finish(self) -> Optional[Tuple[int, bytes]]:
+        """The remaining lines at the end of the body, if any"""
+        if self._tail:
+            self._parts.append(self._tail + b'\n')
+            self._tail = b''
+        return self._take() if self._parts else None
+
+    def _take(self) -> Tuple[int, bytes]:
+        chunk = b''.join(self._parts)
+        first_line = self._next_line
+        self._parts, self._size = [], 0
+        self._next_line += chunk.count(b'\n')
+        return first_line, chunk
+
+def chunk_lines(chunk: bytes, first_line: int = 1) -> List[str]:
+    """The text lines of a chunk from LineChunker"""
+    try:
+        return chunk.decode('utf-8').split('\n')[:-1]
+    except UnicodeDecodeError as e:
+        raise ParseError(first_line, f"body is not valid UTF-8: {e}")
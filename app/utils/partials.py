@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from utils.codec import Series, Table
+
+# Aggregated queries are computed from per-bucket partials, which are cached next
+# to the finished result. A coarser interval over the same window is then rebuilt
+# in-process from any finer interval whose buckets tile it, without a database
+# round trip; AVG comes out exactly as sum / value_count.
+
+PARTIAL_COLUMNS = ('sum', 'count', 'value_count', 'min', 'max')
+
+# Aggregations finalize() can finish from partials; the rest always run in the database
+PARTIAL_AGGREGATIONS = frozenset({'avg', 'sum', 'min', 'max', 'count'})
+
+# Fixed bucket widths of the query intervals; '1 month' is calendar months
+WIDTHS: Dict[str, timedelta] = {
+    '1 second': timedelta(seconds=1), '5 seconds': timedelta(seconds=5),
+    '10 seconds': timedelta(seconds=10), '30 seconds': timedelta(seconds=30),
+    '1 minute': timedelta(minutes=1), '5 minutes': timedelta(minutes=5),
+    '10 minutes': timedelta(minutes=10), '30 minutes': timedelta(minutes=30),
+    '1 hour': timedelta(hours=1), '2 hours': timedelta(hours=2),
+    '6 hours': timedelta(hours=6), '12 hours': timedelta(hours=12),
+    '1 day': timedelta(days=1), '7 days': timedelta(days=7)
+}
+MONTH = '1 month'
+
+# time_bucket's default origin (a Monday), which every fixed-width bucket is aligned to
+ORIGIN = datetime(2000, 1, 3, tzinfo=timezone.utc)
+
+def tiles(fine: str, coarse: str) -> bool:
+    """True when every `coarse` bucket is an exact union of `fine` buckets"""
+    if fine == coarse or fine not in WIDTHS:
+        return False
+    if coarse == MONTH:
+        # Months start at midnight, so anything that divides a day tiles them
+        return timedelta(days=1) % WIDTHS[fine] == timedelta(0)
+    return coarse in WIDTHS and WIDTHS[coarse] % WIDTHS[fine] == timedelta(0)
+
+def finer_intervals(interval: str) -> List[str]:
+    """Intervals whose partials can be rebucketed into `interval`, coarsest (fewest buckets) first"""
+    finer = [fine for fine in WIDTHS if tiles(fine, interval)]
+    return sorted(finer, key=WIDTHS.__getitem__, reverse=True)
+
+def bucket_start(timestamp: datetime, interval: str) -> datetime:
+    """The start of the `interval` bucket holding `timestamp`, as time_bucket computes it"""
+    timestamp = timestamp.astimezone(timezone.utc)
+    if interval == MONTH:
+        return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    width = WIDTHS[interval]
+    return ORIGIN + ((timestamp - ORIGIN) // width) * width
+
+def partials_from_rows(rows: Sequence[Sequence[Any]]) -> Table:
+    """Rows of (bucket, sum, count, value_count, min, max) as a table of floats"""
+    # SUM over bigint counts comes back as Decimal from the rollup queries
+    columns = {
+        name: [None if row[index] is None else float(row[index]) for row in rows]
+        for index, name in enumerate(PARTIAL_COLUMNS, start=1)
+    }
+    return [row[0] for row in rows], columns
+
+def _add(left: Optional[float], right: Optional[float]) -> Optional[float]:
+    if left is None:
+        return right
+    return left if right is None else left + right
+
+def _least(left: Optional[float], right: Optional[float]) -> Optional[float]:
+    if left is None:
+        return right
+    return left if right is None else min(left, right)
+
+def _greatest(left: Optional[float], right: Optional[float]) -> Optional[float]:
+    if left is None:
+        return right
+    return left if right is None else max(left, right)
+
+def rebucket(partials: Table, interval: str) -> Table:
+    """Combine time-ordered partials into `interval` buckets"""
+    times, columns = partials
+    out_times: List[datetime] = []
+    out = {name: [] for name in PARTIAL_COLUMNS}
+    for index, time in enumerate(times):
+        bucket = bucket_start(time, interval)
+        if out_times and out_times[-1] == bucket:
+            out['sum'][-1] = _add(out['sum'][-1], columns['sum'][index])
+            out['count'][-1] += columns['count'][index]
+            out['value_count'][-1] += columns['value_count'][index]
+            out['min'][-1] = _least(out['min'][-1], columns['min'][index])
+            out['max'][-1] = _greatest(out['max'][-1], columns['max'][index])
+        else:
+            out_times.append(bucket)
+            for name in PARTIAL_COLUMNS:
+                out[name].append(columns[name][index])
+    return out_times, out
+
+def finalize(partials: Table, aggregation: str) -> Series:
+    """The (times, values) result of `aggregation` over partials"""
+    times, columns = partials
+    if aggregation == 'avg':
+        values = [
+            total / value_count if value_count else None
+            for total, value_count in zip(columns['sum'], columns['value_count'])
+        ]
+    else:
+        values = columns[aggregation]
+    return list(times), [None if value is None else float(value) for value in values]
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, NamedTuple, Optional
+import dotenv
+dotenv.load_dotenv()
+
+class MetricEntry(NamedTuple):
+    id: int
+    value_type: str
+    first_seen: datetime
+    last_seen: datetime
+
+class MetricRegistry:
+    """
+    Bounded in-process LRU of metric name -> MetricEntry, with a per-entry TTL.
+
+    Entries must only be written after the transaction that produced them commits,
+    so a rolled-back metric never becomes visible here.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, name: str) -> Optional[MetricEntry]:
+        """Return the cached entry for a metric, or None if absent or expired"""
+        with self._lock:
+            cached = self._entries.get(name)
+            if cached is None:
+                self._misses += 1
+                return None
+            entry, expires_at = cached
+            if time.monotonic() >= expires_at:
+                del self._entries[name]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self._hits += 1
+            return entry
+
+    def put(self, name: str, entry: MetricEntry) -> None:
+        """Insert or replace an entry, evicting the least recently used beyond max_entries"""
+        with self._lock:
+            self._entries[name] = (entry, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def update(self, entries: Dict[str, MetricEntry]) -> None:
+        """Apply entries returned by a committed metrics upsert"""
+        for name, entry in entries.items():
+            self.put(name, entry)
+
+    def invalidate(self, name: str) -> None:
+        """Drop a metric so the next lookup goes to Postgres"""
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def warm(self, cursor) -> int:
+        """Load the most recently active metrics, up to max_entries"""
+        cursor.execute('''
+            SELECT id, name, value_type, first_seen, last_seen
+            FROM metrics
+            ORDER BY last_seen DESC
+            LIMIT %s
+        ''', (self.max_entries,))
+        rows = cursor.fetchall()
+        # Insert least recent first so the most recent end up at the MRU end
+        for row in reversed(rows):
+            self.put(row['name'], entry_from_row(row))
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses
+            }
+
+def entry_from_row(row) -> MetricEntry:
+    return MetricEntry(row['id'], row['value_type'], row['first_seen'], row['last_seen'])
+
+def lookup_metric(cursor, name: str) -> Optional[MetricEntry]:
+    """Resolve a metric through the registry, falling back to the metrics table"""
+    entry = metric_registry.get(name)
+    if entry is not None:
+        return entry
+
+    cursor.execute('SELECT id, value_type, first_seen, last_seen FROM metrics WHERE name = %s', (name,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+
+    entry = entry_from_row(row)
+    metric_registry.put(name, entry)
+    return entry
+
+def lookup_metrics(cursor, names: List[str]) -> Dict[str, MetricEntry]:
+    """Resolve several metrics, reading only registry misses from the metrics table in one query"""
+    entries: Dict[str, MetricEntry] = {}
+    missing = []
+    for name in names:
+        entry = metric_registry.get(name)
+        if entry is not None:
+            entries[name] = entry
+        else:
+            missing.append(name)
+
+    if missing:
+        cursor.execute(
+            'SELECT id, name, value_type, first_seen, last_seen FROM metrics WHERE name = ANY(%s)',
+            (missing,)
+        )
+        for row in cursor.fetchall():
+            entry = entry_from_row(row)
+            metric_registry.put(row['name'], entry)
+            entries[row['name']] = entry
+    return entries
+
+metric_registry = MetricRegistry(
+    max_entries=int(os.getenv("METRIC_REGISTRY_SIZE", 10000)),
+    ttl_seconds=float(os.getenv("METRIC_REGISTRY_TTL", 300))
+)
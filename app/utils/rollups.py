@@ -0,0 +1,224 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+import dotenv
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Route aggregated queries through the continuous aggregates below when they can answer exactly
+QUERY_ROLLUPS = os.getenv("QUERY_ROLLUPS", "true").lower() in ("1", "true", "yes")
+
+class Rollup(NamedTuple):
+    view: str
+    bucket: str
+    width: timedelta
+    schedule: str
+
+# Coarsest first. Each holds per-metric partials (sum, count, value_count, min, max),
+# so any coarser bucket can be rebuilt exactly from whole rollup buckets.
+ROLLUPS: List[Rollup] = [
+    Rollup("time_series_1d", "1 day", timedelta(days=1), "1 hour"),
+    Rollup("time_series_1h", "1 hour", timedelta(hours=1), "10 minutes"),
+    Rollup("time_series_1m", "1 minute", timedelta(minutes=1), "1 minute")
+]
+
+# Bucket widths of the intervals rollups can serve; '1 month' buckets are calendar
+# months, which whole days always tile.
+INTERVAL_WIDTHS: Dict[str, timedelta] = {
+    '1 minute': timedelta(minutes=1), '5 minutes': timedelta(minutes=5),
+    '10 minutes': timedelta(minutes=10), '30 minutes': timedelta(minutes=30),
+    '1 hour': timedelta(hours=1), '2 hours': timedelta(hours=2),
+    '6 hours': timedelta(hours=6), '12 hours': timedelta(hours=12),
+    '1 day': timedelta(days=1), '7 days': timedelta(days=7), '1 month': timedelta(days=1)
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Schema of TimescaleDB's internal functions; set by enable_rollups(), None while rollups are off
+_function_schema: Optional[str] = None
+
+def create_rollups(cursor) -> None:
+    """Create the continuous aggregates and their refresh policies (idempotent)"""
+    for rollup in ROLLUPS:
+        cursor.execute(f'''
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup.view}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = true) AS
+            SELECT
+                metric_id,
+                time_bucket('{rollup.bucket}', time) AS bucket,
+                SUM(value) AS sum,
+                COUNT(*) AS count,
+                COUNT(value) AS value_count,
+                MIN(value) AS min,
+                MAX(value) AS max
+            FROM time_series_data
+            GROUP BY metric_id, bucket
+            WITH NO DATA
+        ''')
+        # No start offset: every refresh also re-materializes late data anywhere in the past
+        cursor.execute(f'''
+            SELECT add_continuous_aggregate_policy('{rollup.view}',
+                start_offset => NULL,
+                end_offset => INTERVAL '{rollup.bucket}',
+                schedule_interval => INTERVAL '{rollup.schedule}',
+                if_not_exists => TRUE)
+        ''')
+
+def enable_rollups(cursor) -> bool:
+    """Turn on rollup planning if the TimescaleDB catalog functions it reads exist"""
+    global _function_schema
+    _function_schema = None
+    if not QUERY_ROLLUPS:
+        return False
+    # TimescaleDB 2.12 moved its internal functions from _timescaledb_internal
+    for schema in ('_timescaledb_functions', '_timescaledb_internal'):
+        cursor.execute("SELECT to_regproc(%s) IS NOT NULL AS present", (f"{schema}.cagg_watermark",))
+        if cursor.fetchone()['present']:
+            _function_schema = schema
+            return True
+    logger.warning("Continuous aggregate watermarks unavailable; aggregations will read raw data")
+    return False
+
+def _from_internal(value: Optional[int]) -> Optional[datetime]:
+    """TimescaleDB internal time (Unix epoch microseconds) to a datetime; None when unbounded"""
+    if value is None:
+        return None
+    try:
+        return EPOCH + timedelta(microseconds=value)
+    except OverflowError:
+        return datetime.min.replace(tzinfo=timezone.utc) if value < 0 else None
+
+def read_watermarks(cursor) -> Dict[str, datetime]:
+    """
+    For each rollup, the time before which it is complete and current.
+
+    That is the materialization watermark, lowered to the earliest change the rollup
+    has not yet absorbed (pending invalidations from late or backfilled data).
+    """
+    cursor.execute(f'''
+        SELECT
+            ca.user_view_name AS view,
+            {_function_schema}.cagg_watermark(ca.mat_hypertable_id) AS watermark,
+            (SELECT MIN(lowest_modified_value)
+             FROM _timescaledb_catalog.continuous_aggs_hypertable_invalidation_log h
+             WHERE h.hypertable_id = ca.raw_hypertable_id) AS pending_raw,
+            (SELECT MIN(lowest_modified_value)
+             FROM _timescaledb_catalog.continuous_aggs_materialization_invalidation_log m
+             WHERE m.materialization_id = ca.mat_hypertable_id) AS pending_materialization
+        FROM _timescaledb_catalog.continuous_agg ca
+        WHERE ca.user_view_name = ANY(%s)
+    ''', ([rollup.view for rollup in ROLLUPS],))
+
+    watermarks = {}
+    for row in cursor.fetchall():
+        bounds = [row[column] for column in ('watermark', 'pending_raw', 'pending_materialization')]
+        complete_until = min(value for value in bounds if value is not None)
+        watermark = _from_internal(complete_until)
+        if watermark is not None and watermark > EPOCH:
+            watermarks[row['view']] = watermark
+    return watermarks
+
+def _floor(timestamp: datetime, width: timedelta) -> datetime:
+    return EPOCH + ((timestamp - EPOCH) // width) * width
+
+def _ceil(timestamp: datetime, width: timedelta) -> datetime:
+    floored = _floor(timestamp, width)
+    return floored if floored == timestamp else floored + width
+
+def _utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+class RollupPlan(NamedTuple):
+    """Serve whole `rollup` buckets in [start, end); raw rows cover the rest of the window"""
+    rollup: Rollup
+    start: datetime
+    end: datetime
+    raw_edges: bool
+
+    @property
+    def source(self) -> str:
+        return f"{self.rollup.view}+raw" if self.raw_edges else self.rollup.view
+
+def plan_rollup(interval: str, start_time: datetime, end_time: datetime,
+                watermarks: Dict[str, datetime]) -> Optional[RollupPlan]:
+    """
+    Pick the coarsest rollup that tiles `interval` and has complete buckets in the window.
+
+    Returns None when raw data has to answer the whole query.
+    """
+    width = INTERVAL_WIDTHS.get(interval)
+    if width is None:
+        return None
+
+    start = _utc(start_time)
+    # BETWEEN is inclusive, so a bucket ending exactly one microsecond after end_time still fits
+    end_exclusive = _utc(end_time) + timedelta(microseconds=1)
+
+    for rollup in ROLLUPS:
+        if width % rollup.width or rollup.view not in watermarks:
+            continue
+        interior_start = _ceil(start, rollup.width)
+        interior_end = _floor(min(end_exclusive, watermarks[rollup.view]), rollup.width)
+        if interior_start < interior_end:
+            raw_edges = interior_start > start or interior_end < end_exclusive
+            return RollupPlan(rollup, interior_start, interior_end, raw_edges)
+    return None
+
+def plan_query(cursor, interval: str, start_time: datetime, end_time: datetime) -> Optional[RollupPlan]:
+    """Plan an aggregated query against the current rollup watermarks"""
+    if _function_schema is None or interval not in INTERVAL_WIDTHS:
+        return None
+    return plan_rollup(interval, start_time, end_time, read_watermarks(cursor))
+
+# How each aggregation is rebuilt from rollup partials
+COMBINE = {
+    'avg': 'SUM(sum) / NULLIF(SUM(value_count), 0)::double precision',
+    'sum': 'SUM(sum)',
+    'min': 'MIN(min)',
+    'max': 'MAX(max)',
+    'count': 'SUM(count)'
+}
+
+# Combined partials themselves, the columns of utils/partials.py
+COMBINE_PARTIALS = 'SUM(sum) AS sum, SUM(count) AS count, SUM(value_count) AS value_count, MIN(min) AS min, MAX(max) AS max'
+
+def rollup_query(plan: RollupPlan, aggregation: Optional[str], interval: str, batch: bool = False) -> str:
+    """
+    SQL combining rollup buckets inside the plan with raw partials for the edges.
+
+    Parameters are named: metric (an id, or a list of ids when `batch`), start, end,
+    rollup_start and rollup_end. Batch queries also select and group by metric_id.
+    With no aggregation the partial columns are selected instead of a value.
+    """
+    selected = COMBINE_PARTIALS if aggregation is None else f"{COMBINE[aggregation]} AS value"
+    metric_filter = "metric_id = ANY(%(metric)s)" if batch else "metric_id = %(metric)s"
+    metric_column = "metric_id, " if batch else ""
+    group_by = "metric_id, bucket" if batch else "bucket"
+    return f'''
+        SELECT {metric_column}time_bucket('{interval}', part_bucket) AS bucket,
+               {selected}
+        FROM (
+            SELECT metric_id, bucket AS part_bucket, sum, count, value_count, min, max
+            FROM {plan.rollup.view}
+            WHERE {metric_filter} AND bucket >= %(rollup_start)s AND bucket < %(rollup_end)s
+            UNION ALL
+            SELECT metric_id, time_bucket('{plan.rollup.bucket}', time),
+                   SUM(value), COUNT(*), COUNT(value), MIN(value), MAX(value)
+            FROM time_series_data
+            WHERE {metric_filter} AND time BETWEEN %(start)s AND %(end)s
+              AND (time < %(rollup_start)s OR time >= %(rollup_end)s)
+            GROUP BY 1, 2
+        ) parts
+        GROUP BY {group_by}
+        ORDER BY {group_by}
+    '''
+
+def rollup_params(plan: RollupPlan, metric, start_time: datetime, end_time: datetime) -> Dict[str, object]:
+    return {
+        "metric": metric, "start": start_time, "end": end_time,
+        "rollup_start": plan.start, "rollup_end": plan.end
+    }
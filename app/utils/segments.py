@@ -0,0 +1,120 @@
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Tuple
+from utils.codec import Table
+from utils.partials import WIDTHS, ORIGIN, PARTIAL_COLUMNS, bucket_start
+import dotenv
+dotenv.load_dotenv()
+
+# Rolling windows such as [now - 24h, now] never repeat a cache key, so aggregated
+# queries are also cached as immutable segments: fixed runs of buckets aligned to
+# time_bucket's origin, holding per-bucket partials. Each request reads the settled
+# segments it overlaps from the cache and only asks the database for segments it has
+# never seen, the partial first bucket and the unsettled tail.
+
+# Buckets per cached segment
+CACHE_SEGMENT_BUCKETS = int(os.getenv("CACHE_SEGMENT_BUCKETS", 12))
+# Windows spanning more segments than this are served by one query instead;
+# every segment costs a cache read per request and an index entry
+CACHE_SEGMENT_MAX = int(os.getenv("CACHE_SEGMENT_MAX", 256))
+
+Span = Tuple[datetime, datetime]
+
+class Segment(NamedTuple):
+    start: datetime
+    end: datetime
+
+    @property
+    def last(self) -> datetime:
+        """The inclusive end, as the cached window of the segment"""
+        return self.end - timedelta(microseconds=1)
+
+class SegmentPlan(NamedTuple):
+    """
+    How to assemble an aggregated window from cached segments.
+
+    Whole buckets in [inner_start, covered_end) come from `segments`; `head` (the
+    partial first bucket) and `live` (everything after the last settled segment)
+    are read from the database and never cached as segments. Spans are half-open.
+    """
+    segments: List[Segment]
+    inner_start: datetime
+    covered_end: datetime
+    head: Optional[Span]
+    live: Optional[Span]
+
+def _utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+def plan_segments(interval: str, start_time: datetime, end_time: datetime,
+                  settled_before: datetime, buckets: int = CACHE_SEGMENT_BUCKETS,
+                  max_segments: int = CACHE_SEGMENT_MAX) -> Optional[SegmentPlan]:
+    """
+    Split a query window into settled segments plus database edges.
+
+    Returns None for calendar intervals, for windows that overlap no settled
+    segment and for windows needing more than `max_segments` segments, which are
+    all better served by one query.
+    """
+    width = WIDTHS.get(interval)
+    if width is None or buckets < 1:
+        return None
+
+    start = _utc(start_time)
+    # BETWEEN is inclusive, so the window ends one microsecond after end_time
+    end_exclusive = _utc(end_time) + timedelta(microseconds=1)
+    inner_start = bucket_start(start, interval)
+    if inner_start < start:
+        inner_start += width
+    inner_end = bucket_start(end_exclusive, interval)
+    if inner_start >= inner_end:
+        return None
+
+    segment_width = width * buckets
+    segment_start = ORIGIN + ((inner_start - ORIGIN) // segment_width) * segment_width
+    if -(-(inner_end - segment_start) // segment_width) > max_segments:
+        return None
+
+    segments = []
+    while segment_start < inner_end and segment_start + segment_width <= settled_before:
+        segments.append(Segment(segment_start, segment_start + segment_width))
+        segment_start += segment_width
+    if not segments:
+        return None
+
+    covered_end = min(segments[-1].end, inner_end)
+    head = (start, inner_start) if start < inner_start else None
+    live = (covered_end, end_exclusive) if covered_end < end_exclusive else None
+    return SegmentPlan(segments, inner_start, covered_end, head, live)
+
+def missing_runs(segments: List[Segment], cached: List[Optional[Table]]) -> List[List[Segment]]:
+    """Consecutive segments missing from the cache, each run fetched with one query"""
+    runs: List[List[Segment]] = []
+    previous_missing = False
+    for segment, table in zip(segments, cached):
+        if table is None:
+            if previous_missing:
+                runs[-1].append(segment)
+            else:
+                runs.append([segment])
+        previous_missing = table is None
+    return runs
+
+def slice_table(table: Table, start: datetime, end: datetime) -> Table:
+    """The buckets of a time-ordered partials table in [start, end)"""
+    times, columns = table
+    low, high = bisect_left(times, start), bisect_left(times, end)
+    return times[low:high], {name: values[low:high] for name, values in columns.items()}
+
+def concat_tables(tables: List[Table]) -> Table:
+    """Join time-ordered, non-overlapping partials tables"""
+    times: List[datetime] = []
+    columns = {name: [] for name in PARTIAL_COLUMNS}
+    for table_times, table_columns in tables:
+        times.extend(table_times)
+        for name in PARTIAL_COLUMNS:
+            columns[name].extend(table_columns[name])
+    return times, columns
@@ -0,0 +1,148 @@
+import json
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from fastapi.responses import JSONResponse, Response
+from utils.codec import Series, encode_series, times_to_micros
+from utils.ingest_formats import split_metric_name
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Query results skip per-row QueryResponse models: rows from a tuple cursor become
+# (times, values) columns or plain {"time", "value"} dicts (already the validated
+# shape) and are encoded in one pass.
+
+# Columnar alternatives to the default list of points, selected with the Accept header
+COLUMNS_JSON_MEDIA_TYPE = "application/vnd.timeseries.columns+json"
+COLUMNS_BINARY_MEDIA_TYPE = "application/vnd.timeseries.columns"
+
+def row_value(row: Sequence[Any]) -> Any:
+    """
+    The QueryResponse value of a query row.
+
+    Raw rows are (time, value, text_value); aggregated rows are (bucket, value).
+    """
+    value = row[2] if len(row) > 2 and row[2] is not None else row[1]
+    if value is not None and not isinstance(value, str):
+        value = float(value)
+    return value
+
+def point_from_row(row: Sequence[Any]) -> Dict[str, Any]:
+    """Turn a query row into a QueryResponse-shaped dict"""
+    return {"time": row[0], "value": row_value(row)}
+
+def points_from_rows(rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    return [point_from_row(row) for row in rows]
+
+def series_from_rows(rows: Sequence[Sequence[Any]]) -> Series:
+    """Split query rows into (times, values) columns"""
+    return [row[0] for row in rows], [row_value(row) for row in rows]
+
+def points_from_series(series: Series) -> List[Dict[str, Any]]:
+    return [{"time": time, "value": value} for time, value in zip(*series)]
+
+def columns_media_type(accept: Optional[str]) -> Optional[str]:
+    """The columnar media type named in an Accept header, if any"""
+    if not accept:
+        return None
+    for part in accept.split(","):
+        media_type = part.split(";", 1)[0].strip()
+        if media_type in (COLUMNS_JSON_MEDIA_TYPE, COLUMNS_BINARY_MEDIA_TYPE):
+            return media_type
+    return None
+
+def format_time(value: datetime) -> str:
+    """ISO 8601 with "Z" for UTC, the form FastAPI gives QueryResponse.time"""
+    if value.tzinfo is not None and value.utcoffset() == timezone.utc.utcoffset(None):
+        return value.replace(tzinfo=None).isoformat() + "Z"
+    return value.isoformat()
+
+def _dumps_point(point: Dict[str, Any]) -> str:
+    return f'{{"time":"{format_time(point["time"])}","value":{json.dumps(point["value"])}}}'
+
+def dumps_points(points: List[Dict[str, Any]]) -> bytes:
+    """Encode points as a JSON array, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(points, option=orjson.OPT_UTC_Z)
+    return ("[" + ",".join(_dumps_point(point) for point in points) + "]").encode()
+
+def dumps_point_lines(points: List[Dict[str, Any]]) -> bytes:
+    """Encode points as NDJSON, one object per line"""
+    if orjson is not None:
+        return b"".join(orjson.dumps(point, option=orjson.OPT_UTC_Z) + b"\n" for point in points)
+    return "".join(_dumps_point(point) + "\n" for point in points).encode()
+
+def dumps_grouped_points(groups: Dict[str, List[Dict[str, Any]]]) -> bytes:
+    """Encode {metric: [points]} as a JSON object"""
+    if orjson is not None:
+        return orjson.dumps(groups, option=orjson.OPT_UTC_Z)
+    return ("{" + ",".join(
+        f"{json.dumps(name)}:" + dumps_points(points).decode() for name, points in groups.items()
+    ) + "}").encode()
+
+def wide_rows(results: Dict[str, Series]) -> List[Dict[str, Any]]:
+    """
+    Per-metric results as time-ordered {"time", "tags", "fields"} rows, the shape of
+    wide-row ingest: metrics sharing a timestamp and tag set land in one row.
+    """
+    rows: Dict[Any, Dict[str, Any]] = {}
+    for name, (times, values) in results.items():
+        field, tags = split_metric_name(name)
+        tag_key = name[len(field):]
+        for time, value in zip(times, values):
+            row = rows.get((time, tag_key))
+            if row is None:
+                row = rows[(time, tag_key)] = {"time": time, "tags": tags, "fields": {}}
+            row["fields"][field] = value
+    return sorted(rows.values(), key=itemgetter("time"))
+
+def _dumps_wide_row(row: Dict[str, Any]) -> str:
+    return (f'{{"time":"{format_time(row["time"])}","tags":{json.dumps(row["tags"])},'
+            f'"fields":{json.dumps(row["fields"])}}}')
+
+def dumps_wide_rows(rows: List[Dict[str, Any]]) -> bytes:
+    """Encode wide rows as a JSON array"""
+    if orjson is not None:
+        return orjson.dumps(rows, option=orjson.OPT_UTC_Z)
+    return ("[" + ",".join(_dumps_wide_row(row) for row in rows) + "]").encode()
+
+class PointsResponse(JSONResponse):
+    """JSON response for query points that are already in QueryResponse shape"""
+
+    def render(self, content: List[Dict[str, Any]]) -> bytes:
+        return dumps_points(content)
+
+class GroupedPointsResponse(JSONResponse):
+    """JSON response for query points grouped by metric"""
+
+    def render(self, content: Dict[str, List[Dict[str, Any]]]) -> bytes:
+        return dumps_grouped_points(content)
+
+class WideRowsResponse(JSONResponse):
+    """JSON response for batch results as wide rows"""
+
+    def render(self, content: List[Dict[str, Any]]) -> bytes:
+        return dumps_wide_rows(content)
+
+class ColumnsResponse(Response):
+    """
+    A query result as parallel columns.
+
+    JSON: {"times": [epoch microseconds], "values": [...]}. Binary: the columnar
+    format of utils/codec.py, readable with `decode_columns`.
+    """
+
+    def __init__(self, series: Series, media_type: str = COLUMNS_JSON_MEDIA_TYPE, **kwargs: Any):
+        super().__init__(series, media_type=media_type, **kwargs)
+
+    def render(self, content: Series) -> bytes:
+        times, values = content
+        if self.media_type == COLUMNS_BINARY_MEDIA_TYPE:
+            return encode_series(times, values)
+        micros = times_to_micros(times)
+        if orjson is not None:
+            return orjson.dumps({"times": micros, "values": values}, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps({"times": micros.tolist(), "values": values}, separators=(",", ":")).encode()
@@ -0,0 +1,116 @@
+import json
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, List, Optional, Sequence
+import psycopg2
+import psycopg2.extensions
+from database import get_pool, DB_STREAM_MAX_CONNECTIONS
+from async_database import run_stream
+from utils.serialization import points_from_rows, dumps_points, dumps_point_lines
+import dotenv
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip from a server-side cursor; also the rows per response chunk
+QUERY_STREAM_ITERSIZE = int(os.getenv("QUERY_STREAM_ITERSIZE", 5000))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Open streams hold a pooled connection each for as long as the client reads
+_stream_slots = threading.BoundedSemaphore(DB_STREAM_MAX_CONNECTIONS)
+
+class StreamLimitError(Exception):
+    """Raised when DB_STREAM_MAX_CONNECTIONS streams are already open"""
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """True when the Accept header asks for newline-delimited JSON"""
+    if not accept:
+        return False
+    return any(part.split(";", 1)[0].strip() == NDJSON_MEDIA_TYPE for part in accept.split(","))
+
+class RowStream:
+    """
+    A query running on a server-side (named) cursor, read in chunks of `itersize` rows.
+
+    Holds a pooled connection and one of `slots` until `close()`; rows are never
+    materialized all at once. Raises StreamLimitError when no slot is free.
+    """
+
+    def __init__(self, query: str, params: Sequence[Any], itersize: int = QUERY_STREAM_ITERSIZE, pool=None,
+                 slots: threading.BoundedSemaphore = _stream_slots):
+        self.itersize = itersize
+        self._pool = pool or get_pool()
+        self._slots = slots
+        if not slots.acquire(blocking=False):
+            raise StreamLimitError("too many open query streams")
+        try:
+            self._conn = self._pool.getconn()
+        except Exception:
+            slots.release()
+            raise
+        try:
+            # Plain tuples: cheaper than RealDictCursor rows for serialization
+            self._cursor = self._conn.cursor(
+                name=f"stream_{uuid.uuid4().hex}",
+                cursor_factory=psycopg2.extensions.cursor
+            )
+            self._cursor.itersize = itersize
+            self._cursor.execute(query, params)
+        except Exception:
+            self._pool.putconn(self._conn)
+            slots.release()
+            raise
+
+    def fetch(self) -> List[tuple]:
+        return self._cursor.fetchmany(self.itersize)
+
+    def close(self) -> None:
+        """Close the cursor and return the connection; safe to call more than once"""
+        if self._conn is None:
+            return
+        try:
+            self._cursor.close()
+        except psycopg2.Error as e:
+            logger.warning(f"Error closing stream cursor: {e}")
+        finally:
+            self._pool.putconn(self._conn)
+            self._conn = None
+            self._slots.release()
+
+async def stream_points(stream: RowStream, ndjson: bool) -> AsyncIterator[bytes]:
+    """
+    Yield a RowStream as NDJSON lines or as one JSON array, one chunk per fetch.
+
+    The status line has already been sent when a fetch fails, so the error is logged
+    and the body ends early: NDJSON gets a final {"error": ...} line, a JSON array is
+    left unterminated so clients cannot mistake it for a complete result.
+    """
+    first = True
+    try:
+        if not ndjson:
+            yield b"["
+        while True:
+            rows = await run_stream(stream.fetch)
+            if not rows:
+                break
+            points = points_from_rows(rows)
+            if ndjson:
+                yield dumps_point_lines(points)
+            else:
+                # Drop the array brackets; chunks are joined into the one outer array
+                chunk = dumps_points(points)[1:-1]
+                yield chunk if first else b"," + chunk
+                first = False
+        if not ndjson:
+            yield b"]"
+    except psycopg2.Error as e:
+        logger.error(f"Query stream error: {e}")
+        if ndjson:
+            yield (json.dumps({"error": f"Database error: {str(e)}"}) + "\n").encode()
+    finally:
+        # Shielded so a client disconnect still returns the connection to the pool
+        await asyncio.shield(run_stream(stream.close))
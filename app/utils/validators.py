@@ -1,11 +1,26 @@
+import os
 from fastapi import HTTPException
-from datetime import datetime
-from typing import List, Union
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Union
+import numpy as np
+from database import get_db_connection
 from models import DataPoint
+from utils.bulk_writer import Point
+from utils.codec import times_to_micros
+from utils.registry import lookup_metrics, metric_registry
+import dotenv
+dotenv.load_dotenv()
+
+METRIC_NAME_MAX_LENGTH = 100
+
+# Accepted timestamp range for ingested points; the future bound allows for client clock skew
+INGEST_MAX_FUTURE_SECONDS = int(os.getenv("INGEST_MAX_FUTURE_SECONDS", 60))
+INGEST_MIN_TIME = os.getenv("INGEST_MIN_TIME", "1970-01-01T00:00:00+00:00")
 
 def validate_timestamp(timestamp: datetime) -> None:
     """Validate that timestamp is not in the future"""
-    if timestamp > datetime.now():
+    now = datetime.now(timezone.utc) if timestamp.tzinfo is not None else datetime.now()
+    if timestamp > now:
         raise HTTPException(
             status_code=400, 
             detail="Timestamp cannot be in the future"
@@ -18,10 +33,10 @@ def validate_metric_name(metric_name: str) -> None:
             status_code=400,
             detail="Metric name cannot be empty"
         )
-    if len(metric_name) > 100:
+    if len(metric_name) > METRIC_NAME_MAX_LENGTH:
         raise HTTPException(
             status_code=400,
-            detail="Metric name too long (max 100 characters)"
+            detail=f"Metric name too long (max {METRIC_NAME_MAX_LENGTH} characters)"
         )
     
 def validate_metric_value(value: Union[float, str], value_type: str):
@@ -48,6 +63,87 @@ def validate_data_points(data_points: List[DataPoint]) -> None:
         validate_timestamp(point.time)
         validate_metric_name(point.metric)
 
+def _metric_name_error(metric_name: str) -> Optional[str]:
+    if not metric_name or not metric_name.strip():
+        return "Metric name cannot be empty"
+    if len(metric_name) > METRIC_NAME_MAX_LENGTH:
+        return f"Metric name too long (max {METRIC_NAME_MAX_LENGTH} characters)"
+    return None
+
+def _to_datetime64(timestamp: datetime) -> np.datetime64:
+    return times_to_micros([timestamp]).view("datetime64[us]")[0]
+
+def stored_value_types(names: List[str]) -> Dict[str, str]:
+    """Value type of each known metric, from the registry with misses read from the metrics table"""
+    types: Dict[str, str] = {}
+    missing = []
+    for name in names:
+        entry = metric_registry.get(name)
+        if entry is not None:
+            types[name] = entry.value_type
+        else:
+            missing.append(name)
+    if missing:
+        with get_db_connection() as conn:
+            for name, entry in lookup_metrics(conn.cursor(), missing).items():
+                types[name] = entry.value_type
+    return types
+
+def validate_batch(points: Sequence[Point],
+                   value_types: Callable[[List[str]], Dict[str, str]] = stored_value_types,
+                   now: Optional[datetime] = None) -> Dict[int, str]:
+    """
+    Validate a whole batch column-wise; returns {point index: error} for failing points.
+
+    Timestamps must lie between INGEST_MIN_TIME and INGEST_MAX_FUTURE_SECONDS past
+    now (naive times are UTC). Names are checked once per distinct metric. Numbers
+    must be finite, and every metric must keep one value type: its stored one
+    (`value_types`, which may query the database), or else that of its first point
+    in the batch. Only the first error of each point is reported, so the rest of
+    the batch can still be accepted.
+    """
+    if not points:
+        return {}
+    times, metrics, values = zip(*points)
+    errors: Dict[int, str] = {}
+
+    def reject(indices: np.ndarray, message: str) -> None:
+        for index in indices.tolist():
+            errors.setdefault(index, message)
+
+    stamps = times_to_micros(times).view("datetime64[us]")
+    latest = _to_datetime64(now or datetime.now(timezone.utc)) + np.timedelta64(INGEST_MAX_FUTURE_SECONDS, "s")
+    reject(np.flatnonzero(stamps > latest), "Timestamp cannot be in the future")
+    reject(np.flatnonzero(stamps < _to_datetime64(datetime.fromisoformat(INGEST_MIN_TIME))),
+           f"Timestamp cannot be before {INGEST_MIN_TIME}")
+
+    # Distinct names in first-seen order; each point refers to its name by code
+    names = list(dict.fromkeys(metrics))
+    code_of = {name: code for code, name in enumerate(names)}
+    codes = np.fromiter(map(code_of.__getitem__, metrics), dtype=np.int64, count=len(metrics))
+    valid_names = []
+    for code, name in enumerate(names):
+        message = _metric_name_error(name)
+        if message is not None:
+            reject(np.flatnonzero(codes == code), message)
+        else:
+            valid_names.append(name)
+
+    is_text = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+    numbers = np.fromiter((0.0 if text else value for value, text in zip(values, is_text.tolist())),
+                          dtype=np.float64, count=len(values))
+    reject(np.flatnonzero(~np.isfinite(numbers)), "Value must be a finite number")
+
+    # np.unique sorts codes, and codes follow first appearance, so this is per name in order
+    expected_text = is_text[np.unique(codes, return_index=True)[1]]
+    for name, value_type in value_types(valid_names).items():
+        expected_text[code_of[name]] = value_type == 'string'
+    for index in np.flatnonzero(is_text != expected_text[codes]).tolist():
+        expected = 'string' if expected_text[codes[index]] else 'number'
+        errors.setdefault(index, f"Metric {metrics[index]} requires {expected} values")
+
+    return dict(sorted(errors.items()))
+
 def validate_query_time_range(start_time: datetime, end_time: datetime) -> None:
     """Validate query time range is reasonable"""
     if start_time >= end_time:
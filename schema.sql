@@ -33,4 +33,48 @@ SELECT create_hypertable (
 CREATE INDEX IF NOT EXISTS idx_time_series_data_metric_time ON time_series_data (metric_id, time DESC);
 
 -- 6. Add an index on the metric name for faster lookups during ingestion
-CREATE INDEX IF NOT EXISTS idx_metrics_name ON metrics (name);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_metrics_name ON metrics (name);
+
+-- 7. Ids of spooled ingest batches already written, so batches replayed from the
+--    local ingest spool after a crash are not written twice
+CREATE TABLE IF NOT EXISTS ingest_batches (
+    batch_id UUID PRIMARY KEY,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- 8. Continuous aggregates holding per-metric partials for 1 minute, 1 hour and 1 day buckets.
+--    Aggregated queries are routed to the coarsest one that answers them exactly.
+CREATE MATERIALIZED VIEW IF NOT EXISTS time_series_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = true) AS
+SELECT metric_id, time_bucket('1 minute', time) AS bucket,
+       SUM(value) AS sum, COUNT(*) AS count, COUNT(value) AS value_count,
+       MIN(value) AS min, MAX(value) AS max
+FROM time_series_data
+GROUP BY metric_id, bucket
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS time_series_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = true) AS
+SELECT metric_id, time_bucket('1 hour', time) AS bucket,
+       SUM(value) AS sum, COUNT(*) AS count, COUNT(value) AS value_count,
+       MIN(value) AS min, MAX(value) AS max
+FROM time_series_data
+GROUP BY metric_id, bucket
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS time_series_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = true) AS
+SELECT metric_id, time_bucket('1 day', time) AS bucket,
+       SUM(value) AS sum, COUNT(*) AS count, COUNT(value) AS value_count,
+       MIN(value) AS min, MAX(value) AS max
+FROM time_series_data
+GROUP BY metric_id, bucket
+WITH NO DATA;
+
+-- 9. Refresh policies; no start offset, so late data anywhere in the past is re-materialized
+SELECT add_continuous_aggregate_policy('time_series_1m', start_offset => NULL,
+    end_offset => INTERVAL '1 minute', schedule_interval => INTERVAL '1 minute', if_not_exists => TRUE);
+SELECT add_continuous_aggregate_policy('time_series_1h', start_offset => NULL,
+    end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '10 minutes', if_not_exists => TRUE);
+SELECT add_continuous_aggregate_policy('time_series_1d', start_offset => NULL,
+    end_offset => INTERVAL '1 day', schedule_interval => INTERVAL '1 hour', if_not_exists => TRUE);
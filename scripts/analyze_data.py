@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import requests
 from datetime import datetime, timedelta
-import statistics
+
+# Parallel {"times": [...], "values": [...]} arrays instead of one object per point
+COLUMNS = {"Accept": "application/vnd.timeseries.columns+json"}
 
 def analyze_iot_data(base_url):
     """
@@ -34,45 +36,48 @@ def analyze_iot_data(base_url):
         "end_time": end_time
     }
     
-    response = requests.post(f"{base_url}/query", json=device_query)
+    response = requests.post(f"{base_url}/query", json=device_query, headers=COLUMNS)
     if response.status_code == 200:
         device_data = response.json()
-        unique_devices = set(point['value'] for point in device_data)
+        unique_devices = set(device_data['values'])
         print(f"   Found {len(unique_devices)} unique devices: {list(unique_devices)}")
     
     environmental_metrics = ['temperature', 'humidity', 'carbon_monoxide', 'smoke', 'liquefied_petroleum_gas']
+    available = [name for name in environmental_metrics if any(m['name'] == name for m in metrics)]
     
-    for metric_name in environmental_metrics:
-        if any(m['name'] == metric_name for m in metrics):
+    # Statistics are computed in the database over every reading in the window (which
+    # one '1 month' bucket covers): one batch request per statistic, none per metric
+    statistics = {}
+    for aggregation in ('count', 'avg', 'min', 'max', 'stddev', 'p95'):
+        batch_query = {
+            "metrics": available,
+            "start_time": start_time,
+            "end_time": end_time,
+            "aggregation": aggregation,
+            "interval": "1 month"
+        }
+        response = requests.post(f"{base_url}/query/batch", json=batch_query) if available else None
+        if response is None or response.status_code != 200:
+            break
+        for metric_name, points in response.json().items():
+            values = [point['value'] for point in points if point['value'] is not None]
+            statistics.setdefault(metric_name, {})[aggregation] = values[0] if values else None
+    
+    for metric_name in available:
+        stats = statistics.get(metric_name, {})
+        if stats.get('count'):
             print(f"\n  {metric_name.replace('_', ' ').title()} Analysis:")
-            
-            query_data = {
-                "metric": metric_name,
-                "start_time": start_time,
-                "end_time": end_time,
-                "aggregation": "avg",
-                "interval": "1 hour"
-            }
-            
-            response = requests.post(f"{base_url}/query", json=query_data)
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    values = [point['value'] for point in data if point['value'] is not None]
-                    if values:
-                        print(f"    Statistics:")
-                        print(f"      Data points: {len(values)}")
-                        print(f"      Average: {statistics.mean(values):.4f}")
-                        print(f"      Min: {min(values):.4f}")
-                        print(f"      Max: {max(values):.4f}")
-                        
-                        # Find anomalies (values > 2 standard deviations from mean)
-                        if len(values) > 1:
-                            mean_val = statistics.mean(values)
-                            std_val = statistics.stdev(values)
-                            anomalies = [v for v in values if abs(v - mean_val) > 2 * std_val]
-                            if anomalies:
-                                print(f"  Anomalies: {len(anomalies)} values outside 2 standard deviations from mean")
+            print(f"    Statistics:")
+            print(f"      Data points: {stats['count']:.0f}")
+            print(f"      Average: {stats['avg']:.4f}")
+            print(f"      Min: {stats['min']:.4f}")
+            print(f"      Max: {stats['max']:.4f}")
+            if stats.get('stddev') is not None:
+                print(f"      Std deviation: {stats['stddev']:.4f}")
+                print(f"      95th percentile: {stats['p95']:.4f}")
+                # Max reading more than 2 standard deviations above the mean
+                if stats['max'] - stats['avg'] > 2 * stats['stddev']:
+                    print(f"  Anomalies: readings above {stats['avg'] + 2 * stats['stddev']:.4f} (2 standard deviations from mean)")
     
     boolean_metrics = ['light_status', 'motion_detected']
     
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import statistics
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from utils.codec import encode_rows, decode_rows
+
+def make_rows(count, text=False):
+    """Raw-range query results at 1-second resolution, as the query route caches them"""
+    start = datetime(2020, 7, 12, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        value = ("on" if i % 7 else "off") if text else 22.5 + (i % 600) / 100
+        rows.append({"time": start + timedelta(seconds=i), "value": value})
+    return rows
+
+def decode_json(payload):
+    """The previous format: parse, then turn time strings back into datetimes"""
+    rows = json.loads(payload)
+    for row in rows:
+        row["time"] = datetime.fromisoformat(row["time"])
+    return rows
+
+def timed(func, payload, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(payload)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def cache_encoding_benchmark(sizes=(1_000, 100_000), repeats=5):
+    """Compare the previous JSON cache format with the columnar binary format"""
+    print("Cache Encoding Benchmark")
+    print("=" * 50)
+
+    for text in (False, True):
+        for count in sizes:
+            rows = make_rows(count, text)
+            json_payload = json.dumps(rows, default=str).encode()
+            columnar_payload = encode_rows(rows)
+
+            json_decode = timed(decode_json, json_payload, repeats)
+            columnar_decode = timed(decode_rows, columnar_payload, repeats)
+
+            kind = "text" if text else "numeric"
+            print(f"\n {count:,} {kind} rows:")
+            print(f"   JSON:     {len(json_payload):>12,} bytes, decode {json_decode * 1000:8.2f} ms")
+            print(f"   Columnar: {len(columnar_payload):>12,} bytes, decode {columnar_decode * 1000:8.2f} ms")
+            print(f"   Size ratio: {len(json_payload) / len(columnar_payload):.1f}x smaller, "
+                  f"decode {json_decode / columnar_decode:.1f}x faster")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare JSON and columnar encodings of cached query results')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000], help='Result sizes to test')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed decodes per format')
+
+    args = parser.parse_args()
+    cache_encoding_benchmark(args.sizes, args.repeats)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import requests
+import time
+import statistics
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+SLOW_QUERY = {
+    "metric": "temperature",
+    "start_time": "2020-07-12T00:00:00Z",
+    "end_time": "2020-07-20T00:00:00Z"
+}
+
+FAST_QUERY = {
+    "metric": "temperature",
+    "start_time": "2020-07-12T00:00:00Z",
+    "end_time": "2020-07-12T00:05:00Z"
+}
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of latencies"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def timed_query(base_url, kind, query):
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/query", json=query, timeout=120)
+    return kind, time.perf_counter() - start, response.status_code
+
+def concurrency_benchmark(base_url="http://localhost:8000", slow_requests=20, fast_requests=150, concurrency=16):
+    """
+    Measure fast-query latency while slow queries run concurrently on the same worker.
+
+    Run it twice against a single uvicorn worker: once with DB_EXECUTOR_THREADS=0
+    (database calls block the event loop, the old behaviour) and once with the default
+    thread pool, then compare the fast-query p99.
+    Keep slow + fast under the 200/minute rate limit on /query.
+    """
+    print("Concurrency Benchmark")
+    print("=" * 50)
+    print(f"   {slow_requests} slow + {fast_requests} fast queries, concurrency {concurrency}")
+
+    # Interleave so fast queries are always queued behind in-flight slow ones
+    jobs = []
+    slow_every = max(1, fast_requests // max(1, slow_requests))
+    slow_queued = 0
+    for i in range(fast_requests):
+        if i % slow_every == 0 and slow_queued < slow_requests:
+            jobs.append(("slow", SLOW_QUERY))
+            slow_queued += 1
+        jobs.append(("fast", FAST_QUERY))
+
+    latencies = {"slow": [], "fast": []}
+    rejected = 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(timed_query, base_url, kind, query) for kind, query in jobs]
+        for future in futures:
+            kind, elapsed, status = future.result()
+            if status == 429:
+                rejected += 1
+                continue
+            latencies[kind].append(elapsed)
+    wall_time = time.perf_counter() - started
+
+    print(f"\n Results (wall time {wall_time:.2f}s):")
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        print(f"   {kind} ({len(values)} requests):")
+        print(f"      p50: {percentile(values, 50) * 1000:.1f} ms")
+        print(f"      p95: {percentile(values, 95) * 1000:.1f} ms")
+        print(f"      p99: {percentile(values, 99) * 1000:.1f} ms")
+        print(f"      mean: {statistics.mean(values) * 1000:.1f} ms")
+    if rejected:
+        print(f"\n   {rejected} requests were rate limited (429) and excluded")
+
+    return latencies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure query latency under mixed slow and fast load')
+    parser.add_argument('--url', type=str, default='http://localhost:8000', help='API base URL')
+    parser.add_argument('--slow', type=int, default=20, help='Number of slow (wide range) queries')
+    parser.add_argument('--fast', type=int, default=150, help='Number of fast (narrow range) queries')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+
+    args = parser.parse_args()
+    concurrency_benchmark(args.url, args.slow, args.fast, args.concurrency)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import statistics
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from database import get_db_connection
+from utils.bulk_writer import write_points, value_type_of
+
+# Same columns scripts/load_data.py turns into metrics for every CSV row
+METRICS = [
+    ('device_id', lambda i: f"device_{i % 3}"),
+    ('carbon_monoxide', lambda i: 0.004 + i * 1e-6),
+    ('humidity', lambda i: 51.0 + i % 7),
+    ('liquefied_petroleum_gas', lambda i: 0.007 + i * 1e-6),
+    ('smoke', lambda i: 0.02 + i * 1e-6),
+    ('temperature', lambda i: 22.7 + i % 5),
+    ('light_status', lambda i: float(i % 2)),
+    ('motion_detected', lambda i: 0.0)
+]
+
+def make_batch(rows, prefix):
+    """Build the points a load_data.py batch of `rows` CSV rows produces"""
+    start = datetime(2020, 7, 12, tzinfo=timezone.utc)
+    points = []
+    for i in range(rows):
+        timestamp = start + timedelta(seconds=i)
+        for name, value in METRICS:
+            points.append((timestamp, f"{prefix}{name}", value(i)))
+    return points
+
+def per_row_insert(cursor, points):
+    """The original ingest loop: one upsert and one INSERT per point"""
+    for time_value, metric, value in points:
+        value_type = value_type_of(value)
+        cursor.execute('''
+            INSERT INTO metrics (name, value_type, last_seen)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (name) DO UPDATE SET
+                value_type = EXCLUDED.value_type,
+                last_seen = GREATEST(metrics.last_seen, EXCLUDED.last_seen)
+            RETURNING id;
+        ''', (metric, value_type, time_value))
+        metric_id = cursor.fetchone()['id']
+        column = 'text_value' if value_type == 'string' else 'value'
+        cursor.execute(
+            f'INSERT INTO time_series_data (time, metric_id, {column}) VALUES (%s, %s, %s)',
+            (time_value, metric_id, value)
+        )
+
+def time_writer(writer, points, repeats):
+    """Time a writer inside transactions that are rolled back, leaving no data behind"""
+    timings = []
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for _ in range(repeats):
+            start = time.perf_counter()
+            writer(cursor, points)
+            timings.append(time.perf_counter() - start)
+            conn.rollback()
+    return timings
+
+def ingest_benchmark(rows=500, repeats=5):
+    """Compare the per-row ingest loop with the bulk COPY writer"""
+    print("Ingest Benchmark")
+    print("=" * 50)
+
+    points = make_batch(rows, prefix="bench_")
+    print(f"   Batch: {rows} CSV rows -> {len(points):,} data points, {repeats} repeats")
+
+    per_row = time_writer(per_row_insert, points, repeats)
+    bulk = time_writer(write_points, points, repeats)
+
+    per_row_median = statistics.median(per_row)
+    bulk_median = statistics.median(bulk)
+
+    print(f"\n   Per-row inserts: {per_row_median * 1000:.1f} ms/batch ({len(points) / per_row_median:,.0f} points/s)")
+    print(f"   Bulk COPY:       {bulk_median * 1000:.1f} ms/batch ({len(points) / bulk_median:,.0f} points/s)")
+    print(f"   Speedup:         {per_row_median / bulk_median:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare per-row and bulk COPY ingestion against the configured database')
+    parser.add_argument('--rows', type=int, default=500, help='CSV rows per batch (8 data points each)')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of timed batches per writer')
+
+    args = parser.parse_args()
+    ingest_benchmark(args.rows, args.repeats)
@@ -9,6 +9,20 @@ import time
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
 
+# CSV columns and the metrics they are stored as
+NUMERIC_METRICS = {
+    'co': 'carbon_monoxide',
+    'humidity': 'humidity', 
+    'lpg': 'liquefied_petroleum_gas',
+    'smoke': 'smoke',
+    'temp': 'temperature'
+}
+BOOLEAN_METRICS = {
+    'light': 'light_status',
+    'motion': 'motion_detected'
+}
+COLUMN_METRICS = {'device': 'device_id', **NUMERIC_METRICS, **BOOLEAN_METRICS}
+
 def load_iot_dataset(csv_file_path, base_url="http://localhost:8000", batch_size=500, max_rows=None):
     """
     Load IoT sensor dataset into the Timeseries API
@@ -34,59 +48,35 @@ def load_iot_dataset(csv_file_path, base_url="http://localhost:8000", batch_size
             end_idx = min(start_idx + batch_size, len(data_frame))
             batch_data_frame = data_frame.iloc[start_idx:end_idx]
             
-            data_points = []
+            # One wide row per CSV row: the timestamp is sent once for all its metrics
+            rows = []
+            point_count = 0
             
             for _, row in batch_data_frame.iterrows():
-                timestamp = row['timestamp_iso']
-                device_id = row['device']
-                
-                # Add device ID as a metric
-                data_points.append({
-                    "time": timestamp,
-                    "metric": "device_id",
-                    "value": device_id
-                })
+                # Device ID is stored as a metric
+                fields = {"device_id": row['device']}
                 
                 # Add all numeric sensor readings
-                numeric_metrics = {
-                    'co': 'carbon_monoxide',
-                    'humidity': 'humidity', 
-                    'lpg': 'liquefied_petroleum_gas',
-                    'smoke': 'smoke',
-                    'temp': 'temperature'
-                }
-                
-                for col_name, metric_name in numeric_metrics.items():
+                for col_name, metric_name in NUMERIC_METRICS.items():
                     if pd.notna(row[col_name]):
-                        data_points.append({
-                            "time": timestamp,
-                            "metric": metric_name,
-                            "value": float(row[col_name])
-                        })
+                        fields[metric_name] = float(row[col_name])
                 
                 # Add boolean metrics
-                boolean_metrics = {
-                    'light': 'light_status',
-                    'motion': 'motion_detected'
-                }
-                
-                for col_name, metric_name in boolean_metrics.items():
+                for col_name, metric_name in BOOLEAN_METRICS.items():
                     if pd.notna(row[col_name]):
-                        # Convert boolean to string or numeric
-                        bool_value = 1 if row[col_name] else 0
-                        data_points.append({
-                            "time": timestamp,
-                            "metric": metric_name,
-                            "value": bool_value
-                        })
+                        # Convert boolean to numeric
+                        fields[metric_name] = 1 if row[col_name] else 0
+                
+                rows.append({"time": row['timestamp_iso'], "fields": fields})
+                point_count += len(fields)
             
-            if data_points:
+            if rows:
                 # Send batch to API
-                success = send_batch(data_points, base_url)
+                success = send_batch({"rows": rows}, base_url)
                 if success:
-                    total_ingested += len(data_points)
+                    total_ingested += point_count
                     batch_count += 1
-                    print(f" Batch {batch_count}: Ingested {len(data_points):,} data points (Total: {total_ingested:,})")
+                    print(f" Batch {batch_count}: Ingested {point_count:,} data points (Total: {total_ingested:,})")
                 else:
                     print(f" Batch {batch_count}: Failed to ingest")
             
@@ -109,17 +99,53 @@ def load_iot_dataset(csv_file_path, base_url="http://localhost:8000", batch_size
         traceback.print_exc()
         return 0
 
-def send_batch(data_points, base_url):
-    """Send a batch of data points to the API"""
-    payload = {"data": data_points}
-    
+def stream_iot_dataset(csv_file_path, base_url="http://localhost:8000", chunk_size=1024 * 1024):
+    """
+    Upload the CSV file as-is to /ingest/csv, renaming the header columns to metric names.
+
+    The file is streamed in chunks and parsed server-side, so neither side holds it in memory.
+    """
+    print(f" Streaming IoT dataset from: {csv_file_path}")
+
+    def body():
+        with open(csv_file_path, 'rb') as f:
+            header = [column.strip().strip('"') for column in f.readline().decode().split(',')]
+            yield (','.join(COLUMN_METRICS.get(column, column) for column in header) + '\n').encode()
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    started = time.time()
     try:
-        response = requests.post(f"{base_url}/ingest", json=payload, timeout=30)
-        if response.status_code == 200:
-            return True
-        else:
-            print(f"API Error: {response.status_code} - {response.text}")
-            return False
+        response = requests.post(f"{base_url}/ingest/csv", data=body(),
+                                 headers={"Content-Type": "text/csv"}, timeout=None)
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {e}")
+        return 0
+    if response.status_code != 200:
+        print(f"API Error: {response.status_code} - {response.text}")
+        return 0
+
+    total_ingested = response.json()["ingested_count"]
+    elapsed = time.time() - started
+    print(f"\n Completed! Total data points ingested: {total_ingested:,} in {elapsed:.1f}s")
+    return total_ingested
+
+def send_batch(payload, base_url, max_attempts=5):
+    """Send an ingest payload to the API, waiting and retrying while the server is full (503)"""
+    try:
+        for attempt in range(max_attempts):
+            response = requests.post(f"{base_url}/ingest", json=payload, timeout=30)
+            # 202 when the server buffers or spools ingest and writes in the background
+            if response.status_code in (200, 202):
+                return True
+            if response.status_code != 503 or attempt == max_attempts - 1:
+                break
+            time.sleep(float(response.headers.get("Retry-After", 1)))
+        print(f"API Error: {response.status_code} - {response.text}")
+        return False
     except requests.exceptions.RequestException as e:
         print(f"Request failed: {e}")
         return False
@@ -132,6 +158,7 @@ if __name__ == "__main__":
     parser.add_argument('--url', type=str, default='http://localhost:8000', help='API base URL')
     parser.add_argument('--batch-size', type=int, default=500, help='Batch size for ingestion')
     parser.add_argument('--max-rows', type=int, help='Maximum number of rows to process')
+    parser.add_argument('--stream', action='store_true', help='Upload the whole file to /ingest/csv in one streamed request')
     
     args = parser.parse_args()
     
@@ -141,7 +168,9 @@ if __name__ == "__main__":
              
         csv_file = 'data/iot_telemetry_data.csv'  
     
-    if csv_file:
+    if csv_file and args.stream:
+        stream_iot_dataset(csv_file, args.url)
+    elif csv_file:
         load_iot_dataset(csv_file, args.url, args.batch_size, args.max_rows)
     else:
         print("Please specify the CSV file path")
@@ -7,6 +7,8 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
 
 from main import app
 from database import get_db_connection, init_db
+from utils.registry import metric_registry
+from utils.cache import cache_manager
 
 @pytest.fixture(scope="session")
 def test_client():
@@ -20,9 +22,11 @@ def clean_db():
     """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("DROP TABLE IF EXISTS time_series_data")
+        cursor.execute("DROP TABLE IF EXISTS time_series_data CASCADE")
         cursor.execute("DROP TABLE IF EXISTS metrics")
         conn.commit()
+    metric_registry.clear()
+    cache_manager.clear_cache()
     init_db()
     yield
 
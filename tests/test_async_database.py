@@ -0,0 +1,42 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from async_database import run_db
+
+def test_run_db_runs_off_the_event_loop():
+    """Test that blocking work runs in a worker thread"""
+    async def main():
+        return await run_db(threading.get_ident)
+
+    assert asyncio.run(main()) != threading.get_ident()
+
+def test_run_db_does_not_block_other_tasks():
+    """Test that a slow database call does not stall concurrent coroutines"""
+    async def main():
+        slow = asyncio.ensure_future(run_db(time.sleep, 0.2))
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        fast_elapsed = time.perf_counter() - started
+        await slow
+        return fast_elapsed
+
+    assert asyncio.run(main()) < 0.1
+
+def test_run_db_propagates_exceptions():
+    """Test that exceptions raised in the worker reach the caller"""
+    def fail():
+        raise ValueError("boom")
+
+    async def main():
+        try:
+            await run_db(fail)
+        except ValueError as e:
+            return str(e)
+
+    assert asyncio.run(main()) == "boom"
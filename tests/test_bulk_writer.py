@@ -0,0 +1,102 @@
+import sys
+import os
+from datetime import datetime, timezone
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.bulk_writer import summarize_metrics, build_copy_buffer, write_points, time_spans
+from utils.registry import MetricRegistry, MetricEntry
+
+T0 = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+T1 = datetime(2024, 1, 15, 10, 5, tzinfo=timezone.utc)
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+        self.copied = None
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        names, value_types, last_seen = self.executed[-1][1]
+        return [
+            {"id": i + 1, "name": name, "value_type": value_type, "first_seen": seen, "last_seen": seen}
+            for i, (name, value_type, seen) in enumerate(zip(names, value_types, last_seen))
+        ]
+
+    def copy_expert(self, sql, buffer):
+        self.copied = (sql, buffer.read())
+
+def test_summarize_metrics_keeps_latest_time():
+    """Test one summary entry per metric using the batch max timestamp"""
+    summary = summarize_metrics([
+        (T1, "temperature", 24.1),
+        (T0, "temperature", 23.5),
+        (T0, "event", "machine_start")
+    ])
+    assert summary == {
+        "temperature": ("number", T1),
+        "event": ("string", T0)
+    }
+
+def test_build_copy_buffer_formats_rows():
+    """Test COPY text rows for numeric and string values"""
+    buffer = build_copy_buffer([
+        (T0, "temperature", 23.5),
+        (T0, "event", "tab\there\nnewline\\slash")
+    ], {"temperature": 1, "event": 2})
+    lines = buffer.read().splitlines()
+    assert lines[0] == "2024-01-15T10:00:00+00:00\t1\t23.5\t\\N"
+    assert lines[1] == "2024-01-15T10:00:00+00:00\t2\t\\N\ttab\\there\\nnewline\\\\slash"
+
+def test_write_points_uses_two_statements():
+    """Test that a batch costs one upsert and one COPY regardless of size"""
+    cursor = FakeCursor()
+    points = [(T0, f"metric_{i % 3}", float(i)) for i in range(500)]
+    count, upserted = write_points(cursor, points, MetricRegistry())
+    assert count == 500
+    assert set(upserted) == {"metric_0", "metric_1", "metric_2"}
+    assert len(cursor.executed) == 1
+    assert sorted(cursor.executed[0][1][0]) == ["metric_0", "metric_1", "metric_2"]
+    assert cursor.copied[0].startswith("COPY time_series_data")
+    assert len(cursor.copied[1].splitlines()) == 500
+
+def test_write_points_empty_batch():
+    """Test that an empty batch does not touch the database"""
+    cursor = FakeCursor()
+    assert write_points(cursor, [], MetricRegistry()) == (0, {})
+    assert cursor.executed == []
+    assert cursor.copied is None
+
+def test_write_points_skips_upsert_for_known_metrics():
+    """Test that registry hits with a current last_seen skip the metrics upsert"""
+    registry = MetricRegistry()
+    registry.put("temperature", MetricEntry(7, "number", T0, T1))
+    cursor = FakeCursor()
+
+    count, upserted = write_points(cursor, [(T0, "temperature", 23.5)], registry)
+    assert count == 1
+    assert upserted == {}
+    assert cursor.executed == []
+    assert cursor.copied[1].split("\t")[1] == "7"
+
+def test_write_points_upserts_when_last_seen_advances():
+    """Test that a newer timestamp or a type change still reaches Postgres"""
+    registry = MetricRegistry()
+    registry.put("temperature", MetricEntry(7, "number", T0, T0))
+    registry.put("event", MetricEntry(8, "number", T0, T1))
+    cursor = FakeCursor()
+
+    write_points(cursor, [(T1, "temperature", 24.1), (T0, "event", "start")], registry)
+    assert sorted(cursor.executed[0][1][0]) == ["event", "temperature"]
+
+def test_time_spans_per_metric():
+    """Test earliest/latest timestamps per metric for cache invalidation"""
+    spans = time_spans([
+        (T1, "temperature", 24.1),
+        (T0, "temperature", 23.5),
+        (T1, "event", "stop")
+    ])
+    assert spans == {"temperature": (T0, T1), "event": (T1, T1)}
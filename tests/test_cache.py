@@ -1,5 +1,10 @@
 import pytest
+from datetime import datetime, timedelta, timezone
 from fastapi.testclient import TestClient
+import threading
+import time
+from utils.cache import cache_manager, query_ttl, decoded_size, CircuitBreaker, LocalCache, CACHE_HISTORICAL_TTL, CACHE_RECENT_TTL
+from utils.codec import encode_series
 
 def test_cache_info_endpoint(test_client):
     """Test cache info endpoint"""
@@ -7,6 +12,10 @@ def test_cache_info_endpoint(test_client):
     assert response.status_code == 200
     data = response.json()
     assert "status" in data
+    assert "routes" in data
+    assert data["circuit_breaker"]["state"] in ["closed", "open", "half_open"]
+    assert "hit_ratio" in data["tiers"]["l1"]
+    assert "hit_ratio" in data["tiers"]["l2"]
 
 def test_clear_cache_endpoint(test_client):
     """Test cache clear endpoint"""
@@ -27,4 +36,163 @@ def test_clear_metric_cache_endpoint(test_client):
 def test_list_cache_keys_endpoint(test_client):
     """Test listing cache keys"""
     response = test_client.get("/cache/keys")
-    assert response.status_code in [200, 503]
\ No newline at end of file
+    assert response.status_code in [200, 503]
+
+def test_list_cache_keys_pagination(test_client):
+    """Test that key listing returns a SCAN cursor for the next page"""
+    response = test_client.get("/cache/keys", params={"cursor": 0, "count": 10})
+    assert response.status_code in [200, 503]
+    if response.status_code == 200:
+        data = response.json()
+        assert "cursor" in data
+        assert data["complete"] == (data["cursor"] == 0)
+        assert all(key.startswith("timeseries:") for key in data["keys"])
+
+def test_list_cache_keys_rejects_bad_count(test_client):
+    """Test page size bounds"""
+    response = test_client.get("/cache/keys", params={"count": 0})
+    assert response.status_code == 422
+
+def test_clear_cache_job_can_be_polled(test_client):
+    """Test that a clear job reports its progress"""
+    response = test_client.post("/cache/clear")
+    assert response.status_code == 200
+    job_id = response.json()["job_id"]
+    
+    response = test_client.get(f"/cache/clear/{job_id}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] in ["running", "completed", "failed"]
+    assert "deleted" in data
+
+def test_clear_cache_unknown_job(test_client):
+    """Test polling a job that does not exist"""
+    response = test_client.get("/cache/clear/does-not-exist")
+    assert response.status_code == 404
+
+def test_cache_key_normalizes_timestamps():
+    """Test that the same window sent with different offsets maps to one key"""
+    utc = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+    shifted = datetime(2024, 1, 15, 13, 0, tzinfo=timezone(timedelta(hours=3)))
+    assert cache_manager._make_cache_key("temperature", utc, utc) == cache_manager._make_cache_key("temperature", shifted, shifted)
+    assert cache_manager._make_cache_key("temperature", utc, utc, "avg", "1  hour").endswith(":avg:1 hour")
+    assert cache_manager._make_cache_key("temperature", utc, utc, "avg", "1 hour", "previous").endswith(":avg:1 hour:fill=previous")
+
+def test_query_ttl_depends_on_window_end():
+    """Test long TTLs for historical windows and short TTLs for recent ones"""
+    assert query_ttl(datetime(2024, 1, 15, tzinfo=timezone.utc)) == CACHE_HISTORICAL_TTL
+    assert query_ttl(datetime.now(timezone.utc)) == CACHE_RECENT_TTL
+
+def test_route_hit_miss_counters():
+    """Test per-route hit ratio reporting"""
+    cache_manager._record("/test-route", True)
+    cache_manager._record("/test-route", False)
+    stats = cache_manager.get_route_stats()["/test-route"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_l2_counters_are_exact_under_concurrency():
+    """Test that L2 hit/miss counts lose no updates across threads"""
+    hits, misses = cache_manager._l2_hits, cache_manager._l2_misses
+
+    def worker():
+        for _ in range(1000):
+            cache_manager._record_l2(True)
+            cache_manager._record_l2(False)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache_manager._l2_hits - hits == 8000
+    assert cache_manager._l2_misses - misses == 8000
+
+
+def test_circuit_breaker_opens_on_failure():
+    """Test that a failed command skips Redis until the backoff elapses"""
+    breaker = CircuitBreaker(base_delay=0.05, max_delay=1)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.snapshot()["trips"] == 1
+
+def test_circuit_breaker_allows_single_probe():
+    """Test that only one probe goes through once the backoff elapses"""
+    breaker = CircuitBreaker(base_delay=0.01, max_delay=1)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_circuit_breaker_backoff_grows_and_caps():
+    """Test exponential backoff between reconnect probes"""
+    breaker = CircuitBreaker(base_delay=1, max_delay=4)
+    delays = []
+    for _ in range(5):
+        breaker.record_failure()
+        delays.append(breaker.snapshot()["retry_in_seconds"])
+    assert [round(d) for d in delays] == [1, 2, 4, 4, 4]
+    assert breaker.snapshot()["trips"] == 1
+
+
+def test_local_cache_is_bounded_by_bytes():
+    """Test that L1 evicts least recently used entries to stay under max_bytes"""
+    l1 = LocalCache(max_bytes=100)
+    l1.put("a", [1], 40, 60)
+    l1.put("b", [2], 40, 60)
+    l1.get("a")
+    l1.put("c", [3], 40, 60)
+    assert l1.get("b") is None
+    assert l1.get("a") == [1]
+    assert l1.get("c") == [3]
+    assert l1.get_stats()["bytes"] == 80
+    assert l1.evictions == 1
+
+def test_local_cache_skips_oversized_entries():
+    """Test that a single entry larger than the budget is not cached"""
+    l1 = LocalCache(max_bytes=10)
+    l1.put("big", [0], 11, 60)
+    assert l1.get("big") is None
+
+def test_local_cache_invalidation_and_expiry():
+    """Test explicit invalidation and TTL expiry"""
+    l1 = LocalCache(max_bytes=100)
+    l1.put("a", [1], 10, 60)
+    l1.put("b", [2], 10, 0.01)
+    l1.invalidate(["a"])
+    time.sleep(0.02)
+    assert l1.get("a") is None
+    assert l1.get("b") is None
+    assert l1.get_stats()["bytes"] == 0
+
+def test_decoded_size_counts_python_objects():
+    """Test that L1 entries are charged their decoded size, not the compressed payload"""
+    start = datetime(2024, 1, 15, tzinfo=timezone.utc)
+    times = [start + timedelta(seconds=i) for i in range(1000)]
+    values = [float(i) for i in range(1000)]
+    size = decoded_size((times, values))
+    assert size >= 1000 * 72
+    assert size > 10 * len(encode_series(times, values))
+    table = (times, {"sum": values, "count": values})
+    assert decoded_size(table) > size
+
+@pytest.mark.skipif(not cache_manager.is_connected(), reason="needs Redis")
+def test_index_prunes_expired_entries():
+    """Test that writes drop index members whose cached windows have expired"""
+    start = datetime(2024, 1, 15, tzinfo=timezone.utc)
+    cache_manager.invalidate_metric_cache("prune_metric")
+    for minutes in range(5):
+        cache_manager.set_cached_query("prune_metric", start, start + timedelta(minutes=minutes),
+                                       ([start], [1.0]), ttl_seconds=1)
+    time.sleep(1.1)
+    cache_manager.set_cached_query("prune_metric", start, start + timedelta(hours=1), ([start], [1.0]), ttl_seconds=60)
+    assert cache_manager.redis_client.zcard(cache_manager._index_key("prune_metric")) == 1
+    cache_manager.invalidate_metric_cache("prune_metric")
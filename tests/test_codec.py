@@ -0,0 +1,82 @@
+import sys
+import os
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.codec import (
+    encode_rows, decode_rows, encode_series, decode_series, encode_columns, decode_columns,
+    column_values, FLAG_COMPRESSED
+)
+
+START = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+
+def test_numeric_round_trip_with_nulls():
+    """Test that float columns keep values, nulls and microsecond timestamps"""
+    rows = [
+        {"time": START, "value": 22.5},
+        {"time": START + timedelta(microseconds=1500), "value": None},
+        {"time": START + timedelta(seconds=2), "value": 7}
+    ]
+    decoded = decode_rows(encode_rows(rows))
+    assert decoded == [
+        {"time": START, "value": 22.5},
+        {"time": START + timedelta(microseconds=1500), "value": None},
+        {"time": START + timedelta(seconds=2), "value": 7.0}
+    ]
+    assert all(row["time"].tzinfo is not None for row in decoded)
+
+def test_string_round_trip():
+    """Test that text metrics go through the string table"""
+    rows = [{"time": START + timedelta(seconds=i), "value": value}
+            for i, value in enumerate(["on", "off", None, "on"])]
+    assert decode_rows(encode_rows(rows)) == rows
+
+def test_iso_string_times_are_accepted():
+    """Test that timestamps already serialized as ISO strings encode the same"""
+    rows = [{"time": "2024-01-15T10:00:00Z", "value": 1.0}]
+    assert decode_rows(encode_rows(rows)) == [{"time": START, "value": 1.0}]
+
+def test_series_round_trip():
+    """Test the (times, values) form the query cache stores"""
+    times = [START, START + timedelta(seconds=1)]
+    assert decode_series(encode_series(times, [1.5, None])) == (times, [1.5, None])
+
+def test_empty_result():
+    assert decode_rows(encode_rows([])) == []
+
+def test_large_payloads_are_compressed():
+    """Test that bodies above the threshold are compressed and still decode"""
+    rows = [{"time": START + timedelta(seconds=i), "value": 20.0 + i % 10} for i in range(1000)]
+    payload = encode_rows(rows)
+    assert payload[4] & FLAG_COMPRESSED
+    assert len(payload) < len(json.dumps(rows, default=str)) / 5
+    assert decode_rows(payload) == rows
+
+    small = encode_rows(rows[:2])
+    assert not small[4] & FLAG_COMPRESSED
+
+def test_multiple_columns():
+    """Test encoding several named columns over one time axis"""
+    times = [START, START + timedelta(minutes=1)]
+    payload = encode_columns(times, {"avg": [1.0, 2.0], "device": ["a", "b"]})
+    micros, columns = decode_columns(payload)
+    assert len(micros) == 2
+    assert column_values(columns["avg"]) == [1.0, 2.0]
+    assert column_values(columns["device"]) == ["a", "b"]
+
+def test_unknown_payloads_decode_to_none():
+    """Test that JSON entries from the previous format and other versions are ignored"""
+    assert decode_rows(json.dumps([{"time": "2024-01-15T10:00:00", "value": 1}]).encode()) is None
+    assert decode_rows(b"") is None
+
+    payload = bytearray(encode_rows([{"time": START, "value": 1.0}]))
+    payload[3] = 99
+    assert decode_rows(bytes(payload)) is None
+
+def test_mixed_value_types_raise():
+    with pytest.raises(ValueError):
+        encode_rows([{"time": START, "value": 1.0}, {"time": START, "value": "on"}])
@@ -0,0 +1,63 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.downsample import downsample, lttb_indices, minmax_indices
+
+START = datetime(2024, 1, 15, tzinfo=timezone.utc)
+
+def reference_lttb(x, y, threshold):
+    """Textbook LTTB, one bucket at a time"""
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    anchor, chosen = 0, [0]
+    for bucket in range(threshold - 2):
+        low, high = int(bucket * every) + 1, int((bucket + 1) * every) + 1
+        next_low, next_high = high, min(int((bucket + 2) * every) + 1, n)
+        if bucket == threshold - 3:
+            next_low, next_high = n - 1, n
+        avg_x, avg_y = np.mean(x[next_low:next_high]), np.mean(y[next_low:next_high])
+        area = np.abs((x[anchor] - avg_x) * (y[low:high] - y[anchor]) - (x[anchor] - x[low:high]) * (avg_y - y[anchor]))
+        anchor = low + int(np.argmax(area))
+        chosen.append(anchor)
+    return chosen + [n - 1]
+
+def series(count, spike_at=None):
+    times = [START + timedelta(seconds=i) for i in range(count)]
+    values = [float(np.sin(i / 50)) for i in range(count)]
+    if spike_at is not None:
+        values[spike_at] = 10.0
+    return times, values
+
+def test_lttb_matches_reference():
+    rng = np.random.default_rng(7)
+    x = np.sort(rng.random(2000)) * 1000
+    y = rng.random(2000)
+    assert lttb_indices(x, y, 100).tolist() == reference_lttb(x, y, 100)
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_keeps_spikes_and_order(method):
+    """Test the point budget, time order and that a single spike survives"""
+    times, values = downsample(series(20000, spike_at=12345), 500, method)
+    assert 2 < len(times) <= 500
+    assert times == sorted(times)
+    assert 10.0 in values
+
+def test_minmax_keeps_bucket_extremes():
+    x = np.arange(8, dtype=float)
+    y = np.array([3, 1, 2, 5, 0, 4, 7, 6], dtype=float)
+    assert minmax_indices(x, y, 4).tolist() == [1, 3, 4, 6]
+
+def test_small_results_only_lose_nulls():
+    times, values = series(5)
+    values[2] = None
+    assert downsample((times, values), 100) == (times[:2] + times[3:], values[:2] + values[3:])
+
+def test_text_values_are_rejected():
+    with pytest.raises(ValueError):
+        downsample(([START], ["on"]), 10)
@@ -22,6 +22,15 @@ def test_ingest_empty_data(test_client):
     response = test_client.post("/ingest", json={"data": []})
     assert response.status_code in [200, 400]
 
+def test_ingest_wide_rows(test_client):
+    """Test that wide rows are expanded to one point per field"""
+    response = test_client.post("/ingest", json={"rows": [
+        {"time": "2024-01-15T10:00:00Z", "fields": {"temperature": 23.5, "humidity": 61.0, "status": "ok"}},
+        {"time": "2024-01-15T10:01:00Z", "tags": {"device": "a1"}, "fields": {"temperature": 24.0}}
+    ]})
+    assert response.status_code == 200
+    assert response.json()["ingested_count"] == 4
+
 def test_ingest_mixed_data_types(test_client):
     """Test ingesting mixed numeric and string data"""
     mixed_data = {
@@ -89,4 +98,101 @@ def test_ingest_missing_required_fields(test_client):
         ]
     }
     response = test_client.post("/ingest", json=incomplete_data)
-    assert response.status_code == 422 
\ No newline at end of file
+    assert response.status_code == 422 
+
+
+def test_ingest_naive_timestamp_after_registry_is_warm(test_client):
+    """Test that an offset-less timestamp is written as UTC once the metric is cached"""
+    point = {"time": "2024-01-15T10:00:00Z", "metric": "naive_metric", "value": 1.0}
+    assert test_client.post("/ingest", json={"data": [point]}).status_code == 200
+
+    naive = {"time": "2024-01-15T10:05:00", "metric": "naive_metric", "value": 2.0}
+    response = test_client.post("/ingest", json={"data": [point, naive]})
+    assert response.status_code == 200
+    assert response.json()["ingested_count"] == 2
+
+
+def test_ingest_invalid_points_rejected_or_skipped(test_client):
+    """Test that invalid points fail the batch with their indices, or are skipped with ?partial=true"""
+    batch = {
+        "data": [
+            {"time": "2024-01-15T10:00:00Z", "metric": "partial_metric", "value": 1.0},
+            {"time": "2999-01-15T10:00:00Z", "metric": "partial_metric", "value": 2.0},
+            {"time": "2024-01-15T10:01:00Z", "metric": "partial_metric", "value": "text"}
+        ]
+    }
+    response = test_client.post("/ingest", json=batch)
+    assert response.status_code == 400
+    assert [error["index"] for error in response.json()["detail"]["errors"]] == [1, 2]
+
+    response = test_client.post("/ingest?partial=true", json=batch)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["ingested_count"] == 1 and data["rejected_count"] == 2
+
+def test_ingest_buffered_accepts_and_pushes_back(test_client, sample_ingest_data, monkeypatch):
+    """Test that buffered ingest answers 202, then 503 with Retry-After once the buffer is full"""
+    import routes.ingest
+    from ingest_buffer import IngestBuffer
+
+    written = []
+    buffer = IngestBuffer(max_points=4, flush_points=100, flush_interval=10, writer=written.extend)
+    buffer.start()
+    monkeypatch.setattr(routes.ingest, "ingest_buffer", buffer)
+    monkeypatch.setattr(routes.ingest, "INGEST_BUFFER_ENABLED", True)
+
+    response = test_client.post("/ingest", json=sample_ingest_data)
+    assert response.status_code == 202
+    assert response.json()["accepted_count"] == 3
+
+    response = test_client.post("/ingest", json=sample_ingest_data)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+    stats = test_client.get("/ingest/buffer").json()
+    assert stats["queued"] == 3 and stats["rejected"] == 3
+
+    buffer.close(timeout=2)
+    assert len(written) == 3
+
+def test_ingest_line_protocol(test_client):
+    """Test streamed line protocol ingestion"""
+    body = "weather,city=nairobi temp=23.5,humidity=61i 1705314600000000000\nstatus value=\"ok\" 1705314600000000000\n"
+    response = test_client.post("/ingest/line", content=body)
+    assert response.status_code == 200
+    assert response.json()["ingested_count"] == 3
+
+def test_ingest_csv_and_ndjson(test_client):
+    """Test streamed CSV and NDJSON ingestion, and line numbers in parse errors"""
+    response = test_client.post("/ingest/csv", content="ts,co,light\n1705314600,0.0049,true\n1705314660,,false\n")
+    assert response.status_code == 200
+    assert response.json()["ingested_count"] == 3
+
+    response = test_client.post(
+        "/ingest/ndjson",
+        content='{"time": "2024-01-15T10:30:00Z", "metric": "temperature", "value": 23.5}\n{"metric": "temperature"}\n'
+    )
+    assert response.status_code == 400
+    assert "Line 2" in response.json()["detail"]
+
+def test_ingest_parse_error_in_middle_chunk(test_client, monkeypatch):
+    """Test that a parse error before the last chunk answers 400 with the points written before it"""
+    import routes.ingest
+    monkeypatch.setattr(routes.ingest, "INGEST_STREAM_CHUNK_BYTES", 64)
+
+    good = '{"time": "2024-01-15T10:30:00Z", "metric": "chunked", "value": 1.0}\n'
+    body = good * 2 + '{"metric": "chunked"}\n' + good * 4
+    response = test_client.post("/ingest/ndjson", content=body)
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert "Line 3" in detail and "(2 data points before it were ingested)" in detail
+
+def test_ingest_stream_validates_points(test_client):
+    """Test that streamed points get the batch validation of /ingest, reported by line"""
+    response = test_client.post("/ingest/csv", content="ts,co\n1705314600,0.1\n1705314660,inf\n")
+    assert response.status_code == 400
+    assert "Line 3" in response.json()["detail"]
+
+    response = test_client.post("/ingest/line", content="cpu usage=1 32503680000000000000\n")
+    assert response.status_code == 400
+    assert "future" in response.json()["detail"]
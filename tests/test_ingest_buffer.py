@@ -0,0 +1,129 @@
+import sys
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import psycopg2
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from ingest_buffer import IngestBuffer
+
+T0 = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+
+def points(count, metric="temperature"):
+    return [(T0, metric, float(i)) for i in range(count)]
+
+class FakeWriter:
+    def __init__(self, failures=(), poison=None):
+        self.batches = []
+        self.failures = list(failures)
+        self.poison = poison
+        self.written = threading.Event()
+
+    def __call__(self, rows):
+        if self.failures:
+            raise self.failures.pop(0)
+        if any(metric == self.poison for _, metric, _ in rows):
+            raise psycopg2.DataError("bad value")
+        self.batches.append(list(rows))
+        self.written.set()
+        return len(rows)
+
+def test_flushes_when_flush_points_are_waiting():
+    """Test that a full batch is written without waiting for the interval"""
+    writer = FakeWriter()
+    buffer = IngestBuffer(max_points=100, flush_points=5, flush_interval=10, writer=writer)
+    buffer.start()
+    assert buffer.offer(points(5))
+    assert writer.written.wait(2)
+    assert [len(batch) for batch in writer.batches] == [5]
+    buffer.close(timeout=2)
+
+def test_flushes_small_batches_on_interval():
+    """Test that requests arriving within one interval share a single write"""
+    writer = FakeWriter()
+    buffer = IngestBuffer(max_points=100, flush_points=50, flush_interval=0.05, writer=writer)
+    buffer.start()
+    assert buffer.offer(points(2))
+    assert buffer.offer(points(3))
+    assert writer.written.wait(2)
+    buffer.close(timeout=2)
+    assert [len(batch) for batch in writer.batches] == [5]
+    stats = buffer.get_stats()
+    assert stats["flushed"] == 5 and stats["flushes"] == 1 and stats["queued"] == 0
+
+def test_rejects_points_beyond_capacity():
+    """Test backpressure: a request that would overflow the buffer is refused whole"""
+    buffer = IngestBuffer(max_points=10, flush_points=100, flush_interval=10, writer=FakeWriter())
+    buffer.start()
+    assert buffer.offer(points(8))
+    assert not buffer.offer(points(3))
+    stats = buffer.get_stats()
+    assert stats["accepted"] == 8 and stats["rejected"] == 3 and stats["queued"] == 8
+    buffer.close(timeout=2)
+
+def test_rejects_when_not_started_or_closed():
+    """Test that points are only accepted while the flusher runs"""
+    buffer = IngestBuffer(max_points=10, flush_points=5, flush_interval=0.01, writer=FakeWriter())
+    assert not buffer.offer(points(1))
+    buffer.start()
+    buffer.close(timeout=2)
+    assert not buffer.offer(points(1))
+
+def test_retries_transient_errors_in_order():
+    """Test that a batch failing on a connection error is retried before newer points"""
+    writer = FakeWriter(failures=[psycopg2.OperationalError("connection lost")])
+    buffer = IngestBuffer(max_points=100, flush_points=3, flush_interval=0.01, writer=writer)
+    buffer.start()
+    first = points(3, "first")
+    assert buffer.offer(first)
+    assert writer.written.wait(2)
+    buffer.close(timeout=2)
+    assert writer.batches[0] == first
+    stats = buffer.get_stats()
+    assert stats["retries"] == 1 and stats["dropped"] == 0 and "connection lost" in stats["last_error"]
+
+def wait_for_dropped(buffer, count):
+    deadline = time.monotonic() + 2
+    while buffer.get_stats()["dropped"] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_drops_points_the_database_rejects():
+    """Test that a data error drops the rejected points instead of retrying forever"""
+    writer = FakeWriter(poison="temperature")
+    buffer = IngestBuffer(max_points=100, flush_points=3, flush_interval=0.01, writer=writer)
+    buffer.start()
+    assert buffer.offer(points(3))
+    wait_for_dropped(buffer, 3)
+    buffer.close(timeout=2)
+    stats = buffer.get_stats()
+    assert stats["dropped"] == 3 and stats["retries"] == 0 and writer.batches == []
+
+def test_rejected_batch_keeps_other_offers():
+    """Test that one poisoned offer coalesced with good ones only loses its own bad rows"""
+    writer = FakeWriter(poison="poison")
+    buffer = IngestBuffer(max_points=100, flush_points=50, flush_interval=0.05, writer=writer)
+    buffer.start()
+    assert buffer.offer(points(4, "first"))
+    assert buffer.offer(points(3, "good") + [(T0, "poison", 1.0)])
+    assert buffer.offer(points(5, "last"))
+    wait_for_dropped(buffer, 1)
+    buffer.close(timeout=2)
+    written = [point for batch in writer.batches for point in batch]
+    assert sorted(written) == sorted(points(4, "first") + points(3, "good") + points(5, "last"))
+    stats = buffer.get_stats()
+    assert stats["dropped"] == 1 and stats["flushed"] == 12 and stats["splits"] >= 1
+
+def test_close_drains_queued_points():
+    """Test that shutdown writes everything accepted before returning"""
+    writer = FakeWriter()
+    buffer = IngestBuffer(max_points=1000, flush_points=4, flush_interval=10, writer=writer)
+    buffer.start()
+    for _ in range(5):
+        assert buffer.offer(points(3))
+    buffer.close(timeout=2)
+    assert sum(len(batch) for batch in writer.batches) == 15
+    assert max(len(batch) for batch in writer.batches) <= 4
+    assert buffer.get_stats()["enabled"] is False
@@ -0,0 +1,151 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.ingest_formats import (
+    ParseError, LineChunker, CsvParser, chunk_lines, metric_name, split_metric_name,
+    expand_rows, parse_line_protocol, parse_ndjson
+)
+from models import WideRow
+from utils.bulk_writer import summarize_metrics, build_copy_buffer
+
+T0 = datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc)
+
+def test_metric_name_appends_sorted_tags():
+    """Test that tags are folded into the metric name in key order"""
+    assert metric_name("temperature") == "temperature"
+    assert metric_name("temperature", {"room": "b", "device": "a1"}) == "temperature{device=a1,room=b}"
+
+def test_split_metric_name_inverts_metric_name():
+    """Test that tagged names split back into the name and its tags"""
+    tags = {"device": "a1", "room": "b"}
+    assert split_metric_name(metric_name("temperature", tags)) == ("temperature", tags)
+    assert split_metric_name("temperature") == ("temperature", {})
+    assert split_metric_name("odd{name}") == ("odd{name}", {})
+
+def test_metric_name_escapes_separators_in_tags():
+    """Test that names and tags holding separators round-trip through the stored name"""
+    tags = {"loc": "a,b", "k=1": "{v}", "path": "c:\\tmp"}
+    name = metric_name("temp{x}", tags)
+    assert name == "temp\\{x\\}{k\\=1=\\{v\\},loc=a\\,b,path=c:\\\\tmp}"
+    assert split_metric_name(name) == ("temp{x}", tags)
+    assert split_metric_name("temp{loc=a,b}") == ("temp{loc=a,b}", {})
+
+def test_expand_rows():
+    """Test that wide rows become one point per field, with tags in the metric name"""
+    rows = [
+        WideRow(time=T0, tags={"device": "a1"}, fields={"temperature": 23.5, "status": "ok"}),
+        WideRow(time=T0, fields={"humidity": 61})
+    ]
+    assert expand_rows(rows) == [
+        (T0, "temperature{device=a1}", 23.5),
+        (T0, "status{device=a1}", "ok"),
+        (T0, "humidity", 61.0)
+    ]
+
+def test_expand_rows_normalizes_times_to_utc():
+    """Test that naive and offset row times both come out as aware UTC"""
+    rows = [
+        WideRow(time=T0.replace(tzinfo=None), fields={"a": 1.0}),
+        WideRow(time=T0.astimezone(timezone(timedelta(hours=3))), fields={"a": 2.0})
+    ]
+    times = [time for time, _, _ in expand_rows(rows)]
+    assert times == [T0, T0]
+    assert all(time.utcoffset() == timedelta(0) for time in times)
+
+def test_line_protocol_fields_tags_and_types():
+    """Test line protocol parsing of tags, field types and timestamps"""
+    points = parse_line_protocol([
+        'weather,city=nairobi temp=23.5,humidity=61i,raining=f 1705314600000000000',
+        '# comment',
+        'status value="machine start" 1705314600000000000'
+    ])
+    assert points == [
+        (T0, "weather.temp{city=nairobi}", 23.5),
+        (T0, "weather.humidity{city=nairobi}", 61.0),
+        (T0, "weather.raining{city=nairobi}", 0.0),
+        (T0, "status", "machine start")
+    ]
+
+def test_line_protocol_escapes_precision_and_default_time():
+    """Test escaped separators, timestamp precision and lines without a timestamp"""
+    points = parse_line_protocol(['cpu\\ load,host=a\\,b usage=0.5 1705314600'], precision='s')
+    assert points == [(T0, "cpu load.usage{host=a\\,b}", 0.5)]
+    assert split_metric_name(points[0][1]) == ("cpu load.usage", {"host": "a,b"})
+    assert parse_line_protocol(['cpu usage=1'], default_time=T0) == [(T0, "cpu.usage", 1.0)]
+
+def test_line_protocol_reports_line_numbers():
+    """Test that errors name the offending line"""
+    with pytest.raises(ParseError) as error:
+        parse_line_protocol(['cpu usage=1 1', 'cpu usage=oops 1'], first_line=10)
+    assert error.value.line == 11
+
+def test_ndjson_points():
+    """Test NDJSON objects with ISO and epoch times and both value types"""
+    points = parse_ndjson([
+        '{"time": "2024-01-15T10:30:00Z", "metric": "temperature", "value": 23}',
+        '',
+        '{"time": 1705314600, "metric": "event", "value": "machine_start"}'
+    ])
+    assert points == [(T0, "temperature", 23.0), (T0, "event", "machine_start")]
+    with pytest.raises(ParseError) as error:
+        parse_ndjson(['{"time": "2024-01-15T10:30:00Z", "metric": "t", "value": null}'])
+    assert error.value.line == 1
+
+def test_mixed_offsets_in_one_batch_are_utc():
+    """Test that offset and offset-less times of one metric summarize and COPY as UTC"""
+    points = parse_ndjson([
+        '{"time": "2024-01-15T13:30:00+03:00", "metric": "temperature", "value": 1}',
+        '{"time": "2024-01-15T10:31:00", "metric": "temperature", "value": 2}'
+    ])
+    assert summarize_metrics(points) == {"temperature": ("number", T0.replace(minute=31))}
+    lines = build_copy_buffer(points, {"temperature": 1}).read().splitlines()
+    assert [line.split("\t")[0] for line in lines] == ["2024-01-15T10:30:00+00:00", "2024-01-15T10:31:00+00:00"]
+
+def test_csv_wide_rows_like_the_iot_file():
+    """Test one point per non-empty cell of the IoT telemetry columns"""
+    parse = CsvParser()
+    points = parse([
+        '"ts","device","co","light"',
+        '"1.7053146E9","b8:27:eb:bf:9d:51","0.0049","false"',
+        '"1705314600","b8:27:eb:bf:9d:52","","true"'
+    ])
+    assert points == [
+        (T0, "device", "b8:27:eb:bf:9d:51"), (T0, "co", 0.0049), (T0, "light", 0.0),
+        (T0, "device", "b8:27:eb:bf:9d:52"), (T0, "light", 1.0)
+    ]
+
+def test_csv_long_rows_and_header_across_chunks():
+    """Test time,metric,value rows, with the header only in the first chunk"""
+    parse = CsvParser()
+    assert parse(['time,metric,value', '2024-01-15T10:30:00Z,temperature,23.5']) == [(T0, "temperature", 23.5)]
+    assert parse(['2024-01-15T10:30:00Z,event,start'], first_line=3) == [(T0, "event", "start")]
+    with pytest.raises(ParseError) as error:
+        parse(['2024-01-15T10:30:00Z,event'], first_line=4)
+    assert error.value.line == 4
+
+def test_csv_requires_a_time_column():
+    """Test that a header without a time column is rejected"""
+    with pytest.raises(ParseError):
+        CsvParser()(['metric,value'])
+
+def test_chunker_cuts_whole_lines_with_line_numbers():
+    """Test that chunks end on line breaks, stay near the size budget and carry line numbers"""
+    chunker = LineChunker(chunk_bytes=10, max_line_bytes=100)
+    chunks = list(chunker.feed(b"aaaa\nbbbbbbbbbbbb\ncc\nd"))
+    chunks += list(chunker.feed(b"d\nee"))
+    chunks.append(chunker.finish())
+    assert chunks == [(1, b"aaaa\nbbbbbbbbbbbb\n"), (3, b"cc\ndd\nee\n")]
+    assert [line for first, chunk in chunks for line in chunk_lines(chunk, first)] == \
+        ["aaaa", "bbbbbbbbbbbb", "cc", "dd", "ee"]
+
+def test_chunker_rejects_overlong_lines():
+    """Test that an unterminated line past the limit fails instead of growing memory"""
+    chunker = LineChunker(chunk_bytes=1000, max_line_bytes=8)
+    with pytest.raises(ParseError) as error:
+        list(chunker.feed(b"ok\n" + b"x" * 20))
+    assert error.value.line == 2
@@ -0,0 +1,151 @@
+import sys
+import os
+import time
+from datetime import datetime, timezone
+import psycopg2
+import pytest
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from ingest_spool import IngestSpool, SpoolSegment, encode_points, decode_points, HEADER, SEGMENT_SUFFIX, SpoolLockedError
+
+T0 = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+
+def points(count, metric="temperature"):
+    return [(T0, metric, float(i)) for i in range(count)]
+
+class FakeWriter:
+    """Records written batches; raises queued errors first, and DataError for metric 'bad'"""
+    def __init__(self, failures=()):
+        self.batches = []
+        self.applied = set()
+        self.failures = list(failures)
+
+    def __call__(self, batches):
+        if self.failures:
+            raise self.failures.pop(0)
+        if any(metric == "bad" for _, rows in batches for _, metric, _ in rows):
+            raise psycopg2.DataError("bad value")
+        fresh = [(batch_id, rows) for batch_id, rows in batches if batch_id not in self.applied]
+        self.applied.update(batch_id for batch_id, _ in fresh)
+        self.batches.extend(fresh)
+        return sum(len(rows) for _, rows in fresh), len(batches) - len(fresh)
+
+def make_spool(directory, writer, **kwargs):
+    options = dict(segment_bytes=4096, max_bytes=1 << 20, drain_points=100, drain_interval=0.01)
+    options.update(kwargs)
+    return IngestSpool(str(directory), writer=writer, pruner=lambda: None, **options)
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_points_round_trip():
+    """Test that spooled points decode to the same times, metrics and values"""
+    rows = [(T0, "temperature", 23.5), (T0, "event", "machine_start")]
+    assert decode_points(encode_points(rows)) == rows
+
+def test_drains_appended_batches(tmp_path):
+    """Test that appended batches are written and the drained segments removed"""
+    writer = FakeWriter()
+    spool = make_spool(tmp_path, writer)
+    spool.start()
+    ids = [spool.append(points(20)) for _ in range(10)]
+    assert all(ids)
+    assert wait_for(lambda: spool.get_stats()["pending_batches"] == 0)
+    spool.close()
+    assert [batch_id for batch_id, _ in writer.batches] == ids
+    stats = spool.get_stats()
+    assert stats["drained_points"] == 200 and stats["lag_seconds"] == 0
+    segments = [name for name in os.listdir(tmp_path) if name.endswith(SEGMENT_SUFFIX)]
+    assert len(segments) == 1
+
+def test_replays_after_outage_and_restart(tmp_path):
+    """Test that batches accepted while the database is down survive a restart and are written once"""
+    down = make_spool(tmp_path, FakeWriter(failures=[psycopg2.OperationalError("down")] * 1000))
+    down.start()
+    ids = [down.append(points(5)) for _ in range(3)]
+    assert wait_for(lambda: down.get_stats()["retries"] > 0)
+    stats = down.get_stats()
+    assert stats["pending_batches"] == 3 and stats["pending_points"] == 15
+    down.close()
+
+    writer = FakeWriter()
+    restarted = make_spool(tmp_path, writer)
+    restarted.start()
+    assert wait_for(lambda: restarted.get_stats()["pending_batches"] == 0)
+    restarted.close()
+    assert [batch_id for batch_id, _ in writer.batches] == ids
+
+def test_replay_skips_batches_already_applied(tmp_path):
+    """Test that a batch committed before its checkpoint was saved is not written twice"""
+    writer = FakeWriter()
+    spool = make_spool(tmp_path, writer)
+    spool.start()
+    batch_id = spool.append(points(5))
+    assert wait_for(lambda: spool.get_stats()["pending_batches"] == 0)
+    spool.close()
+
+    # Lose the checkpoint, as if the process died right after the commit
+    os.remove(tmp_path / "checkpoint.json")
+    replayed = make_spool(tmp_path, writer)
+    replayed.start()
+    assert wait_for(lambda: replayed.get_stats()["pending_batches"] == 0)
+    replayed.close()
+    assert [written for written, _ in writer.batches] == [batch_id]
+    assert replayed.get_stats()["duplicate_batches"] == 1
+
+def test_recovery_ignores_torn_frame(tmp_path):
+    """Test that a frame whose payload does not match its checksum ends the segment"""
+    spool = make_spool(tmp_path, FakeWriter(failures=[psycopg2.OperationalError("down")] * 1000))
+    spool.start()
+    spool.append(points(5))
+    spool.append(points(5))
+    spool.close()
+
+    path = next(tmp_path.glob(f"*{SEGMENT_SUFFIX}"))
+    segment = SpoolSegment(str(path), 0)
+    second = segment.read(0).end
+    segment.map[second + HEADER.size] ^= 0xFF
+    segment.close()
+
+    assert SpoolSegment(str(path), 0).end == second
+
+def test_rejects_batches_beyond_disk_bound(tmp_path):
+    """Test that the spool refuses a batch that would need a segment past max_bytes"""
+    spool = make_spool(tmp_path, FakeWriter(failures=[psycopg2.OperationalError("down")] * 1000),
+                       segment_bytes=2048, max_bytes=4096)
+    spool.start()
+    accepted = [spool.append(points(10)) for _ in range(20)]
+    spool.close()
+    assert None in accepted
+    stats = spool.get_stats()
+    assert stats["rejected_batches"] == accepted.count(None)
+    assert stats["disk_bytes"] <= 4096
+
+def test_rejected_batch_does_not_block_others(tmp_path):
+    """Test that a batch the database rejects is dropped alone and the rest are written"""
+    writer = FakeWriter()
+    spool = make_spool(tmp_path, writer, drain_interval=0.05)
+    spool.start()
+    spool_ids = [spool.append(points(3)), spool.append(points(3, "bad")), spool.append(points(3))]
+    assert wait_for(lambda: spool.get_stats()["pending_batches"] == 0)
+    spool.close()
+    assert [batch_id for batch_id, _ in writer.batches] == [spool_ids[0], spool_ids[2]]
+    assert spool.get_stats()["dropped_batches"] == 1
+
+def test_spool_directory_has_a_single_writer(tmp_path):
+    """Test that a second spool on the same directory refuses to start until the first closes"""
+    first = make_spool(tmp_path, FakeWriter())
+    first.start()
+    second = make_spool(tmp_path, FakeWriter())
+    with pytest.raises(SpoolLockedError):
+        second.start()
+    assert second.append(points(1)) is None
+    first.close()
+    second.start()
+    assert second.append(points(1)) is not None
+    second.close()
@@ -32,6 +32,16 @@ def test_ingest_request_model():
     assert isinstance(request.data[0].value, float)
     assert isinstance(request.data[1].value, str)
 
+def test_ingest_request_wide_rows():
+    """Test wide rows alongside (or instead of) data points"""
+    request = IngestRequest(rows=[
+        {"time": "2024-01-15T10:00:00Z", "tags": {"device": "a1"}, "fields": {"temperature": 23, "status": "ok"}}
+    ])
+    assert request.data == []
+    assert request.rows[0].fields == {"temperature": 23.0, "status": "ok"}
+    assert request.rows[0].tags == {"device": "a1"}
+    assert IngestRequest(rows=[{"time": "2024-01-15T10:00:00Z", "fields": {}}]).rows[0].tags is None
+
 def test_query_request_model():
     """Test QueryRequest model"""
     query = QueryRequest(
@@ -84,4 +94,7 @@ def test_aggregation_function_enum():
     assert AggregationFunction.SUM == "sum"
     assert AggregationFunction.MIN == "min"
     assert AggregationFunction.MAX == "max"
-    assert AggregationFunction.COUNT == "count"
\ No newline at end of file
+    assert AggregationFunction.COUNT == "count"
+    assert AggregationFunction.P95 == "p95"
+    assert AggregationFunction.STDDEV == "stddev"
+    assert AggregationFunction.RATE == "rate"
\ No newline at end of file
@@ -0,0 +1,66 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.partials import tiles, finer_intervals, bucket_start, partials_from_rows, rebucket, finalize
+from utils.codec import encode_table, decode_table
+
+START = datetime(2024, 1, 15, tzinfo=timezone.utc)
+
+def hourly(values_by_hour):
+    """Partials rows for hourly buckets, each holding the given values"""
+    rows = []
+    for hour, values in values_by_hour:
+        present = [value for value in values if value is not None]
+        rows.append((
+            START + timedelta(hours=hour),
+            sum(present) if present else None, len(values), len(present),
+            min(present) if present else None, max(present) if present else None
+        ))
+    return partials_from_rows(rows)
+
+def test_tiling():
+    assert tiles('1 hour', '6 hours')
+    assert tiles('1 day', '7 days')
+    assert tiles('6 hours', '1 month')
+    assert not tiles('7 days', '1 month')
+    assert not tiles('2 hours', '1 hour')
+    assert not tiles('1 hour', '1 hour')
+    assert finer_intervals('1 hour')[:2] == ['30 minutes', '10 minutes']
+    assert finer_intervals('1 second') == []
+
+def test_bucket_start_matches_time_bucket():
+    """Test the 2000-01-03 origin for fixed widths and calendar months"""
+    monday = datetime(2024, 1, 15, tzinfo=timezone.utc)
+    assert bucket_start(monday + timedelta(days=3), '7 days') == monday
+    assert bucket_start(datetime(2024, 1, 15, 17, 59, tzinfo=timezone.utc), '6 hours') == monday + timedelta(hours=12)
+    assert bucket_start(datetime(2024, 2, 29, 23, tzinfo=timezone.utc), '1 month') == datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+def test_avg_is_exact_from_sum_and_count():
+    """Test that AVG weighs buckets by their value counts, not one per bucket"""
+    partials = hourly([(0, [1.0]), (1, [2.0, 3.0, 4.0]), (2, [None, 6.0])])
+    times, values = finalize(rebucket(partials, '6 hours'), 'avg')
+    assert times == [START]
+    assert values == [(1 + 2 + 3 + 4 + 6) / 5]
+
+def test_rebucket_other_aggregations():
+    partials = hourly([(0, [1.0, 5.0]), (5, [2.0]), (6, [None]), (7, [-3.0])])
+    coarse = rebucket(partials, '6 hours')
+    assert coarse[0] == [START, START + timedelta(hours=6)]
+    assert finalize(coarse, 'sum')[1] == [8.0, -3.0]
+    assert finalize(coarse, 'count')[1] == [3.0, 2.0]
+    assert finalize(coarse, 'min')[1] == [1.0, -3.0]
+    assert finalize(coarse, 'max')[1] == [5.0, -3.0]
+
+def test_all_null_bucket():
+    partials = hourly([(0, [None, None])])
+    assert finalize(partials, 'avg')[1] == [None]
+    assert finalize(partials, 'sum')[1] == [None]
+    assert finalize(partials, 'count')[1] == [2.0]
+
+def test_partials_survive_the_cache_codec():
+    partials = hourly([(0, [1.0, 2.0]), (1, [None])])
+    assert decode_table(encode_table(*partials)) == partials
@@ -0,0 +1,172 @@
+import sys
+import os
+import threading
+import time
+import pytest
+import psycopg2
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from database import ConnectionPool, PoolTimeout
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.executed.append(query)
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.in_transaction = False
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_INTRANS if self.in_transaction else psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    return ConnectionPool(connect, **kwargs), created
+
+def test_pool_reuses_connections():
+    """Test that a returned connection is handed out again"""
+    pool, created = make_pool(max_size=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(created) == 1
+
+def test_pool_open_prefills_min_size():
+    """Test that open() creates min_size connections"""
+    pool, created = make_pool(min_size=3, max_size=5)
+    pool.open()
+    stats = pool.get_stats()
+    assert len(created) == 3
+    assert stats["size"] == 3
+    assert stats["idle"] == 3
+
+def test_pool_times_out_when_exhausted():
+    """Test that checkout blocks then fails when all connections are in use"""
+    pool, _ = make_pool(max_size=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.get_stats()["checkout_timeouts"] == 1
+
+def test_pool_waiter_gets_returned_connection():
+    """Test that a blocked checkout is served when a connection comes back"""
+    pool, _ = make_pool(max_size=1, timeout=2)
+    conn = pool.getconn()
+    result = {}
+
+    def waiter():
+        result["conn"] = pool.getconn()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert pool.get_stats()["waiting"] == 1
+    pool.putconn(conn)
+    thread.join(1)
+    assert result["conn"] is conn
+
+def test_pool_rolls_back_open_transactions():
+    """Test that connections returned mid-transaction are rolled back"""
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    conn.in_transaction = True
+    pool.putconn(conn)
+    assert conn.in_transaction is False
+    assert pool.getconn() is conn
+
+def test_pool_health_check_replaces_broken_connection():
+    """Test that a connection failing its checkout ping is replaced"""
+    pool, created = make_pool(check_interval=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert conn.closed
+    assert len(created) == 2
+    assert pool.get_stats()["failed_health_checks"] == 1
+
+def test_pool_discards_closed_connections():
+    """Test that connections closed while checked out are not reused"""
+    pool, created = make_pool()
+    conn = pool.getconn()
+    conn.close()
+    pool.putconn(conn)
+    assert pool.get_stats()["size"] == 0
+    assert pool.getconn() is not conn
+
+def test_pool_recycles_idle_connections_above_min_size():
+    """Test that idle connections beyond min_size are closed after max_idle"""
+    pool, created = make_pool(min_size=1, max_size=3, max_idle=0.01)
+    conns = [pool.getconn() for _ in range(3)]
+    for conn in conns:
+        pool.putconn(conn)
+    time.sleep(0.02)
+
+    stats = pool.get_stats()
+    assert stats["size"] == 1
+    assert stats["connections_recycled"] == 2
+    assert sum(1 for conn in created if conn.closed) == 2
+
+def test_pool_stats_track_in_use():
+    """Test in-use and checkout counters"""
+    pool, _ = make_pool(max_size=3)
+    first = pool.getconn()
+    pool.getconn()
+    stats = pool.get_stats()
+    assert stats["in_use"] == 2
+    assert stats["checkouts"] == 2
+    pool.putconn(first)
+    assert pool.get_stats()["in_use"] == 1
+
+def test_pool_counters_are_exact_under_concurrency():
+    """Test that stats counters lose no updates when threads share the pool"""
+    pool, created = make_pool(max_size=4, max_lifetime=0)
+
+    def worker():
+        for _ in range(200):
+            pool.putconn(pool.getconn())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.get_stats()
+    assert stats["checkouts"] == 1600
+    assert stats["connections_created"] == len(created) == 1600
+    assert stats["connections_recycled"] == 1600
+
+def test_pool_stats_endpoint(test_client):
+    """Test the pool statistics endpoint"""
+    response = test_client.get("/database/pool")
+    assert response.status_code == 200
+    data = response.json()
+    for key in ("in_use", "waiting", "idle", "avg_checkout_ms", "max_size"):
+        assert key in data
@@ -4,9 +4,13 @@ import os
 app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
 sys.path.insert(0, app_dir)
 
+import json
 import pytest
 from fastapi.testclient import TestClient
 from main import app
+from utils.codec import decode_columns, column_values
+from utils.cache import cache_manager
+from database import get_db_connection
 
 def test_query_existing_metric(test_client, clean_db):
     """Test querying an existing metric"""
@@ -171,4 +175,310 @@ def test_query_all_aggregation_functions(test_client, clean_db):
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
-        assert len(data) > 0
\ No newline at end of file
+        assert len(data) > 0
+
+def test_query_cache_invalidated_by_overlapping_ingest(test_client, clean_db):
+    """Test that ingesting into a cached window refreshes the cached result"""
+    point = {"time": "2024-01-15T10:00:00Z", "metric": "temperature", "value": 23.5}
+    response = test_client.post("/ingest", json={"data": [point]})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T09:00:00Z",
+        "end_time": "2024-01-15T11:00:00Z"
+    }
+    assert len(test_client.post("/query", json=query_data).json()) == 1
+    
+    late_point = {"time": "2024-01-15T10:30:00Z", "metric": "temperature", "value": 24.0}
+    response = test_client.post("/ingest", json={"data": [late_point]})
+    assert response.status_code == 200
+    
+    assert len(test_client.post("/query", json=query_data).json()) == 2
+
+def test_query_streaming(test_client, clean_db):
+    """Test NDJSON and chunked-array streaming return the same points as the buffered route"""
+    points = [
+        {"time": f"2024-01-15T10:0{i}:00Z", "metric": "temperature", "value": 20.0 + i}
+        for i in range(5)
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T09:00:00Z",
+        "end_time": "2024-01-15T11:00:00Z"
+    }
+    buffered = test_client.post("/query", json=query_data).json()
+    
+    response = test_client.post("/query", json=query_data, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == buffered
+    
+    response = test_client.post("/query", json={**query_data, "stream": True})
+    assert response.status_code == 200
+    assert response.json() == buffered
+    
+    response = test_client.post("/query", json={**query_data, "metric": "missing", "stream": True})
+    assert response.status_code == 404
+
+def test_query_columnar_formats(test_client, clean_db):
+    """Test columnar JSON and binary responses carry the same points as the default format"""
+    points = [
+        {"time": f"2024-01-15T10:0{i}:00Z", "metric": "temperature", "value": 20.0 + i}
+        for i in range(3)
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T09:00:00Z",
+        "end_time": "2024-01-15T11:00:00Z"
+    }
+    buffered = test_client.post("/query", json=query_data).json()
+    
+    response = test_client.post("/query", json=query_data,
+                                headers={"Accept": "application/vnd.timeseries.columns+json"})
+    assert response.status_code == 200
+    columns = response.json()
+    assert columns["values"] == [point["value"] for point in buffered]
+    assert len(columns["times"]) == len(buffered)
+    
+    response = test_client.post("/query", json=query_data,
+                                headers={"Accept": "application/vnd.timeseries.columns"})
+    assert response.status_code == 200
+    times, decoded = decode_columns(response.content)
+    assert times.tolist() == columns["times"]
+    assert column_values(decoded["value"]) == columns["values"]
+
+def test_query_batch(test_client, clean_db):
+    """Test batch queries by name and by pattern match the single-metric route"""
+    points = [
+        {"time": "2024-01-15T10:00:00Z", "metric": "temperature", "value": 23.5},
+        {"time": "2024-01-15T10:05:00Z", "metric": "temperature", "value": 24.5},
+        {"time": "2024-01-15T10:00:00Z", "metric": "temp_outside", "value": 5.0},
+        {"time": "2024-01-15T10:00:00Z", "metric": "humidity", "value": 40.0}
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    window = {"start_time": "2024-01-15T09:00:00Z", "end_time": "2024-01-15T11:00:00Z"}
+    single = test_client.post("/query", json={"metric": "temperature", **window}).json()
+    
+    response = test_client.post("/query/batch", json={"metrics": ["temperature", "humidity"], **window})
+    assert response.status_code == 200
+    data = response.json()
+    assert list(data) == ["temperature", "humidity"]
+    assert data["temperature"] == single
+    assert [point["value"] for point in data["humidity"]] == [40.0]
+    
+    response = test_client.post("/query/batch", json={
+        "pattern": "temp*", "aggregation": "avg", "interval": "1 hour", **window
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert sorted(data) == ["temp_outside", "temperature"]
+    assert data["temperature"][0]["value"] == 24.0
+    
+    response = test_client.post("/query/batch", json={
+        "metrics": ["temperature", "humidity"], "format": "wide", **window
+    })
+    assert response.status_code == 200
+    assert response.json() == [
+        {"time": "2024-01-15T10:00:00Z", "tags": {}, "fields": {"temperature": 23.5, "humidity": 40.0}},
+        {"time": "2024-01-15T10:05:00Z", "tags": {}, "fields": {"temperature": 24.5}}
+    ]
+    
+    response = test_client.post("/query/batch", json={"metrics": ["temperature", "missing"], **window})
+    assert response.status_code == 404
+    
+    response = test_client.post("/query/batch", json=window)
+    assert response.status_code == 400
+
+def refresh_rollup(view):
+    """Materialize a continuous aggregate now instead of waiting for its policy"""
+    with get_db_connection() as conn:
+        conn.autocommit = True
+        try:
+            conn.cursor().execute(f"CALL refresh_continuous_aggregate('{view}', NULL, NULL)")
+        finally:
+            conn.autocommit = False
+
+def test_query_served_from_rollup(test_client, clean_db):
+    """Test that materialized hours come from the rollup and match raw results, including late data"""
+    points = [
+        {"time": f"2024-01-15T{hour:02d}:{minute:02d}:00Z", "metric": "temperature", "value": hour + minute / 60}
+        for hour in range(9, 12) for minute in (0, 20, 40)
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T09:00:00Z",
+        "end_time": "2024-01-15T11:59:59Z",
+        "aggregation": "avg",
+        "interval": "1 hour"
+    }
+    response = test_client.post("/query", json=query_data)
+    assert response.headers["x-query-source"] == "raw"
+    raw = response.json()
+    
+    refresh_rollup("time_series_1h")
+    cache_manager.clear_cache()
+    response = test_client.post("/query", json=query_data)
+    assert response.headers["x-query-source"].startswith("time_series_1h")
+    rolled = response.json()
+    assert [point["time"] for point in rolled] == [point["time"] for point in raw]
+    assert [point["value"] for point in rolled] == pytest.approx([point["value"] for point in raw])
+    
+    late_point = {"time": "2024-01-15T10:50:00Z", "metric": "temperature", "value": 100.0}
+    response = test_client.post("/ingest", json={"data": [late_point]})
+    assert response.status_code == 200
+    
+    data = test_client.post("/query", json=query_data).json()
+    assert data[1]["value"] == pytest.approx((10 + 10 + 1 / 3 + 10 + 2 / 3 + 100) / 4)
+
+def test_query_rebucketed_from_finer_partials(test_client, clean_db):
+    """Test that a coarser interval over a cached window is rebuilt from cached partials"""
+    points = [
+        {"time": f"2024-01-15T{hour:02d}:30:00Z", "metric": "temperature", "value": float(hour)}
+        for hour in range(0, 12)
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T00:00:00Z",
+        "end_time": "2024-01-15T11:59:59Z",
+        "aggregation": "avg",
+        "interval": "1 hour"
+    }
+    response = test_client.post("/query", json=query_data)
+    assert response.headers["x-query-source"] != "cache"
+    
+    for aggregation, expected in (("avg", [2.5, 8.5]), ("sum", [15.0, 51.0]), ("max", [5.0, 11.0])):
+        response = test_client.post(
+            "/query", json={**query_data, "aggregation": aggregation, "interval": "6 hours"}
+        )
+        assert response.headers["x-query-source"] == "cache"
+        assert [point["value"] for point in response.json()] == expected
+
+def test_query_sliding_window_reuses_segments(test_client, clean_db):
+    """Test that a shifted historical window is assembled from cached segments"""
+    points = [
+        {"time": f"2024-01-15T{hour:02d}:{minute:02d}:00Z", "metric": "temperature", "value": float(hour)}
+        for hour in range(0, 24) for minute in (10, 40)
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T00:00:00Z",
+        "end_time": "2024-01-15T20:59:59Z",
+        "aggregation": "avg",
+        "interval": "1 hour"
+    }
+    response = test_client.post("/query", json=query_data)
+    assert "cache" not in response.headers["x-query-source"]
+    
+    shifted = {**query_data, "start_time": "2024-01-15T02:30:00Z", "end_time": "2024-01-15T22:59:59Z"}
+    response = test_client.post("/query", json=shifted)
+    assert response.headers["x-query-source"].startswith("cache+")
+    data = response.json()
+    assert [point["value"] for point in data] == [2.0] + [float(hour) for hour in range(3, 23)]
+
+def test_query_downsampled(test_client, clean_db):
+    """Test that max_points caps a raw range and keeps its extremes"""
+    points = [
+        {"time": f"2024-01-15T10:{i // 60:02d}:{i % 60:02d}Z", "metric": "temperature",
+         "value": 100.0 if i == 1234 else float(i % 50)}
+        for i in range(3000)
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T10:00:00Z",
+        "end_time": "2024-01-15T11:00:00Z",
+        "max_points": 200
+    }
+    for method in ("lttb", "minmax"):
+        response = test_client.post("/query", json={**query_data, "downsample": method})
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) <= 200
+        assert max(point["value"] for point in data) == 100.0
+    
+    response = test_client.post("/query", json={**query_data, "max_points": 1})
+    assert response.status_code == 400
+
+def test_query_extended_aggregations(test_client, clean_db):
+    """Test percentiles, spread, first/last, delta and per-second rate per bucket"""
+    points = [
+        {"time": f"2024-01-15T10:{minute:02d}:00Z", "metric": "requests_total", "value": float(value)}
+        for minute, value in ((0, 100), (10, 160), (20, 220), (30, 280), (50, 400))
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    expected = {
+        "p50": 220.0,
+        "stddev": 115.41230437002807,
+        "variance": 13320.0,
+        "first": 100.0,
+        "last": 400.0,
+        "delta": 300.0,
+        "rate": 300.0 / 3000
+    }
+    for aggregation, value in expected.items():
+        query_data = {
+            "metric": "requests_total",
+            "start_time": "2024-01-15T10:00:00Z",
+            "end_time": "2024-01-15T10:59:59Z",
+            "aggregation": aggregation,
+            "interval": "1 hour"
+        }
+        response = test_client.post("/query", json=query_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 1
+        assert data[0]["value"] == pytest.approx(value)
+
+def test_query_gap_fill(test_client, clean_db):
+    """Test that every fill mode returns one value per bucket of the window"""
+    points = [
+        {"time": "2024-01-15T10:15:00Z", "metric": "temperature", "value": 10.0},
+        {"time": "2024-01-15T13:15:00Z", "metric": "temperature", "value": 40.0}
+    ]
+    response = test_client.post("/ingest", json={"data": points})
+    assert response.status_code == 200
+    
+    query_data = {
+        "metric": "temperature",
+        "start_time": "2024-01-15T10:00:00Z",
+        "end_time": "2024-01-15T13:59:59Z",
+        "aggregation": "avg",
+        "interval": "1 hour"
+    }
+    expected = {
+        "null": [10.0, None, None, 40.0],
+        "previous": [10.0, 10.0, 10.0, 40.0],
+        "linear": [10.0, 20.0, 30.0, 40.0]
+    }
+    for fill, values in expected.items():
+        response = test_client.post("/query", json={**query_data, "fill": fill})
+        assert response.status_code == 200
+        assert [point["value"] for point in response.json()] == values
+    
+    response = test_client.post("/query", json={**query_data, "fill": "constant", "fill_value": 0})
+    assert [point["value"] for point in response.json()] == [10.0, 0.0, 0.0, 40.0]
+    
+    response = test_client.post("/query", json={**query_data, "fill": "constant"})
+    assert response.status_code == 400
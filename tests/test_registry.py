@@ -0,0 +1,91 @@
+import sys
+import os
+import time
+from datetime import datetime, timezone
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.registry import MetricRegistry, MetricEntry, metric_registry, lookup_metrics
+
+NOW = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+
+def entry(metric_id, value_type="number"):
+    return MetricEntry(metric_id, value_type, NOW, NOW)
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    def execute(self, query, params=None):
+        self.params = params
+
+    def fetchall(self):
+        return self.rows
+
+def test_registry_get_and_put():
+    """Test basic lookups and hit/miss counters"""
+    registry = MetricRegistry()
+    assert registry.get("temperature") is None
+    registry.put("temperature", entry(1))
+    assert registry.get("temperature").id == 1
+    stats = registry.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_registry_evicts_least_recently_used():
+    """Test that the registry stays within max_entries"""
+    registry = MetricRegistry(max_entries=2)
+    registry.put("a", entry(1))
+    registry.put("b", entry(2))
+    registry.get("a")
+    registry.put("c", entry(3))
+    assert registry.get("b") is None
+    assert registry.get("a") is not None
+    assert registry.get("c") is not None
+
+def test_registry_entries_expire():
+    """Test that entries older than the TTL are dropped"""
+    registry = MetricRegistry(ttl_seconds=0.01)
+    registry.put("temperature", entry(1))
+    time.sleep(0.02)
+    assert registry.get("temperature") is None
+
+def test_registry_update_replaces_changed_type():
+    """Test that a committed type change replaces the cached entry"""
+    registry = MetricRegistry()
+    registry.put("event", entry(1, "number"))
+    registry.update({"event": entry(1, "string")})
+    assert registry.get("event").value_type == "string"
+
+def test_registry_warm_loads_rows():
+    """Test warming the registry from the metrics table"""
+    registry = MetricRegistry(max_entries=5)
+    rows = [
+        {"id": 2, "name": "humidity", "value_type": "number", "first_seen": NOW, "last_seen": NOW},
+        {"id": 1, "name": "event", "value_type": "string", "first_seen": NOW, "last_seen": NOW}
+    ]
+    cursor = FakeCursor(rows)
+    assert registry.warm(cursor) == 2
+    assert cursor.params == (5,)
+    assert registry.get("event").value_type == "string"
+    assert registry.get("humidity").id == 2
+
+def test_lookup_metrics_queries_only_misses():
+    """Test that batch lookups read registry misses in one query and cache them"""
+    metric_registry.clear()
+    metric_registry.put("temperature", entry(1))
+    cursor = FakeCursor([
+        {"id": 2, "name": "humidity", "value_type": "number", "first_seen": NOW, "last_seen": NOW}
+    ])
+
+    found = lookup_metrics(cursor, ["temperature", "humidity", "missing"])
+    assert {name: found[name].id for name in found} == {"temperature": 1, "humidity": 2}
+    assert cursor.params == (["humidity", "missing"],)
+    assert metric_registry.get("humidity").id == 2
+
+    cursor = FakeCursor([])
+    lookup_metrics(cursor, ["temperature", "humidity"])
+    assert cursor.params is None
+    metric_registry.clear()
@@ -0,0 +1,78 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.rollups import plan_rollup, rollup_query, rollup_params, _from_internal, EPOCH
+
+def at(hour, minute=0, day=15):
+    return datetime(2024, 1, day, hour, minute, tzinfo=timezone.utc)
+
+FAR_FUTURE = datetime(2100, 1, 1, tzinfo=timezone.utc)
+ALL_CURRENT = {"time_series_1d": FAR_FUTURE, "time_series_1h": FAR_FUTURE, "time_series_1m": FAR_FUTURE}
+
+def test_coarsest_rollup_that_tiles_the_interval():
+    """Test that the planner picks the widest rollup whose buckets divide the interval"""
+    plan = plan_rollup("1 day", at(0, day=1), at(0, day=20), ALL_CURRENT)
+    assert plan.rollup.view == "time_series_1d"
+
+    plan = plan_rollup("6 hours", at(0, day=1), at(0, day=20), ALL_CURRENT)
+    assert plan.rollup.view == "time_series_1h"
+
+    plan = plan_rollup("5 minutes", at(9), at(11), ALL_CURRENT)
+    assert plan.rollup.view == "time_series_1m"
+
+def test_intervals_finer_than_rollups_use_raw():
+    assert plan_rollup("30 seconds", at(0, day=1), at(0, day=20), ALL_CURRENT) is None
+    assert plan_rollup("1 second", at(9), at(11), ALL_CURRENT) is None
+
+def test_partial_edges_come_from_raw():
+    """Test that only whole rollup buckets inside the window are read from the rollup"""
+    plan = plan_rollup("1 hour", at(9, 30), at(17, 15), ALL_CURRENT)
+    assert plan.rollup.view == "time_series_1h"
+    assert (plan.start, plan.end) == (at(10), at(17))
+    assert plan.source == "time_series_1h+raw"
+
+    # An inclusive end one microsecond before a boundary covers the whole last bucket
+    plan = plan_rollup("1 hour", at(9), at(17) - timedelta(microseconds=1), ALL_CURRENT)
+    assert (plan.start, plan.end) == (at(9), at(17))
+    assert plan.source == "time_series_1h"
+
+def test_falls_back_to_finer_rollup_for_short_windows():
+    """Test that a window without a whole day still uses hourly buckets"""
+    plan = plan_rollup("1 day", at(3), at(20), ALL_CURRENT)
+    assert plan.rollup.view == "time_series_1h"
+    assert (plan.start, plan.end) == (at(3), at(20))
+
+def test_unmaterialized_tail_comes_from_raw():
+    """Test that the watermark caps the rollup and missing rollups are skipped"""
+    watermarks = {"time_series_1h": at(12, 30)}
+    plan = plan_rollup("1 hour", at(9), at(17), watermarks)
+    assert (plan.start, plan.end) == (at(9), at(12))
+    assert plan.source == "time_series_1h+raw"
+
+    assert plan_rollup("1 hour", at(13), at(17), watermarks) is None
+    assert plan_rollup("1 hour", at(9), at(17), {}) is None
+
+def test_internal_time_conversion():
+    assert _from_internal(0) == EPOCH
+    assert _from_internal(1_000_000) == EPOCH + timedelta(seconds=1)
+    assert _from_internal(None) is None
+    assert _from_internal(-2**63) < EPOCH
+
+def test_rollup_query_shape():
+    """Test the combined query reads the chosen rollup plus raw edges"""
+    plan = plan_rollup("6 hours", at(9, 30), at(23), ALL_CURRENT)
+    sql = rollup_query(plan, "avg", "6 hours")
+    assert "FROM time_series_1h" in sql
+    assert "SUM(sum) / NULLIF(SUM(value_count), 0)::double precision" in sql
+    assert "metric_id = %(metric)s" in sql
+
+    batch_sql = rollup_query(plan, "count", "6 hours", batch=True)
+    assert "metric_id = ANY(%(metric)s)" in batch_sql
+    assert "GROUP BY metric_id, bucket" in batch_sql
+
+    params = rollup_params(plan, 7, at(9, 30), at(23))
+    assert params["rollup_start"] == at(10) and params["rollup_end"] == at(23)
@@ -0,0 +1,61 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from utils.segments import Segment, plan_segments, missing_runs, slice_table, concat_tables
+from utils.partials import partials_from_rows
+
+DAY = datetime(2024, 1, 15, tzinfo=timezone.utc)
+SETTLED = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+def hourly_table(hours):
+    return partials_from_rows([(DAY + timedelta(hours=hour), 1.0, 1, 1, 1.0, 1.0) for hour in hours])
+
+def test_segments_are_bucket_aligned_with_edges():
+    """Test that an unaligned window gets whole aligned segments plus a head and live edge"""
+    start = DAY + timedelta(hours=1, minutes=30)
+    end = DAY + timedelta(hours=23, minutes=15)
+    plan = plan_segments('1 hour', start, end, settled_before=DAY + timedelta(hours=18), buckets=6)
+    assert plan.segments == [
+        Segment(DAY, DAY + timedelta(hours=6)),
+        Segment(DAY + timedelta(hours=6), DAY + timedelta(hours=12)),
+        Segment(DAY + timedelta(hours=12), DAY + timedelta(hours=18))
+    ]
+    assert plan.inner_start == DAY + timedelta(hours=2)
+    assert plan.covered_end == DAY + timedelta(hours=18)
+    assert plan.head == (start, DAY + timedelta(hours=2))
+    assert plan.live == (DAY + timedelta(hours=18), end + timedelta(microseconds=1))
+
+def test_sliding_window_reuses_segments():
+    """Test that moving the window keeps the same segment boundaries"""
+    first = plan_segments('5 minutes', DAY, DAY + timedelta(hours=6), SETTLED, buckets=12)
+    later = plan_segments('5 minutes', DAY + timedelta(seconds=40), DAY + timedelta(hours=6, seconds=40), SETTLED, buckets=12)
+    assert later.segments == first.segments
+    assert first.head is None and later.head is not None
+
+def test_no_plan_without_settled_segments():
+    assert plan_segments('1 hour', DAY, DAY + timedelta(hours=5), settled_before=DAY, buckets=6) is None
+    assert plan_segments('1 month', DAY, DAY + timedelta(days=90), SETTLED) is None
+    assert plan_segments('1 hour', DAY, DAY + timedelta(minutes=30), SETTLED) is None
+
+def test_no_plan_beyond_max_segments():
+    """Test that long windows at fine intervals fall back to one query"""
+    assert plan_segments('1 second', DAY, DAY + timedelta(days=7), SETTLED, buckets=12) is None
+    assert plan_segments('1 hour', DAY, DAY + timedelta(hours=24), SETTLED, buckets=6, max_segments=4) is not None
+    assert plan_segments('1 hour', DAY, DAY + timedelta(hours=25), SETTLED, buckets=6, max_segments=4) is None
+
+def test_missing_runs():
+    segments = [Segment(DAY + timedelta(hours=i), DAY + timedelta(hours=i + 1)) for i in range(5)]
+    cached = [None, None, hourly_table([2]), None, None]
+    assert missing_runs(segments, cached) == [segments[:2], segments[3:]]
+    assert missing_runs(segments, [hourly_table([i]) for i in range(5)]) == []
+
+def test_slice_and_concat():
+    table = hourly_table(range(6))
+    head = slice_table(table, DAY, DAY + timedelta(hours=2))
+    tail = slice_table(table, DAY + timedelta(hours=2), DAY + timedelta(days=1))
+    assert head[0] == [DAY, DAY + timedelta(hours=1)]
+    assert concat_tables([head, tail]) == table
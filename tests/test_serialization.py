@@ -0,0 +1,152 @@
+import sys
+import os
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+import numpy as np
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+from pydantic import TypeAdapter
+from models import QueryResponse
+import utils.serialization as serialization
+from utils.codec import decode_columns, column_values, micros_to_datetimes
+from utils.serialization import (
+    points_from_rows, dumps_points, dumps_point_lines, PointsResponse, ColumnsResponse,
+    series_from_rows, points_from_series, columns_media_type, wide_rows, dumps_wide_rows,
+    COLUMNS_JSON_MEDIA_TYPE, COLUMNS_BINARY_MEDIA_TYPE
+)
+
+START = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+
+def raw_rows(count):
+    return [(START + timedelta(seconds=i, microseconds=i % 3), 20.0 + i % 50, None) for i in range(count)]
+
+def buffered_json(points):
+    """What FastAPI produces for response_model=List[QueryResponse]"""
+    adapter = TypeAdapter(List[QueryResponse])
+    return json.loads(adapter.dump_json(adapter.validate_python(points)))
+
+def test_points_from_rows():
+    """Test raw, text and aggregated rows map to QueryResponse-shaped dicts"""
+    assert points_from_rows([(START, 23.5, None), (START, None, "machine_start"), (START, 3)]) == [
+        {"time": START, "value": 23.5},
+        {"time": START, "value": "machine_start"},
+        {"time": START, "value": 3.0}
+    ]
+
+def test_output_matches_pydantic(monkeypatch):
+    """Test both encoders produce exactly the JSON the response model would"""
+    points = points_from_rows(raw_rows(10) + [(START, None, "on"), (START, None, None)])
+    expected = buffered_json(points)
+
+    assert json.loads(dumps_points(points)) == expected
+    assert [json.loads(line) for line in dumps_point_lines(points).splitlines()] == expected
+    assert json.loads(PointsResponse(points).body) == expected
+
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(dumps_points(points)) == expected
+    assert [json.loads(line) for line in dumps_point_lines(points).splitlines()] == expected
+
+def test_series_from_rows():
+    """Test rows split into columns that rebuild the same points"""
+    rows = [(START, 23.5, None), (START, None, "machine_start"), (START, 3)]
+    series = series_from_rows(rows)
+    assert series == ([START, START, START], [23.5, "machine_start", 3.0])
+    assert points_from_series(series) == points_from_rows(rows)
+
+def test_wide_rows(monkeypatch):
+    """Test per-metric results regrouped into time-ordered rows by timestamp and tags"""
+    later = START + timedelta(minutes=1)
+    rows = wide_rows({
+        "temperature{device=a1}": ([START, later], [23.5, 24.0]),
+        "status{device=a1}": ([START], ["ok"]),
+        "temperature": ([START], [None])
+    })
+    expected = [
+        {"time": "2024-01-15T10:00:00Z", "tags": {"device": "a1"}, "fields": {"temperature": 23.5, "status": "ok"}},
+        {"time": "2024-01-15T10:00:00Z", "tags": {}, "fields": {"temperature": None}},
+        {"time": "2024-01-15T10:01:00Z", "tags": {"device": "a1"}, "fields": {"temperature": 24.0}}
+    ]
+    assert json.loads(dumps_wide_rows(rows)) == expected
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(dumps_wide_rows(rows)) == expected
+
+    escaped = wide_rows({"temperature{loc=a\\,b}": ([START], [1.0])})
+    assert json.loads(dumps_wide_rows(escaped))[0]["tags"] == {"loc": "a,b"}
+
+def test_columns_media_type():
+    assert columns_media_type(COLUMNS_JSON_MEDIA_TYPE) == COLUMNS_JSON_MEDIA_TYPE
+    assert columns_media_type(f"application/json;q=0.5, {COLUMNS_BINARY_MEDIA_TYPE}") == COLUMNS_BINARY_MEDIA_TYPE
+    assert columns_media_type("application/json") is None
+    assert columns_media_type(None) is None
+
+def test_columns_responses(monkeypatch):
+    """Test the JSON and binary columnar bodies carry the same times and values"""
+    series = series_from_rows(raw_rows(5) + [(START, None, None)])
+    times, values = series
+
+    body = json.loads(ColumnsResponse(series).body)
+    assert micros_to_datetimes(np.array(body["times"])) == times
+    assert body["values"] == values
+
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(ColumnsResponse(series).body) == body
+
+    response = ColumnsResponse(series, media_type=COLUMNS_BINARY_MEDIA_TYPE)
+    assert response.media_type == COLUMNS_BINARY_MEDIA_TYPE
+    micros, columns = decode_columns(response.body)
+    assert micros.tolist() == body["times"]
+    assert column_values(columns["value"]) == values
+
+def rows_per_second(func, rows, repeats=3):
+    best = min(timed(func, rows) for _ in range(repeats))
+    return len(rows) / best
+
+def timed(func, rows):
+    start = time.perf_counter()
+    func(rows)
+    return time.perf_counter() - start
+
+def model_path(rows):
+    """The previous hot path: dict per row, QueryResponse per row, then response-model validation"""
+    response_data = []
+    for row in rows:
+        row_dict = {"time": row[0], "value": row[1], "text_value": row[2]}
+        value = row_dict['text_value'] if row_dict['text_value'] is not None else row_dict['value']
+        response_data.append(QueryResponse(time=row_dict['time'], value=value))
+    adapter = TypeAdapter(List[QueryResponse])
+    return json.dumps(adapter.dump_python(adapter.validate_python(response_data), mode="json")).encode()
+
+def fast_path(rows):
+    return PointsResponse(points_from_rows(rows)).body
+
+def test_serialization_microbenchmark():
+    """Rows/second before and after skipping per-row models (run with -s to see the numbers)"""
+    rows = raw_rows(50_000)
+    before = rows_per_second(model_path, rows)
+    after = rows_per_second(fast_path, rows)
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"\nQueryResponse models: {before:,.0f} rows/s; tuple rows + {encoder}: {after:,.0f} rows/s ({after / before:.1f}x)")
+    assert after > before
+
+def test_columnar_payload_benchmark():
+    """Payload size and client parse time of points vs columns (run with -s to see the numbers)"""
+    series = series_from_rows(raw_rows(50_000))
+    payloads = {
+        "points json": PointsResponse(points_from_series(series)).body,
+        "columns json": ColumnsResponse(series).body,
+        "columns binary": ColumnsResponse(series, media_type=COLUMNS_BINARY_MEDIA_TYPE).body
+    }
+    parsers = {
+        "points json": lambda body: [point["value"] for point in json.loads(body)],
+        "columns json": lambda body: json.loads(body)["values"],
+        "columns binary": lambda body: decode_columns(body)[1]["value"][0]
+    }
+    print()
+    for name, body in payloads.items():
+        parse = min(timed(parsers[name], body) for _ in range(3))
+        print(f"{name:>15}: {len(body):>10,} bytes, client parse {parse * 1000:7.2f} ms")
+    assert len(payloads["columns binary"]) * 10 < len(payloads["points json"])
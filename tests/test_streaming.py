@@ -0,0 +1,122 @@
+import sys
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, app_dir)
+
+import psycopg2
+import pytest
+from utils.streaming import RowStream, StreamLimitError, stream_points, wants_ndjson
+
+START = datetime(2024, 1, 15, 10, 0, tzinfo=timezone.utc)
+
+class FakeCursor:
+    def __init__(self, rows, fail_after=None):
+        self.rows = rows
+        self.fail_after = fail_after
+        self.fetches = 0
+        self.closed = False
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchmany(self, size):
+        if self.fail_after is not None and self.fetches >= self.fail_after:
+            raise psycopg2.OperationalError("connection lost")
+        self.fetches += 1
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        self.closed = True
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, name=None, cursor_factory=None):
+        self.cursor_name = name
+        return self._cursor
+
+class FakePool:
+    def __init__(self, cursor):
+        self.conn = FakeConnection(cursor)
+        self.returned = 0
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn):
+        self.returned += 1
+
+def collect(stream, ndjson):
+    async def main():
+        return [chunk async for chunk in stream_points(stream, ndjson)]
+    return asyncio.run(main())
+
+def raw_rows(count):
+    return [(START.replace(second=i % 60, minute=i // 60), 20.0 + i, None) for i in range(count)]
+
+def test_wants_ndjson():
+    assert wants_ndjson("application/x-ndjson")
+    assert wants_ndjson("application/json;q=0.5, application/x-ndjson")
+    assert not wants_ndjson("application/json")
+    assert not wants_ndjson(None)
+
+def test_ndjson_stream_is_chunked_per_fetch():
+    """Test one chunk per server-side fetch and that the connection is returned"""
+    cursor = FakeCursor(raw_rows(5))
+    pool = FakePool(cursor)
+    stream = RowStream("SELECT", (), itersize=2, pool=pool)
+
+    chunks = collect(stream, ndjson=True)
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line)["value"] for line in lines] == [20.0, 21.0, 22.0, 23.0, 24.0]
+    assert pool.conn.cursor_name.startswith("stream_")
+    assert cursor.closed
+    assert pool.returned == 1
+
+def test_json_array_stream():
+    """Test that the chunked array parses as the same list the buffered route returns"""
+    stream = RowStream("SELECT", (), itersize=2, pool=FakePool(FakeCursor(raw_rows(3))))
+    data = json.loads(b"".join(collect(stream, ndjson=False)))
+    assert [point["value"] for point in data] == [20.0, 21.0, 22.0]
+
+    empty = RowStream("SELECT", (), itersize=2, pool=FakePool(FakeCursor([])))
+    assert json.loads(b"".join(collect(empty, ndjson=False))) == []
+
+def test_stream_error_ends_body():
+    """Test that a failed fetch ends NDJSON with an error line and still releases the connection"""
+    pool = FakePool(FakeCursor(raw_rows(5), fail_after=1))
+    stream = RowStream("SELECT", (), itersize=2, pool=pool)
+    lines = b"".join(collect(stream, ndjson=True)).decode().splitlines()
+    assert len(lines) == 3
+    assert "error" in json.loads(lines[-1])
+    assert pool.returned == 1
+
+    pool = FakePool(FakeCursor(raw_rows(5), fail_after=1))
+    body = b"".join(collect(RowStream("SELECT", (), itersize=2, pool=pool), ndjson=False))
+    assert not body.endswith(b"]")
+    assert pool.returned == 1
+
+def test_open_streams_are_bounded():
+    """Test that streams beyond the slot budget are refused and closing frees a slot"""
+    slots = threading.BoundedSemaphore(2)
+    pool = FakePool(FakeCursor(raw_rows(5)))
+    first = RowStream("SELECT", (), pool=pool, slots=slots)
+    second = RowStream("SELECT", (), pool=pool, slots=slots)
+    with pytest.raises(StreamLimitError):
+        RowStream("SELECT", (), pool=pool, slots=slots)
+
+    first.close()
+    first.close()
+    third = RowStream("SELECT", (), pool=pool, slots=slots)
+    second.close()
+    third.close()
+    assert pool.returned == 3
+    assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
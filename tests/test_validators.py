@@ -1,6 +1,8 @@
 import pytest
-from datetime import datetime, timedelta
-from app.utils.validators import validate_timestamp, validate_metric_name, validate_data_points, validate_query_time_range
+from datetime import datetime, timedelta, timezone
+from app.utils.validators import (
+    validate_timestamp, validate_metric_name, validate_data_points, validate_query_time_range, validate_batch
+)
 from app.models import DataPoint
 from fastapi import HTTPException
 
@@ -55,4 +57,66 @@ def test_validate_query_time_range():
     with pytest.raises(HTTPException) as exc_info:
         validate_query_time_range(very_old, end)
     assert exc_info.value.status_code == 400
-    assert "exceed" in exc_info.value.detail.lower()
\ No newline at end of file
+    assert "exceed" in exc_info.value.detail.lower()
+
+
+NOW = datetime(2024, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+def no_stored_types(names):
+    return {}
+
+def test_validate_timestamp_timezone_aware():
+    """Test that aware timestamps are compared against the current UTC time"""
+    validate_timestamp(datetime.now(timezone.utc) - timedelta(minutes=1))
+    with pytest.raises(HTTPException):
+        validate_timestamp(datetime.now(timezone(timedelta(hours=-5))) + timedelta(hours=1))
+
+def test_validate_batch_accepts_valid_points():
+    """Test that a valid batch, including naive UTC times, has no errors"""
+    points = [
+        (NOW - timedelta(minutes=1), "temperature", 23.5),
+        (NOW.replace(tzinfo=None), "temperature", 24),
+        (NOW + timedelta(seconds=30), "status", "ok")
+    ]
+    assert validate_batch(points, value_types=no_stored_types, now=NOW) == {}
+    assert validate_batch([], value_types=no_stored_types, now=NOW) == {}
+
+def test_validate_batch_timestamp_bounds():
+    """Test that points too far in the future or before the epoch are reported by index"""
+    points = [
+        (NOW, "temperature", 1.0),
+        (NOW + timedelta(hours=1), "temperature", 2.0),
+        (datetime(1960, 1, 1, tzinfo=timezone.utc), "temperature", 3.0)
+    ]
+    errors = validate_batch(points, value_types=no_stored_types, now=NOW)
+    assert list(errors) == [1, 2]
+    assert "future" in errors[1]
+    assert "before" in errors[2]
+
+def test_validate_batch_metric_names():
+    """Test that an invalid name is reported for every point using it"""
+    points = [(NOW, "x" * 101, 1.0), (NOW, "ok", 1.0), (NOW, "  ", 1.0), (NOW, "x" * 101, 2.0)]
+    errors = validate_batch(points, value_types=no_stored_types, now=NOW)
+    assert list(errors) == [0, 2, 3]
+    assert "too long" in errors[0] and "empty" in errors[2]
+
+def test_validate_batch_non_finite_values():
+    """Test that NaN and infinity are rejected"""
+    points = [(NOW, "a", float("nan")), (NOW, "a", 1.0), (NOW, "a", float("inf"))]
+    assert list(validate_batch(points, value_types=no_stored_types, now=NOW)) == [0, 2]
+
+def test_validate_batch_type_consistency():
+    """Test that a metric keeps the type of its first point in the batch"""
+    points = [(NOW, "a", 1.0), (NOW, "a", "text"), (NOW, "b", "on"), (NOW, "b", 0.0), (NOW, "a", 2.0)]
+    errors = validate_batch(points, value_types=no_stored_types, now=NOW)
+    assert errors == {1: "Metric a requires number values", 3: "Metric b requires string values"}
+
+def test_validate_batch_type_from_stored_metric():
+    """Test that the stored value type takes precedence over the batch"""
+    looked_up = []
+    def stored_types(names):
+        looked_up.extend(names)
+        return {"event": "string"}
+    points = [(NOW, "event", 1.0), (NOW, "event", "start"), (NOW, "", 1.0)]
+    assert list(validate_batch(points, value_types=stored_types, now=NOW)) == [0, 2]
+    assert looked_up == ["event"]